@@ -71,6 +71,13 @@ class ColumnInfo:
         else:
             return self.real_data_groupfun
 
+    def sql_group_line(self, arg, plan=None):
+        """ sql line of the group function applied to arg.
+            plan -- bsqlproc.GroupingPlan of the compiled query or None
+        """
+        return bsqlproc.GroupingPlan.group_line(
+            self.sql_group_fun(), arg, plan)
+
     def set_sql_delegate(self, d):
         self.sql_delegate = d
         d.column = self
@@ -105,6 +112,10 @@ class ColumnInfo:
         except:
             return None
 
+    def repr_sql_line(self, grouping=False):
+        """ sql line of represented values or None """
+        return self.repr_delegate.repr_sql_line(self.sql_line(grouping))
+
     def col_type(self):
         '-> INT, TEXT, ENUM (dict), ... '
         return self.repr_delegate.col_type()
@@ -120,12 +131,16 @@ class ColumnInfo:
         return self.repr_delegate.same_representation(a.repr_delegate)
 
     # ------------- delegated to sql_delegate
-    def sql_line(self, grouping=False):
-        return self.sql_delegate.sql_line(grouping)
+    def sql_line(self, grouping=False, plan=None):
+        """ plan -- bsqlproc.GroupingPlan used for grouped lines """
+        return self.sql_delegate.sql_line(grouping, plan)
 
     def is_original(self):
         return self.sql_delegate.is_original()
 
+    def is_materialized(self):
+        return self.sql_delegate.is_materialized()
+
     # ------------- static and class methods
     @staticmethod
     def are_same(collist):
@@ -146,6 +161,12 @@ class _BasicRepr:
     def from_repr(self, x):
         raise NotImplementedError
 
+    def repr_sql_line(self, line):
+        """ sql expression which represents values of sql line.
+            None if representation could not be done in sql.
+        """
+        return None
+
     def col_type(self):
         raise NotImplementedError
 
@@ -239,6 +260,10 @@ class EnumRepr(_BasicRepr):
     def from_repr(self, x):
         return self.dict.value_to_key(x)
 
+    def repr_sql_line(self, line):
+        return '(SELECT "_value" FROM "{}" WHERE "_key" = {})'.format(
+            bsqlproc.connection.dictionary_table(self.dict), line)
+
     def col_type(self):
         return "ENUM ({})".format(self.dict.name)
 
@@ -270,6 +295,9 @@ class _BasicSqlDelegate:
         self.column = bu
         return ret
 
+    def is_materialized(self):
+        return False
+
     @staticmethod
     def from_xml(root):
         if root.find('SQL_ORIG') is not None:
@@ -282,12 +310,12 @@ class _BasicSqlDelegate:
 
 
 class OriginalSqlDelegate(_BasicSqlDelegate):
-    def sql_line(self, grouping=False):
+    def sql_line(self, grouping=False, plan=None):
         if not grouping:
             return '"{}"'.format(self.column.name)
         else:
-            return '{}("{}")'.format(
-                self.column.sql_group_fun(), self.column.name)
+            return self.column.sql_group_line(
+                '"{}"'.format(self.column.name), plan)
 
     def is_original(self):
         return True
@@ -311,21 +339,63 @@ class FuncSqlDelegate(_BasicSqlDelegate):
         self.function_type = None
         # serializable arguments for calling function_type
         self.kwargs = {}
+        # whether dictionary arguments are passed as their values
+        self.repr_args = False
+        # whether function values are stored in a table column
+        self.materialized = False
+        # dependencies state for which stored values were computed
+        self.materialized_state = None
 
     def is_original(self):
         return False
 
-    def sql_line(self, grouping=False):
+    def is_materialized(self):
+        return self.materialized
+
+    def set_materialized(self, val):
+        """ only functions used before grouping could be stored """
+        self.materialized = bool(val) and bool(self.use_before_grouping)
+        self.materialized_state = None
+
+    def materialized_name(self):
+        return '_mat {}'.format(self.column.id)
+
+    def vectorized_function(self):
+        """ -> numpy implementation of the function or None
+               if it is not defined or arguments are not numeric
+        """
+        if not self.use_before_grouping:
+            return None
+        if any(x.dt_type not in ['INT', 'REAL', 'BOOL'] for x in self.deps):
+            return None
+        return bsqlproc.vectorized_row_functions.get(self._sql_fun, None)
+
+    def _arg_line(self, x, grouping):
+        if self.repr_args and not grouping:
+            ret = x.repr_sql_line(False)
+            if ret is not None:
+                return ret
+        return x.sql_line(grouping)
+
+    def function_line(self):
+        """ function call over ungrouped data """
+        return "{}({})".format(self._sql_fun, ", ".join(
+            [self._arg_line(x, False) for x in self.deps]))
+
+    def sql_line(self, grouping=False, plan=None):
+        if self.materialized:
+            if not grouping:
+                return '"{}"'.format(self.materialized_name())
+            else:
+                return self.column.sql_group_line(
+                    '"{}"'.format(self.materialized_name()), plan)
         if grouping and self.use_before_grouping:
-            return "{}({}({}))".format(
-                self.column.sql_group_fun(), self._sql_fun,
-                ", ".join([x.sql_line(False) for x in self.deps]))
+            return self.column.sql_group_line(self.function_line(), plan)
         elif grouping and not self.use_before_grouping:
             return "{}({})".format(self._sql_fun, ", ".join(
-                [x.sql_line(True) for x in self.deps]))
+                [x.sql_line(True, plan) for x in self.deps]))
         else:
-            return "{}({})".format(self._sql_fun, ", ".join(
-                [x.sql_line(False) for x in self.deps]))
+            return self.function_line()
 
     def to_xml(self, root):
         cur = ET.SubElement(root, "SQL_FUNC")
@@ -336,6 +406,8 @@ class FuncSqlDelegate(_BasicSqlDelegate):
         ET.SubElement(cur, "ARGUMENTS").text =\
             ' '.join([str(x.id) for x in self.deps])
         ET.SubElement(cur, "DESCRIPTION").text = escape(str(self.kwargs))
+        if self.materialized:
+            ET.SubElement(cur, "MATERIALIZED").text = '1'
 
     @staticmethod
     def from_xml(root):
@@ -349,6 +421,9 @@ class FuncSqlDelegate(_BasicSqlDelegate):
         ret.function_type = unescape(nd.find('FUNCTION').text)
         ret.deps = list(map(int, nd.find('ARGUMENTS').text.split()))
         ret.kwargs = literal_eval(unescape(nd.find('DESCRIPTION').text))
+        fnd = nd.find('MATERIALIZED')
+        if fnd is not None and fnd.text:
+            ret.set_materialized(int(fnd.text))
         return ret
 
     def fill_deps(self, tab):
@@ -360,6 +435,7 @@ class FuncSqlDelegate(_BasicSqlDelegate):
                 self.function_type, self.kwargs)
         self.deps = sql.deps
         self._sql_fun = sql._sql_fun
+        self.repr_args = sql.repr_args
 
     def description(self):
         ret = ['Row function: {}'.format(self.function_type)]
@@ -368,6 +444,8 @@ class FuncSqlDelegate(_BasicSqlDelegate):
             ret.append('used before grouping')
         else:
             ret.append('used after grouping')
+        if self.materialized:
+            ret.append('values are stored in table')
         ret.append('params: {}'.format(str(self.kwargs)))
         ret.append("Group with {}".format(self.column.real_data_groupfun))
         return '\n'.join(ret)
@@ -383,16 +461,23 @@ class AggrFuncSqlDelegate(_BasicSqlDelegate):
         self.function_type = None
         # serializable arguments for calling function_type
         self.kwargs = {}
+        # for multi-output aggregates: index of the output value
+        # in the packed aggregate result
+        self.multi_output_index = None
 
     def is_original(self):
         return False
 
-    def sql_line(self, grouping=False):
+    def sql_line(self, grouping=False, plan=None):
         if not grouping:
             return 'NULL'
-        else:
-            return "{}({})".format(self._sql_fun, ", ".join(
-                [x.sql_line(False) for x in self.deps]))
+        args = [x.sql_line(False) for x in self.deps]
+        if self.multi_output_index is None:
+            return "{}({})".format(self._sql_fun, ", ".join(args))
+        # all outputs use the same aggregate call
+        # which is computed once by sqlite
+        return "multi_output({}({}), {})".format(
+            self._sql_fun, ", ".join(args), self.multi_output_index)
 
     def to_xml(self, root):
         cur = ET.SubElement(root, "SQL_AGGR_FUNC")
@@ -422,6 +507,7 @@ class AggrFuncSqlDelegate(_BasicSqlDelegate):
                 deps, None, self.function_type, self.kwargs)
         self.deps = sql.deps
         self._sql_fun = sql._sql_fun
+        self.multi_output_index = sql.multi_output_index
 
     def description(self):
         ret = ['Aggregate function: {}'.format(self.function_type)]
@@ -520,10 +606,14 @@ def get_sql_func(name, columns, **kwargs):
         delimiter = kwargs['delimiter']
 
         def func(*args):
+            # dictionary values come already represented
+            # by FuncSqlDelegate.repr_args
             try:
                 ret = []
                 for c, x in zip(columns, args):
-                    if x is not None:
+                    if isinstance(x, str):
+                        ret.append(x)
+                    elif x is not None:
                         ret.append(str(c.repr(x)))
                     else:
                         ret.append('##')
@@ -541,18 +631,8 @@ def get_sql_func(name, columns, **kwargs):
                 basic.ignore_exception(e, 'explicit column error')
         return func
     elif name.startswith('regression'):
-        tp = kwargs['tp']
-        ngroup = kwargs['group']
-        if name == 'regression a':
-            return bsqlproc.build_regression_grouping(tp, ngroup)['a']
-        if name == 'regression b':
-            return bsqlproc.build_regression_grouping(tp, ngroup)['b']
-        if name == 'regression stderr':
-            return bsqlproc.build_regression_grouping(tp, ngroup)['stderr']
-        if name == 'regression slopeerr':
-            return bsqlproc.build_regression_grouping(tp, ngroup)['slopeerr']
-        if name == 'regression corrcoef':
-            return bsqlproc.build_regression_grouping(tp, ngroup)['corrcoef']
+        assert kwargs['tp'] in ['linear', 'log', 'power']
+        return 'regression_' + kwargs['tp']
     elif name == 'average':
         return 'row_average'
     elif name == 'min':
@@ -581,6 +661,8 @@ def build_function_sql_delegate(deps, before_grouping, func, func_type, kw):
     ret.function_type = func_type
     ret.use_before_grouping = before_grouping
     ret.kwargs = kw
+    # dictionary lookups are done by sql joins
+    ret.repr_args = func_type == 'collapsed_categories'
 
     return ret
 
@@ -596,6 +678,8 @@ def build_aggr_function_sql_delegate(deps, func, func_type, kw):
     ret.function_type = func_type
     ret.use_before_grouping = False
     ret.kwargs = kw
+    if func_type.startswith('regression '):
+        ret.multi_output_index = regression_outputs.index(func_type[11:])
     return ret
 
 
@@ -667,6 +751,10 @@ def aggregate_integral_function(name, argx, argy):
     return ret
 
 
+# output values of regression_tp aggregates
+regression_outputs = ['a', 'b', 'stderr', 'slopeerr', 'corrcoef']
+
+
 def aggregate_regression(argx, argy, tp, out, out_names):
     kwargs = {'group': "{}_{}_{}".format(argx.id, argy.id, tp), 'tp': tp}
     ret = []
@@ -1,4 +1,3 @@
-import itertools
 from bdata import bcol
 from prog import basic
 from prog import bsqlproc
@@ -212,11 +211,20 @@ class ColumnConverter:
         a.redo()
         self.acts.append(a)
 
+    @staticmethod
+    def _key_by_value_line(sline, dtab):
+        return '(SELECT "_key" FROM "{}" WHERE "_value" = '\
+               'CAST({} AS TEXT))'.format(dtab, sline)
+
     def internal_repr_change_line(self):
         assert self.col.is_original()
         sline = self.col.sql_line(False)
         if not self.has_repr_changes():
             return sline
+        # dictionaries are used through their indexed lookup tables
+        dold, dnew = [self.proj.sql.dictionary_table(r.dict)
+                      if isinstance(r, bcol.EnumRepr) else None
+                      for r in [self.col.repr_delegate, self.new_repr]]
         # ================ INT
         if self.col.dt_type == 'INT':
             # to real
@@ -228,16 +236,10 @@ class ColumnConverter:
             # to enum, bool
             elif isinstance(self.new_repr, bcol.EnumRepr):
                 if self.conversation_options.endswith('to keys'):
-                    ivals = ', '.join(map(str, self.new_repr.dict.keys()))
-                    return 'CASE WHEN {0} IN ({1}) THEN {0} '\
-                           'ELSE NULL END'.format(sline, ivals)
+                    return 'CASE WHEN {0} IN (SELECT "_key" FROM "{1}") '\
+                           'THEN {0} ELSE NULL END'.format(sline, dnew)
                 elif self.conversation_options.endswith('to values'):
-                    qr = 'CASE '
-                    for k, v in self.new_repr.dict.kvalues.items():
-                        a = "WHEN CAST({} AS TEXT)='{}' THEN {} ".format(
-                            sline, v, k)
-                        qr = qr + a
-                    return qr + 'ELSE NULL END'
+                    return self._key_by_value_line(sline, dnew)
         # ================ REAL
         elif self.col.dt_type == 'REAL':
             # to int
@@ -249,17 +251,12 @@ class ColumnConverter:
             # to enum, bool
             elif isinstance(self.new_repr, bcol.EnumRepr):
                 if self.conversation_options.endswith('to keys'):
-                    ivals = ', '.join(map(str, self.new_repr.dict.keys()))
-                    return 'CASE WHEN cast_real_to_int({0}) IN ({1}) '\
-                           'THEN cast_real_to_int({0}) '\
-                           'ELSE NULL END'.format(sline, ivals)
+                    return 'CASE WHEN cast_real_to_int({0}) IN '\
+                           '(SELECT "_key" FROM "{1}") '\
+                           'THEN cast_real_to_int({0}) ELSE NULL END'.format(
+                               sline, dnew)
                 elif self.conversation_options.endswith('to values'):
-                    qr = 'CASE '
-                    for k, v in self.new_repr.dict.kvalues.items():
-                        a = "WHEN CAST({} AS TEXT)='{}' THEN {} ".format(
-                            sline, v, k)
-                        qr = qr + a
-                    return qr + 'ELSE NULL END'
+                    return self._key_by_value_line(sline, dnew)
         # ================ TEXT
         elif self.col.dt_type == 'TEXT':
             # to int
@@ -271,17 +268,12 @@ class ColumnConverter:
             # to enum, bool
             elif isinstance(self.new_repr, bcol.EnumRepr):
                 if self.conversation_options.endswith('to keys'):
-                    ivals = ', '.join(map(str, self.new_repr.dict.keys()))
-                    return 'CASE WHEN cast_txt_to_int({0}) IN ({1}) '\
-                           'THEN cast_txt_to_int({0}) '\
-                           'ELSE NULL END'.format(sline, ivals)
+                    return 'CASE WHEN cast_txt_to_int({0}) IN '\
+                           '(SELECT "_key" FROM "{1}") '\
+                           'THEN cast_txt_to_int({0}) ELSE NULL END'.format(
+                               sline, dnew)
                 elif self.conversation_options.endswith('to values'):
-                    qr = 'CASE '
-                    for k, v in self.new_repr.dict.kvalues.items():
-                        a = "WHEN CAST({} AS TEXT)='{}' THEN {} ".format(
-                            sline, v, k)
-                        qr = qr + a
-                    return qr + 'ELSE NULL END'
+                    return self._key_by_value_line(sline, dnew)
         # ============= [ENUM, BOOL] as KEYS
         elif self.col.dt_type in ['ENUM', 'BOOL'] and\
                 self.conversation_options.startswith('keys'):
@@ -297,52 +289,164 @@ class ColumnConverter:
             # to enum, bool
             elif isinstance(self.new_repr, bcol.EnumRepr):
                 assert self.conversation_options == 'keys to keys'
-                ivals = ', '.join(map(str, self.new_repr.dict.keys()))
-                return 'CASE WHEN {0} IN ({1}) THEN {0} '\
-                       'ELSE NULL END'.format(sline, ivals)
+                return 'CASE WHEN {0} IN (SELECT "_key" FROM "{1}") '\
+                       'THEN {0} ELSE NULL END'.format(sline, dnew)
         # ============= [ENUM, BOOL] as VALUES
         elif self.col.dt_type in ['ENUM', 'BOOL'] and\
                 self.conversation_options.startswith('values'):
             # to int
             if isinstance(self.new_repr, bcol.IntRepr):
-                qr = ''
-                for k, v in self.col.repr_delegate.dict.kvalues.items():
-                    v = bsqlproc.cast_txt_to_int(v)
-                    if v is not None:
-                        a = "WHEN {}={} THEN {} ".format(sline, k, v)
-                        qr = qr + a
-                return 'CASE ' + qr + 'ELSE NULL END' if qr else 'NULL'
+                return '(SELECT cast_txt_to_int("_value") FROM "{}" '\
+                       'WHERE "_key" = {})'.format(dold, sline)
             # to real
             elif isinstance(self.new_repr, bcol.RealRepr):
-                qr = ''
-                for k, v in self.col.repr_delegate.dict.kvalues.items():
-                    v = bsqlproc.cast_txt_to_real(v)
-                    if v is not None:
-                        a = "WHEN {}={} THEN {} ".format(sline, k, v)
-                        qr = qr + a
-                return 'CASE ' + qr + 'ELSE NULL END' if qr else 'NULL'
+                return '(SELECT cast_txt_to_real("_value") FROM "{}" '\
+                       'WHERE "_key" = {})'.format(dold, sline)
             # to text
             elif isinstance(self.new_repr, bcol.TextRepr):
-                qr = ''
-                for k, v in self.col.repr_delegate.dict.kvalues.items():
-                    a = "WHEN {}={} THEN '{}' ".format(sline, k, v)
-                    qr = qr + a
-                return 'CASE ' + qr + 'ELSE NULL END' if qr else 'NULL'
+                return '(SELECT "_value" FROM "{}" WHERE "_key" = {})'.format(
+                    dold, sline)
             # to enum, bool
             elif isinstance(self.new_repr, bcol.EnumRepr):
                 assert self.conversation_options == 'values to values'
-                d1, d2 = self.col.repr_delegate.dict, self.new_repr.dict
-                pairs = []
-                for (k1, k2) in itertools.product(d1.keys(), d2.keys()):
-                    if d1.key_to_value(k1) == d2.key_to_value(k2):
-                        pairs.append((k1, k2))
-                qr = ''
-                for k1, k2 in pairs:
-                    qr += "WHEN {}={} THEN {} ".format(sline, k1, k2)
-                return 'CASE ' + qr + 'ELSE NULL END' if qr else 'NULL'
+                return '(SELECT d2."_key" FROM "{}" AS d1 JOIN "{}" AS d2 '\
+                       'ON d1."_value" = d2."_value" '\
+                       'WHERE d1."_key" = {})'.format(dold, dnew, sline)
         assert False, "{} {}".format(self.col.dt_type, self.new_repr)
 
 
+class _TableRebuildAct:
+    """ Changes original columns of the table by copying all its data
+        into a new table. Old table is kept for undo.
+    """
+    def __init__(self, tab, cnbefore, cnafter):
+        self.tab = tab
+        self.proj = tab.proj
+        self.tmpname = '_alter{} {}'.format(basic.uniint(),
+                                            self.tab.ttab_name)
+        qr = 'ALTER TABLE "{}" RENAME TO "{}"'.format(
+                self.tab.ttab_name, self.tmpname)
+        self.tab.query(qr)
+        size0 = self.proj.sql.work_db_size()
+        self.tab._create_ttab()
+        qr = 'INSERT INTO "{}" ({}) SELECT {} FROM "{}"'.format(
+            self.tab.ttab_name,
+            ', '.join(cnafter),
+            ', '.join(cnbefore),
+            self.tmpname)
+        self.tab.query(qr)
+        # backup copy is about the size of the new table
+        self.size = self.proj.sql.work_db_size() - size0
+        self.tab.data_changed()
+        # database which keeps backup copy
+        self.db = 'main'
+        self._spill()
+        self.proj.sql.adjust_work_db()
+
+    def _spill(self):
+        if self.proj.sql.need_spill(self.size):
+            self.db = self.proj.sql.spill_db()
+            self.proj.sql.move_table(self.tmpname, 'main', self.db)
+
+    def _unspill(self):
+        if self.db != 'main':
+            self.proj.sql.move_table(self.tmpname, self.db, 'main')
+            self.db = 'main'
+
+    def retained_bytes(self):
+        return self.size if self.db == 'main' else 0
+
+    def undo(self):
+        self._unspill()
+        self.proj.sql.swap_tables(self.tmpname, self.tab.ttab_name)
+        self.tab.data_changed()
+
+    def redo(self):
+        self._unspill()
+        self.proj.sql.swap_tables(self.tmpname, self.tab.ttab_name)
+        self.tab.data_changed()
+        self._spill()
+
+    def __del__(self):
+        self.tab.query('DROP TABLE "{}"."{}"'.format(
+            self.db, self.tmpname))
+
+
+class _ColumnsAlterAct:
+    """ Changes original columns of the table by sql column renames.
+        New representations are written to new columns so only
+        data of altered columns is copied and old columns
+        are kept hidden for undo.
+        Unlike _TableRebuildAct backups hidden columns are never spilled:
+        moving them to 'U' would rewrite the table. They are dropped
+        as soon as the step leaves undo history (see ConvertTable._clear),
+        so they are bounded by CommandFlow.max_undo_bytes.
+    """
+    def __init__(self, tab, before, after):
+        """ before -- [(column, status column, new value expression)]
+                sql names of altered columns before changes,
+            after -- [(column, status column, sql type)] sql names of
+                the same columns after changes or None for removed ones
+        """
+        self.tab = tab
+        self.proj = tab.proj
+        # [(old name, new name)] column renames in execution order
+        self.renames = []
+        # columns which are hidden after redo and after undo
+        self.hidden_done, self.hidden_undone = [], []
+        size0 = self.proj.sql.work_db_size()
+        second = []
+        for (oc, ostat, expr), new in zip(before, after):
+            uid = basic.uniint()
+            bc = '"_bu{} {}"'.format(uid, oc[1:-1])
+            bstat = '"_bu{} {}"'.format(uid, ostat[1:-1])
+            # first all old columns are moved away so names can be swapped
+            self.renames.extend([(oc, bc), (ostat, bstat)])
+            if new is None:
+                self.hidden_done.extend([bc, bstat])
+                continue
+            nc, nstat, tp = new
+            if expr != oc:
+                # representation changes: values are written to new column
+                tmp = '"_new{} {}"'.format(uid, nc[1:-1])
+                self.tab.query('ALTER TABLE "{}" ADD COLUMN {} {}'.format(
+                    self.tab.ttab_name, tmp, tp))
+                self.tab.query('UPDATE "{}" SET {} = {}'.format(
+                    self.tab.ttab_name, tmp, expr))
+                second.append((tmp, nc))
+                self.hidden_done.append(bc)
+                self.hidden_undone.append(tmp)
+            else:
+                second.append((bc, nc))
+            second.append((bstat, nstat))
+        self.renames.extend(second)
+        # kept data is about the size of new columns
+        self.size = self.proj.sql.work_db_size() - size0
+        # hidden columns live until the table drops them
+        # after this step is deleted
+        self.tab.register_hidden_columns(
+            self, self.hidden_done + self.hidden_undone)
+        self.redo()
+        self.proj.sql.adjust_work_db()
+
+    def _rename(self, frm, to):
+        self.tab.query('ALTER TABLE "{}" RENAME COLUMN {} TO {}'.format(
+            self.tab.ttab_name, frm, to))
+
+    def retained_bytes(self):
+        return self.size
+
+    def undo(self):
+        for frm, to in reversed(self.renames):
+            self._rename(to, frm)
+        self.tab.data_changed()
+
+    def redo(self):
+        for frm, to in self.renames:
+            self._rename(frm, to)
+        self.tab.data_changed()
+
+
 class TableConverter:
     def __init__(self, tab):
         self.table = tab
@@ -480,12 +584,20 @@ class TableConverter:
         return ret[iorig:]
 
     def _alter_origs(self):
+        # lazy table data should be copied before columns are changed
+        self.table.load_ttab()
         oitems = [x for x in self.citems if x.col.is_original()]
 
         # remove columns
         for it in filter(lambda x: x.do_remove, oitems):
             it.act_remove_column()
 
+        # sql names and new values of altered columns
+        altered = [x for x in oitems if x.need_alter()]
+        before = [(x.col.sql_line(False),
+                   x.col.status_column.sql_line(False),
+                   x.internal_repr_change_line()) for x in altered]
+
         # rename columns by: alter to tmp, create new, copy, drop tmp
         colnames_before = self.table._original_collist(False)
         for i, cb in enumerate(colnames_before):
@@ -511,33 +623,14 @@ class TableConverter:
         if basic.list_equal(colnames_after, colnames_before):
             return
 
-        class Act:
-            def __init__(self, tab, cnbefore, cnafter):
-                self.tab = tab
-                self.proj = tab.proj
-                self.tmpname = '_alter{} {}'.format(basic.uniint(),
-                                                    self.tab.ttab_name)
-                qr = 'ALTER TABLE "{}" RENAME TO "{}"'.format(
-                        self.tab.ttab_name, self.tmpname)
-                self.tab.query(qr)
-                self.tab._create_ttab()
-                qr = 'INSERT INTO "{}" ({}) SELECT {} FROM "{}"'.format(
-                    self.tab.ttab_name,
-                    ', '.join(cnafter),
-                    ', '.join(cnbefore),
-                    self.tmpname)
-                self.tab.query(qr)
-
-            def undo(self):
-                self.proj.sql.swap_tables(self.tmpname, self.tab.ttab_name)
-
-            def redo(self):
-                self.proj.sql.swap_tables(self.tmpname, self.tab.ttab_name)
-
-            def __del__(self):
-                self.tab.query('DROP TABLE "{}"'.format(self.tmpname))
-
-        a = Act(self.table, colnames_before, colnames_after)
+        if bsqlproc.native_alter_column:
+            after = [None if x.do_remove else
+                     (x.col.sql_line(False),
+                      x.col.status_column.sql_line(False),
+                      x.col.sql_data_type()) for x in altered]
+            a = _ColumnsAlterAct(self.table, before, after)
+        else:
+            a = _TableRebuildAct(self.table, colnames_before, colnames_after)
         self.acts.append(a)
 
     def act_fix_column_order(self, clist):
@@ -586,3 +679,6 @@ class ConvertTable(command.Command):
 
     def _clear(self):
         self.acts.clear()
+        # called when the command leaves undo history,
+        # hidden columns of its released acts are not needed anymore
+        self.conv.table.drop_unused_columns()
@@ -72,7 +72,7 @@ def copy_view_table(tab_name, origtab, cols, proj):
 
         _insert_query(self, origquery)
 
-    return dtab.DataTable(tab_name, proj, init_columns, fill_ttab, False)
+    return dtab.DataTable(tab_name, proj, init_columns, fill_ttab, True)
 
 
 # ============================== JoinTable
@@ -170,4 +170,4 @@ def join_table(tab_name, joinentries, proj):
                 col = table.get_column("__k{}".format(i))
                 table.all_columns.remove(col)
 
-    return dtab.DataTable(tab_name, proj, init_columns, fill_ttab, False)
+    return dtab.DataTable(tab_name, proj, init_columns, fill_ttab, True)
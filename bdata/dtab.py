@@ -1,7 +1,12 @@
+import sys
+import collections
+import weakref
 import xml.etree.ElementTree as ET
+import numpy as np
 from xml.sax.saxutils import escape, unescape
 from bdata import bcol
-from prog import filt
+from bdata import tabindex
+from prog import basic, filt, bsqlproc
 
 
 class DataTable(object):
@@ -9,12 +14,19 @@ class DataTable(object):
         modification options of a given table
         with the results of these modification (self.tab)
     """
+    # memory budget in bytes for cached view results of a single table
+    view_cache_budget = 64 * 2**20
+    # number of rows processed at once by vectorized materialization
+    materialize_chunk_size = 100000
+
     def __init__(self, name, proj,
                  init_columns, fill_ttab, need_rewrite):
         """
         init_columns:def(DataTable) - delegate for self.columns initialization
         fill_ttab:def(DataTable) - delegate that fills temporary table
                                    self.ttab_name
+        need_rewrite:bool - False if table data are already stored
+                            in the current project database file
         """
         self.id = -1
         self.proj = proj
@@ -46,6 +58,25 @@ class DataTable(object):
 
         # table data on python side: fetched data which should be shown.
         self.tab = ViewedData(self)
+        # is increased on each modification of self.ttab_name data
+        self._data_generation = 0
+        # state_hash -> (query, n_rows, pages)
+        self._view_cache = collections.OrderedDict()
+        # (ttab_name, sql write count) for which view cache is valid
+        self._view_cache_source = None
+        # indexes of self.ttab_name
+        self.indexer = tabindex.IndexAdvisor(self)
+        # [(weakref(undo step), [sql names of hidden columns it keeps])]
+        self._hidden_columns = []
+        # cached names of self.ttab_name sql columns or None.
+        # Dropped on each change of the table structure.
+        self._ttab_cols = None
+        # storage state of the last write_to_db or None if
+        # data were changed after it
+        self._saved_state = None
+        # name of the A database table which is read through
+        # self.ttab_name view until the first data modification
+        self._lazy_source = None
 
         # data initialization
         init_columns(self)   # fills self.columns, self.visible columns
@@ -60,6 +91,11 @@ class DataTable(object):
         self.query(qr)
         self._n_total_rows = self.qresult()[0]
 
+        if not need_rewrite:
+            self._saved_state = self._storage_state()
+        # large tables could require file based working database
+        self.proj.sql.adjust_work_db()
+
     # ---------------------- assembling procedures
     def _original_collist(self, with_type=True):
         collist = []
@@ -78,11 +114,37 @@ class DataTable(object):
         return collist
 
     def _create_ttab(self):
+        if self._lazy_source is not None:
+            return self._create_lazy_ttab()
         # [(colname, col sql type)]
         collist = self._original_collist()
 
         # choose proper name
-        self.query("SELECT name FROM sqlite_master WHERE type='table'")
+        self._choose_ttab_name()
+
+        # create table
+        qr = """CREATE TABLE "{0}" ({1})
+        """.format(self.ttab_name, ', '.join(collist))
+        self.query(qr)
+
+    def _create_lazy_ttab(self):
+        """ creates read only temporary view on A database table
+            with zero status columns
+        """
+        cols, stats = [], []
+        for c in filter(lambda x: x.is_original(), self.all_columns):
+            cols.append(c.sql_line(False))
+            stats.append('0 AS {}'.format(c.status_column.sql_line(False)))
+        self._choose_ttab_name()
+        qr = 'CREATE TEMP VIEW "{}" AS SELECT {} FROM A."{}"'.format(
+            self.ttab_name, ', '.join(cols + stats), self._lazy_source)
+        self.query(qr)
+        self.proj.lazy_tables.append(self)
+
+    def _choose_ttab_name(self):
+        self._ttab_cols = None
+        self.query("SELECT name FROM sqlite_master UNION "
+                   "SELECT name FROM sqlite_temp_master")
         enames = [x[0] for x in self.qresults()]
         if self.ttab_name in enames:
             for i in range(999999):
@@ -94,11 +156,6 @@ class DataTable(object):
                 raise Exception("Failed to create temporary table {}".format(
                         self.ttab_name))
 
-        # create table
-        qr = """CREATE TABLE "{0}" ({1})
-        """.format(self.ttab_name, ', '.join(collist))
-        self.query(qr)
-
     def _complete_columns_lists(self):
         ac, self.all_columns, self.visible_columns = self.all_columns, [], []
         for v in filter(lambda x: x.is_category(), ac):
@@ -125,17 +182,114 @@ class DataTable(object):
     # ================ database manipulations
     def destruct(self):
         """ removes temporary table from :memory: """
+        if self.is_lazy():
+            self.query('DROP VIEW "{}"'.format(self.ttab_name))
+            self.proj.lazy_tables.remove(self)
+            self._lazy_source = None
+            return
         qr = 'DROP TABLE "{}"'.format(self.ttab_name)
         self.query(qr)
 
+    def is_lazy(self):
+        """ True if data are still read from A database file """
+        return self._lazy_source is not None
+
+    def load_ttab(self):
+        """ copies data of lazy table into :memory:.
+            Should be called before any modification of self.ttab_name.
+        """
+        if not self.is_lazy():
+            return
+        source = self._lazy_source
+        self.query('DROP VIEW "{}"'.format(self.ttab_name))
+        self.proj.lazy_tables.remove(self)
+        self._lazy_source = None
+        self._create_ttab()
+        ls = [x.sql_line(False) for x in self.all_columns if x.is_original()]
+        qr = 'INSERT INTO "{0}" ({1}) SELECT {1} from A."{2}"'.format(
+            self.ttab_name, ", ".join(ls), source)
+        self.query(qr)
+        # data are the same but materialized columns should be rebuilt
+        self._data_generation += 1
+        basic.log_message('Table "{}" was loaded into memory'.format(
+            self.name))
+        self.proj.sql.adjust_work_db()
+
+    def register_hidden_columns(self, owner, names):
+        """ names -- sql names of self.ttab_name columns which are kept
+                for undo/redo by owner. They are removed by
+                drop_unused_columns after owner is deleted.
+        """
+        self._hidden_columns.append((weakref.ref(owner), list(names)))
+        self._ttab_cols = None
+
+    def drop_unused_columns(self):
+        """ removes hidden columns of deleted undo steps.
+            Is called when steps leave undo history and before
+            the table is saved. All of them are dropped by a single
+            table rebuild since each sql DROP COLUMN rewrites
+            the whole table.
+        """
+        dead = set()
+        for owner, names in self._hidden_columns:
+            if owner() is None:
+                dead.update(x[1:-1] for x in names)
+        self._hidden_columns = [x for x in self._hidden_columns
+                                if x[0]() is not None]
+        if not dead or self.is_lazy():
+            return
+        self.query('PRAGMA table_info("{}")'.format(self.ttab_name))
+        info = self.qresults()
+        keep = [x for x in info if x[1] not in dead]
+        if len(keep) == len(info):
+            return
+        cols, defs = [], []
+        for _, nm, tp, _, dflt, _ in keep:
+            cols.append('"{}"'.format(nm))
+            if nm == 'id':
+                tp = 'INTEGER UNIQUE'
+            elif dflt is not None:
+                tp = '{} DEFAULT {}'.format(tp, dflt)
+            defs.append('{} {}'.format(cols[-1], tp))
+        tmp = '_gc{} {}'.format(basic.uniint(), self.ttab_name)
+        self.query('ALTER TABLE "{}" RENAME TO "{}"'.format(
+            self.ttab_name, tmp))
+        self.query('CREATE TABLE "{}" ({})'.format(
+            self.ttab_name, ', '.join(defs)))
+        self.query('INSERT INTO "{0}" ({1}) SELECT {1} FROM "{2}"'.format(
+            self.ttab_name, ', '.join(cols), tmp))
+        self.query('DROP TABLE "{}"'.format(tmp))
+        self._ttab_cols = None
+        # indexes were dropped with the old table
+        self.indexer._synced = None
+        basic.log_message('{} unused columns of "{}" were dropped'.format(
+            len(info) - len(keep), self.name))
+
     def rename_ttab(self, newname):
+        self.load_ttab()
         qr = 'ALTER TABLE "{}" RENAME TO "{}"'.format(
                 self.ttab_name, newname)
         self.query(qr)
         self.ttab_name = newname
+        self._ttab_cols = None
+
+    def _storage_state(self):
+        """ -> (database file, table name, original columns) which
+               define the stored copy of the table
+        """
+        return (self.proj._curname, self.name,
+                tuple((c.name, c.sql_data_type())
+                      for c in self.all_columns if c.is_original()))
+
+    def need_rewrite(self):
+        """ -> True if stored copy of the table differs from current data
+        """
+        return self._saved_state != self._storage_state()
 
     def write_to_db(self):
-        ' flushes current data to A database if needed '
+        ' flushes current data to A database '
+        self.load_ttab()
+        self.proj.load_lazy_tables(self.name)
         self.query('DROP TABLE IF EXISTS A."{}"'.format(self.name))
         colstring = [('id', 'INTEGER UNIQUE')]
         for c in filter(lambda x: x.is_original(), self.all_columns[1:]):
@@ -149,29 +303,36 @@ class DataTable(object):
             self.name, colstring2, self.ttab_name)
         self.query(qr)
         self.proj.sql.commit()
+        self._saved_state = self._storage_state()
 
     # ================== SQL query procedures
     def _output_columns_list(self, cols, status_adds=False, use_groups=None,
-                             group_adds=False, auto_alias=""):
+                             group_adds=False, auto_alias="", group_keys=(),
+                             extra_lines=(), plan=None):
         if use_groups is None:
             use_groups = bool(self.group_by)
         ret = []
         for c in cols:
             # viewed columns
-            ret.append(c.sql_line(use_groups))
+            ret.append(c.sql_line(use_groups, plan))
         if status_adds:
             # status columns
             for c in cols:
-                ret.append(c.status_column.sql_line(use_groups))
+                ret.append(c.status_column.sql_line(use_groups, plan))
 
         if use_groups and group_adds:
             # add distinct counts from categories data
             for v in self.visible_columns:
                 if v.is_category():
                     ret.append('COUNT(DISTINCT {})'.format(v.sql_line()))
+            # add grouping columns values. They are constant within a group
+            # so sqlite returns them as bare columns.
+            for c in group_keys:
+                ret.append(c.sql_line())
             # add total group length and resulting id column
             ret.append("MIN(id)")
             ret.append("COUNT(id)")
+        ret.extend(extra_lines)
 
         if auto_alias:
             for i in range(len(ret)):
@@ -179,7 +340,7 @@ class DataTable(object):
 
         return ', '.join(ret)
 
-    def _grouping_ordering(self, group):
+    def _grouping_ordering(self, group, plan=None):
         if self.ordering:
             try:
                 oc = self.get_column(iden=self.ordering[0])
@@ -195,7 +356,7 @@ class DataTable(object):
             order = ['MIN(id) ASC']
             if self.ordering:
                 if not oc.is_category():
-                    order.insert(0, '{} {}'.format(oc.sql_line(True),
+                    order.insert(0, '{} {}'.format(oc.sql_line(True, plan),
                                                    self.ordering[1]))
                 elif self.ordering[1] == 'ASC':
                     order.insert(0, 'MIN({}) ASC'.format(oc.sql_line()))
@@ -214,15 +375,21 @@ class DataTable(object):
 
     def _compile_query(self, cols=None, status_adds=True,
                        filters=None, group=None, group_adds=True,
-                       auto_alias=""):
+                       auto_alias="", extra_lines=(), where=None,
+                       id_ordered=False):
         """ cols([ColumnInfo]) -- list of columns to be included,
                     if None -> all visible columns
             status_adds -- whether to add status columns to query
             filters([Filter]) -- list of filters. If none -> all used_fileters
             group([col names]) -- list of column names at which to provide
                     grouping. If none => self.group_by
-            group_adds -- whether to add grouping info column like COUNT etc.
+            group_adds -- whether to add grouping info columns: distinct
+                    counts of visible categories, values of grouping columns,
+                    MIN(id), COUNT(id)
             auto_alias(str) --  adds "AS ...{1,2,3}" to each column
+            extra_lines([str]) -- sql lines added at the end of output
+            where(str) -- additional sql condition for filtration
+            id_ordered -- whether aggregates get grouped rows in id order
         """
         if cols is None:
             cols = self.visible_columns
@@ -231,24 +398,101 @@ class DataTable(object):
             filters = [self.get_filter(iden=x) for x in self.used_filters]
         if group is None:
             group = self.group_by
+        self.sync_materialized()
         # filtration
         fltline = filt.compile_sql_line(filters, self)
+        if where:
+            fltline = '{} ({})'.format(
+                fltline + ' AND' if fltline else 'WHERE', where)
 
+        if group and group != 'all':
+            gkeys = [self.get_column(iden=x) for x in group]
+        else:
+            gkeys = []
+        # native sql medians need grouping columns for window partitions
+        plan = bsqlproc.GroupingPlan([x.sql_line() for x in gkeys])
         # grouping
-        grlist, order = self._grouping_ordering(group)
+        grlist, order = self._grouping_ordering(group, plan)
+        collist = self._output_columns_list(cols, status_adds, bool(group),
+                                            group_adds, auto_alias, gkeys,
+                                            extra_lines, plan)
+
+        # usage statistics for indexing
+        self.indexer.register_filters(filters)
+        if group and group != 'all':
+            self.indexer.register_grouping(
+                [self.get_column(iden=x) for x in group])
+        elif not group and self.ordering:
+            self.indexer.register_ordering(
+                self.get_column(iden=self.ordering[0]))
 
-        collist = self._output_columns_list(cols, status_adds,
-                                            bool(group), group_adds,
-                                            auto_alias)
         # get result
-        qr = """SELECT {} FROM "{}" {} {} {}""".format(
+        qr = """SELECT {} FROM {} {} {}""".format(
             collist,
-            self.ttab_name,
-            fltline,
+            plan.from_line(self.ttab_name, fltline, id_ordered),
             grlist,
             order)
         return qr
 
+    def compile_export_query(self, represent=True, subvalues=False):
+        """ -> query which returns visible rows for export.
+            Each row contains visible column values (dictionary values
+            instead of keys if represent). For grouped tables they are
+            followed by distinct counts of visible categories, COUNT(id)
+            and, if subvalues, comma separated category values
+            within a group in id order.
+        """
+        cols = self.visible_columns
+        extra = []
+        if self.group_by and subvalues:
+            for c in filter(lambda x: x.is_category(), cols):
+                ln = c.repr_sql_line(False) if represent else None
+                extra.append("group_concat({}, ',')".format(
+                    ln or c.sql_line(False)))
+        # group_concat has no ORDER BY in sqlite < 3.44,
+        # so its rows come from an id ordered subquery
+        qr = self._compile_query(cols, status_adds=False,
+                                 auto_alias='_e', extra_lines=extra,
+                                 id_ordered=bool(extra))
+        self.indexer.sync()
+        # wrapping select keeps ordering of the subquery
+        ret = []
+        for i, c in enumerate(cols):
+            a = '_e{}'.format(i + 1)
+            ln = c.repr_delegate.repr_sql_line(a) if represent else None
+            ret.append(ln or a)
+        if self.group_by:
+            ncat = len([x for x in cols if x.is_category()])
+            ng = len(self.group_by) if self.group_by != 'all' else 0
+            n = len(cols) + ncat + ng + 2
+            ret.extend('_e{}'.format(len(cols) + i + 1)
+                       for i in range(ncat))
+            ret.append('_e{}'.format(n))
+            ret.extend('_e{}'.format(n + i + 1) for i in range(len(extra)))
+        return 'SELECT {} FROM ({})'.format(', '.join(ret), qr)
+
+    def _compile_count_query(self, filters=None, group=None):
+        """ -> query returning the number of rows which
+               _compile_query(filters=filters, group=group) would give.
+            Does not compute any output columns.
+        """
+        if filters is None:
+            filters = [self.get_filter(iden=x) for x in self.used_filters]
+        if group is None:
+            group = self.group_by
+        self.sync_materialized()
+        fltline = filt.compile_sql_line(filters, self)
+        if group == 'all':
+            # aggregate query without GROUP BY always gives a single row
+            return 'SELECT 1'
+        elif group:
+            grlist, _ = self._grouping_ordering(group)
+            return 'SELECT COUNT(*) FROM (SELECT 1 FROM "{}" {} {})'.format(
+                self.ttab_name, fltline, grlist)
+        else:
+            return 'SELECT COUNT(*) FROM "{}" {}'.format(
+                self.ttab_name, fltline)
+
     def query(self, qr, dt=None):
         self.proj.sql.query(qr, dt)
 
@@ -259,14 +503,141 @@ class DataTable(object):
         return self.proj.sql.qresults()
 
     def update(self):
-        self.query(self._compile_query())
-        self.tab.fill(self.qresults())
+        qr = self._compile_query()
+        self.indexer.sync()
+        # any write to the sql table invalidates cached views
+        source = (self.ttab_name, self.proj.sql.write_count(self.ttab_name))
+        if source != self._view_cache_source:
+            self._view_cache.clear()
+            self._view_cache_source = source
+        key = self.state_hash()
+        cached = self._view_cache.get(key)
+        # state_hash does not track filters and columns content
+        # so the query itself is also compared
+        if cached is not None and cached[0] == qr:
+            self._view_cache.move_to_end(key)
+            self.tab.restore(*cached)
+        else:
+            self.query(self._compile_count_query())
+            self.tab.fill(qr, self.qresult()[0])
+            self._view_cache[key] = (qr, self.tab.n_rows(), self.tab.pages)
+            self._view_cache.move_to_end(key)
+        self._shrink_view_cache()
+
+    def _shrink_view_cache(self):
+        """ removes least recently used views until cache fits the budget.
+            Current view is always kept.
+        """
+        sizes = [sum(p.nbytes for p in v[2].values())
+                 for v in self._view_cache.values()]
+        total = sum(sizes)
+        for sz in sizes[:-1]:
+            if total <= self.view_cache_budget:
+                break
+            self._view_cache.popitem(last=False)
+            total -= sz
+
+    def _materialization_state(self, col):
+        """ -> state of table data and col dependencies
+               which defines materialized column values
+        """
+        deps = []
+        for d in col.sql_delegate.deps:
+            dct = getattr(d.repr_delegate, 'dict', None)
+            deps.append((d.id, d.name, d.is_materialized(),
+                         tuple(dct.kvalues.items()) if dct else None,
+                         None if d.is_original() else
+                         self._materialization_state(d)))
+        return (self.ttab_name, self._data_generation, tuple(deps))
+
+    def _ttab_columns(self):
+        """ -> names of self.ttab_name sql columns """
+        if self._ttab_cols is None:
+            self.query('PRAGMA table_info("{}")'.format(self.ttab_name))
+            self._ttab_cols = [x[1] for x in self.qresults()]
+        return self._ttab_cols
+
+    def _materialize(self, col):
+        dlg = col.sql_delegate
+        nm = dlg.materialized_name()
+        state = self._materialization_state(col)
+        # stored column could have been dropped after undo
+        if dlg.materialized_state == state and nm in self._ttab_columns():
+            return
+        if self.is_lazy():
+            self.load_ttab()
+            state = self._materialization_state(col)
+        for d in dlg.deps:
+            if d.is_materialized():
+                self._materialize(d)
+        if nm not in self._ttab_columns():
+            self.query('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(
+                self.ttab_name, nm, col.sql_data_type()))
+            self._ttab_cols = None
+        vfun = dlg.vectorized_function()
+        if vfun is not None:
+            self._materialize_vectorized(col, vfun)
+        else:
+            self.query('UPDATE "{}" SET "{}" = {}'.format(
+                self.ttab_name, nm, dlg.function_line()))
+        dlg.materialized_state = state
+
+    def _materialize_vectorized(self, col, vfun):
+        """ computes col values by numpy function vfun over
+            numeric dependencies chunk by chunk
+        """
+        dlg = col.sql_delegate
+        qr = 'SELECT rowid, {} FROM "{}"'.format(
+            ", ".join([x.sql_line(False) for x in dlg.deps]),
+            self.ttab_name)
+        upd = 'UPDATE "{}" SET "{}" = ? WHERE rowid = ?'.format(
+            self.ttab_name, dlg.materialized_name())
+        totype = float if col.dt_type == 'REAL' else int
+        # only the stored column is updated so the scan by rowid
+        # is not affected by updates of fetched rows
+        for chunk in self.proj.sql.fetch_chunks(
+                qr, self.materialize_chunk_size):
+            a = np.array([[np.nan if v is None else v for v in x[1:]]
+                          for x in chunk], dtype=np.float64)
+            res = vfun(a)
+            vals = [None if v != v else totype(v) for v in res.tolist()]
+            self.query(upd, zip(vals, [x[0] for x in chunk]))
+
+    def sync_materialized(self):
+        """ recomputes stored values of materialized function columns
+            whose dependencies have changed and drops stored values of
+            columns which left all_columns. Should be called before
+            building queries which use column sql lines.
+        """
+        mats = [c for c in self.all_columns if c.is_materialized()]
+        if not self.is_lazy() and bsqlproc.native_alter_column:
+            need = [c.sql_delegate.materialized_name() for c in mats]
+            for nm in self._ttab_columns()[:]:
+                if nm.startswith('_mat ') and nm not in need:
+                    self.indexer.drop_indexes(nm)
+                    self.query('ALTER TABLE "{}" DROP COLUMN "{}"'.format(
+                        self.ttab_name, nm))
+                    self._ttab_cols = None
+        for c in mats:
+            self._materialize(c)
+
+    def data_changed(self):
+        """ should be called after each modification of self.ttab_name
+            data which keeps view state. Forces recomputation of
+            materialized columns and marks table for rewrite on the
+            next commit. Cached views are dropped by sql writes anyway.
+        """
+        self._data_generation += 1
+        self._saved_state = None
+        # column renames of conversions are followed by data_changed
+        self._ttab_cols = None
 
     def reset_id(self):
         """ Fills id column with 1, 2, 3, ... values.
             Does not check if id values are already in correct order.
             Set need_rewrite to true.
         """
+        self.load_ttab()
         self.query('SELECT COUNT(*) from "{}"'.format(self.ttab_name))
         nums = range(1, self.qresult()[0] + 1)
         # update filters that use id
@@ -286,6 +657,7 @@ class DataTable(object):
         self.query("""
             UPDATE "{}" SET id = ? WHERE rowid = ?
         """.format(self.ttab_name), newold)
+        self.data_changed()
 
     def add_anon_filter(self, f):
         assert f.name is None and f.is_applicable(self)
@@ -353,11 +725,11 @@ class DataTable(object):
             if not self.all_columns or self.all_columns[0].name != 'id':
                 raise Exception("unique id column was not found")
 
+            # data are read from A until the first modification
+            self._lazy_source = name
+
         def fill_ttab(self):
-            ls = [x.sql_line() for x in self.all_columns if x.is_original()]
-            qr = 'INSERT INTO "{0}" ({1}) SELECT {1} from "{2}"'.format(
-                self.ttab_name, ", ".join(ls), self.name)
-            self.query(qr)
+            pass
 
         # create table
         name = unescape(root.find('NAME').text)
@@ -475,10 +847,10 @@ class DataTable(object):
         return [f for f in self.proj.named_filters if f.is_applicable(self)]
 
     def n_subrows(self, ir):
-        return self.tab.rows[ir].n_sub_values
+        return self.tab.n_subrows(ir)
 
     def n_subdata_unique(self, ir, ic):
-        return self.tab.rows[ir].n_unique_sub_values[ic]
+        return self.tab.n_subdata_unique(ir, ic)
 
     def n_visible_categories(self):
         ret = 0
@@ -527,6 +899,7 @@ class DataTable(object):
             return (1, int(self.qresult()[0]))
         col = self.get_column(cname)
         if is_global:
+            self.sync_materialized()
             qr = 'SELECT MIN({0}), MAX({0}) FROM "{1}"'.format(
                     col.sql_line(), self.ttab_name)
             self.query(qr)
@@ -537,17 +910,24 @@ class DataTable(object):
     def get_column_values(self, cname):
         rv = self.get_raw_column_values(cname)
         col = self.get_column(cname)
-        return [col.repr(x) for x in rv]
+        return [col.repr(x) for x in rv.tolist()]
 
     def get_raw_column_values(self, cname):
+        """ -> numpy masked array of raw values. Masked entries are NULLs.
+            Returned array could share memory with the viewed data
+            so it should not be modified.
+        """
         try:
             # if cname in visibles no need to make a query
             ind = [x.name for x in self.visible_columns].index(cname)
             return self.tab.get_column_values(ind)
         except ValueError:
-            qr = self._compile_query([self.get_column(cname)], False)
+            col = self.get_column(cname)
+            qr = self._compile_query([col], False)
             self.query(qr)
-            return [x[0] for x in self.qresults()]
+            d, m = ViewedData._column_buffer(
+                [x[0] for x in self.qresults()], col.dt_type)
+            return np.ma.MaskedArray(d, mask=m, copy=False, shrink=False)
 
     def get_distinct_column_raw_vals(self, cname, is_global=True, sort=False):
         """ -> distinct vals in global scope (ignores filters, groups etc)
@@ -556,6 +936,9 @@ class DataTable(object):
         col = self.get_column(cname)
         assert col is not None, "{} was not found".format(cname)
         if is_global:
+            self.sync_materialized()
+            self.indexer.register_distinct(col)
+            self.indexer.sync()
             s = "ORDER BY {}".format(col.sql_line()) if sort else ''
             qr = 'SELECT DISTINCT({0}) FROM "{1}" {2}'.format(
                     col.sql_line(), self.ttab_name, s)
@@ -597,117 +980,265 @@ class DataTable(object):
 # =================================== Additional classes
 # ------------ Visible table
 class ViewedData:
-    class Row:
+    class Page:
+        """ Columnar storage of a set of successive view rows """
         def __init__(self, inp, model):
-            self.model = model
             vc = len(model.visible_columns)
-            self.values = inp[:vc]
-            self.status = inp[vc:2*vc]
-            self.id = self.values[0]
-            self.sub_values_requested = False
-            self.sub_values = self.sub_status = [[] for _ in range(vc)]
-            self.n_unique_sub_values = [1] * vc
+            n = len(inp)
+            cols = list(zip(*inp)) if n > 0 else [()] * (2*vc + 2)
+            # values: typed buffer + null mask for each visible column
+            self.data, self.mask = [], []
+            for c, v in zip(model.visible_columns, cols[:vc]):
+                d, m = ViewedData._column_buffer(v, c.dt_type)
+                self.data.append(d)
+                self.mask.append(m)
+            # status: bitmap packed along columns
+            st = np.array([[bool(x) for x in r[vc:2*vc]] for r in inp],
+                          dtype=bool).reshape((n, vc))
+            self.status = np.packbits(st, axis=1)
+            # group information
+            self.n_unique_sub_values = np.ones((n, vc), dtype=np.int64)
             if model.group_by:
-                self.n_sub_values = inp[-1]
-                self.id = inp[-2]
+                self.n_sub_values = np.array(cols[-1], dtype=np.int64)
+                self.ids = np.array(cols[-2], dtype=np.int64)
+                # values of grouping columns go before MIN(id)
+                if model.group_by != 'all':
+                    ng = len(model.group_by)
+                    self.keys = list(zip(*cols[-2-ng:-2]))
+                else:
+                    self.keys = [()] * n
                 for i in range(vc):
                     if model.visible_columns[i].is_category():
-                        self.n_unique_sub_values[i] = inp[2*vc+i]
+                        self.n_unique_sub_values[:, i] = cols[2*vc+i]
                     else:
-                        self.n_unique_sub_values[i] = inp[-1]
-            else:
-                self.n_sub_values = 0
-            self.definition = self._row_def()
-
-        def value_by_name(self, nm):
-            for index, c in enumerate(self.model.visible_columns):
-                if c.name == nm:
-                    return self.values[index]
-            raise KeyError
-
-        def subvalues(self, j):
-            if not self.sub_values_requested:
-                self._request_subvalues()
-            return [x[j] for x in self.sub_values]
-
-        def substatus(self, j):
-            if not self.sub_values_requested:
-                self._request_subvalues()
-            return [x[j] for x in self.sub_status]
-
-        def _row_def(self):
-            """ -> {field: value}, unique for this row """
-            if not self.model.group_by:
-                return {"id": self.values[0]}
-            elif self.model.group_by == 'all':
-                return {}
-            else:
-                ret = {}
-                for i in self.model.group_by:
-                    n = self.model.get_column(iden=i).name
-                    try:
-                        ret[n] = self.value_by_name(n)
-                    except KeyError:
-                        # grouped value does not present in the data
-                        # hence we make a query through the id
-                        qr = 'SELECT {} from "{}" WHERE id={}'.format(
-                            self.model.get_column(n).sql_line(),
-                            self.model.ttab_name,
-                            self.id)
-                        self.model.query(qr)
-                        ret[n] = self.model.qresult()[0]
-                    # if field is TEXT we have to use quotes to
-                    # assemble SQL query row in _request_subvalues:
-                    # WHERE field = 'value'
-                    if self.model.get_column(n).dt_type == 'TEXT':
-                        ret[n] = "'" + ret[n] + "'"
-                return ret
-
-        def _request_subvalues(self):
-            if self.n_sub_values == 1:
-                self.sub_values = [self.values]
-                self.sub_status = [self.status]
+                        self.n_unique_sub_values[:, i] = self.n_sub_values
             else:
-                vc = len(self.model.visible_columns)
-                # add additional filters defining this group
-                flt = [self.model.get_filter(iden=x)
-                       for x in self.model.used_filters]
-                flt.append(filt.filter_by_values(
-                        self.model, self.definition.keys(),
-                        self.definition.values(), False, True))
-                # build query
-                qr = self.model._compile_query(filters=flt, group=[])
-                self.model.query(qr)
-                # fill data
-                f = self.model.qresults()
-                self.sub_values = [x[:vc] for x in f]
-                self.sub_status = [x[vc:2*vc] for x in f]
-
-            self.sub_values_requested = True
+                self.n_sub_values = np.zeros(n, dtype=np.int64)
+                self.ids = self.data[0]
+                self.keys = [()] * n
+            # row index -> (sub values rows, sub status rows)
+            # filled on demand for grouped rows
+            self.subdata = {}
+            # approximate memory usage (sub values are not counted)
+            self.nbytes = self.status.nbytes +\
+                self.n_unique_sub_values.nbytes + self.n_sub_values.nbytes
+            for d, m in zip(self.data, self.mask):
+                self.nbytes += d.nbytes + m.nbytes
+                if d.dtype == object:
+                    self.nbytes += sum(map(sys.getsizeof, d))
+
+        def get_value(self, i, j):
+            if self.mask[j][i]:
+                return None
+            v = self.data[j][i]
+            return v.item() if isinstance(v, np.generic) else v
+
+        def get_status(self, i, j):
+            return int(self.status[i, j >> 3] >> (7 - (j & 7))) & 1
+
+        def get_row(self, i):
+            return tuple(self.get_value(i, j) for j in range(len(self.data)))
+
+        def get_status_row(self, i):
+            return tuple(self.get_status(i, j)
+                         for j in range(len(self.data)))
+
+    # number of rows fetched from the database by a single query
+    page_size = 1000
+    # maximum number of fetched pages kept in memory
+    max_pages = 8
+    # maximum number of bound parameters in a single sub values query
+    max_query_parameters = 900
 
     def __init__(self, model):
         self.model = model
-        self.rows = []
+        # compiled query which returns all viewed rows
+        self.qr = None
+        self._n_rows = 0
+        # page index -> Page. Ordered from least to most recently used.
+        self.pages = collections.OrderedDict()
+
+    @staticmethod
+    def _column_buffer(vals, dt_type):
+        """ -> (typed numpy array, null mask) for the list of sql values """
+        mask = np.fromiter((x is None for x in vals), dtype=bool,
+                           count=len(vals))
+        if dt_type == 'REAL':
+            tp, nullval = np.float64, 0.0
+        elif dt_type in ['INT', 'ENUM', 'BOOL']:
+            tp, nullval = np.int64, 0
+        else:
+            tp, nullval = object, None
+        try:
+            data = np.array([nullval if x is None else x for x in vals],
+                            dtype=tp)
+        except (ValueError, TypeError, OverflowError):
+            # sql columns are not strictly typed
+            data = np.array(vals, dtype=object)
+        return data, mask
 
     def n_rows(self):
-        return len(self.rows)
+        return self._n_rows
+
+    def fill(self, qr, n_rows):
+        """ qr -- query which returns ordered data rows,
+            n_rows -- number of rows returned by qr.
+            Rows are fetched on demand page by page. The first page
+            is fetched immediately since it is shown right after update.
+        """
+        self.qr = qr
+        self._n_rows = n_rows
+        # previous pages could be kept by the table view cache
+        self.pages = collections.OrderedDict()
+        if n_rows > 0:
+            self._fetch_page(0)
+
+    def restore(self, qr, n_rows, pages):
+        """ sets data previously obtained by fill(qr, n_rows) """
+        self.qr = qr
+        self._n_rows = n_rows
+        self.pages = pages
+
+    def page(self, i):
+        """ -> (Page, row index within the page) for the i-th row """
+        if i < 0 or i >= self._n_rows:
+            raise IndexError(i)
+        ipage, irow = divmod(i, self.page_size)
+        try:
+            page = self.pages[ipage]
+            self.pages.move_to_end(ipage)
+        except KeyError:
+            page = self._fetch_page(ipage)
+        return page, irow
+
+    def _fetch_page(self, ipage):
+        qr = '{} LIMIT {} OFFSET {}'.format(
+            self.qr, self.page_size, ipage * self.page_size)
+        self.model.query(qr)
+        page = ViewedData.Page(self.model.qresults(), self.model)
+        self.pages[ipage] = page
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        return page
+
+    def _load_subdata(self, ipage):
+        """ fills sub values of all groups of the page
+            using a single query to the ungrouped table
+        """
+        page = self.pages[ipage]
+        # group key -> index of the row within the page
+        keys = {}
+        for k in range(len(page.ids)):
+            if page.n_sub_values[k] <= 1:
+                page.subdata[k] = ([page.get_row(k)], [page.get_status_row(k)])
+            else:
+                keys[page.keys[k]] = k
+        if not keys:
+            return
+        vc = len(self.model.visible_columns)
+        if self.model.group_by == 'all':
+            gcols = []
+        else:
+            gcols = [self.model.get_column(iden=x)
+                     for x in self.model.group_by]
+        ng = len(gcols)
+        for k in keys.values():
+            page.subdata[k] = ([], [])
+        # only rows of the page groups are read: groups keys are passed
+        # as bound parameters by portions
+        klist = list(keys)
+        step = max(1, self.max_query_parameters // max(ng, 1))
+        for i in range(0, max(len(klist), 1), step):
+            where, params = self._group_keys_condition(
+                gcols, klist[i:i+step])
+            # ordered as ungrouped view. Group key columns go after values.
+            qr = self.model._compile_query(
+                cols=self.model.visible_columns + gcols, group=[],
+                where=where)
+            for rows in self.model.proj.sql.fetch_chunks(
+                    qr, self.page_size, params):
+                for x in rows:
+                    try:
+                        k = keys[x[vc:vc+ng]]
+                    except KeyError:
+                        continue
+                    page.subdata[k][0].append(x[:vc])
+                    page.subdata[k][1].append(x[vc+ng:2*vc+ng])
 
-    def fill(self, inp):
-        self.rows.clear()
-        for x in inp:
-            self.rows.append(ViewedData.Row(x, self.model))
+    @staticmethod
+    def _group_keys_condition(gcols, klist):
+        """ -> (sql condition, parameters) which selects rows
+               of groups with given keys
+        """
+        if not gcols:
+            return None, ()
+        lines = [c.sql_line() for c in gcols]
+        conds, params = [], []
+        # NULL keys could not be found by IN
+        full = [k for k in klist if None not in k]
+        if full:
+            row = '({})'.format(', '.join(['?'] * len(gcols)))
+            conds.append('({}) IN (VALUES {})'.format(
+                ', '.join(lines), ', '.join([row] * len(full))))
+            for k in full:
+                params.extend(k)
+        for k in filter(lambda x: None in x, klist):
+            conds.append('({})'.format(' AND '.join(
+                '{} IS ?'.format(x) for x in lines)))
+            params.extend(k)
+        return ' OR '.join(conds), params
+
+    def _subdata(self, i):
+        page, k = self.page(i)
+        if k not in page.subdata:
+            self._load_subdata(i // self.page_size)
+        return page.subdata[k]
 
     def get_value(self, i, j):
-        return self.rows[i].values[j]
+        page, k = self.page(i)
+        return page.get_value(k, j)
 
     def get_status(self, i, j):
-        return self.rows[i].status[j]
+        page, k = self.page(i)
+        return page.get_status(k, j)
+
+    def get_id(self, i):
+        page, k = self.page(i)
+        return page.ids[k].item()
+
+    def n_subrows(self, i):
+        page, k = self.page(i)
+        return page.n_sub_values[k].item()
+
+    def n_subdata_unique(self, i, j):
+        page, k = self.page(i)
+        return page.n_unique_sub_values[k, j].item()
 
     def get_subvalues(self, i, j):
-        return self.rows[i].subvalues(j)
+        return [x[j] for x in self._subdata(i)[0]]
 
     def get_substatus(self, i, j):
-        return self.rows[i].substatus(j)
+        return [x[j] for x in self._subdata(i)[1]]
 
     def get_column_values(self, j):
-        return [self.rows[i].values[j] for i in range(self.n_rows())]
+        """ -> numpy masked array of raw j-th column values.
+            If all rows are stored in a single page no copying is done.
+        """
+        if self._n_rows <= self.page_size:
+            if self._n_rows == 0:
+                return np.ma.MaskedArray([], dtype=object)
+            page, _ = self.page(0)
+            return np.ma.MaskedArray(page.data[j], mask=page.mask[j],
+                                     copy=False, shrink=False)
+        if self._n_rows <= self.page_size * self.max_pages:
+            pages = [self.page(i)[0]
+                     for i in range(0, self._n_rows, self.page_size)]
+            return np.ma.MaskedArray(
+                np.concatenate([p.data[j] for p in pages]),
+                mask=np.concatenate([p.mask[j] for p in pages]),
+                shrink=False)
+        # do not pollute page cache with a full table scan
+        self.model.query(self.qr)
+        d, m = self._column_buffer([x[j] for x in self.model.qresults()],
+                                   self.model.visible_columns[j].dt_type)
+        return np.ma.MaskedArray(d, mask=m, copy=False, shrink=False)
@@ -136,7 +136,7 @@ class ActShowColumn:
 
 
 class MergeCategories(command.Command):
-    def __init__(self, tab, catlist, delim, hide_source):
+    def __init__(self, tab, catlist, delim, hide_source, materialize=False):
         assert len(catlist) > 1
         if catlist == 'all':
             cols = list(filter(lambda x: x.is_category(), tab.all_columns))[1:]
@@ -144,12 +144,13 @@ class MergeCategories(command.Command):
             cols = [tab.get_column(x) for x in catlist]
         assert all([x.is_category() for x in cols])
         super().__init__(tab=tab, cols=cols, delim=delim,
-                         hide_source=hide_source)
+                         hide_source=hide_source, materialize=materialize)
         self.acts = []
 
     def _exec(self):
         self.new_col = bcol.collapsed_categories(self.cols, self.delim)
         self.acts.append(ActAddColumn(self.tab, self.new_col))
+        self.new_col.sql_delegate.set_materialized(self.materialize)
         self.acts[-1].redo()
         if self.hide_source:
             for c in self.cols:
@@ -223,16 +224,18 @@ class GroupCategories(command.Command):
 
 
 class NumFunctionColumn(command.Command):
-    def __init__(self, tab, colname, args, func, before_group):
+    def __init__(self, tab, colname, args, func, before_group,
+                 materialize=False):
         cols = [tab.get_column(x) for x in args]
         super().__init__(tab=tab, colname=colname, args=cols, func=func,
-                         before_group=before_group)
+                         before_group=before_group, materialize=materialize)
         self.acts = []
 
     def _exec(self):
         self.new_col = bcol.simple_row_function(
                 self.colname, self.args, self.func, self.before_group)
         self.acts.append(ActAddColumn(self.tab, self.new_col))
+        self.new_col.sql_delegate.set_materialized(self.materialize)
         self.acts[-1].redo()
         return True
 
@@ -304,12 +307,13 @@ class NumRegressionColumns(command.Command):
 
 
 class CustomColumn(command.Command):
-    def __init__(self, tab, name, tp, data):
+    def __init__(self, tab, name, tp, data, materialize=False):
         vals = [None] * tab.n_total_rows()
         for i in range(tab.n_rows()):
             for ids in tab.ids_by_row(i):
                 vals[ids - 1] = data[i]
-        super().__init__(tab=tab, name=name, tp=tp, vals=vals)
+        super().__init__(tab=tab, name=name, tp=tp, vals=vals,
+                         materialize=materialize)
         self.acts = []
         self.new_col = None
 
@@ -317,6 +321,7 @@ class CustomColumn(command.Command):
         idc = self.tab.get_column('id')
         self.new_col = bcol.explicit_column(self.tp, self.name, self.vals, idc)
         self.acts.append(ActAddColumn(self.tab, self.new_col))
+        self.new_col.sql_delegate.set_materialized(self.materialize)
         self.acts[-1].redo()
         return True
 
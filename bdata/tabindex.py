@@ -0,0 +1,147 @@
+import collections
+from prog import basic
+
+
+class IndexAdvisor:
+    """ Watches which columns of a DataTable are used for ordering,
+        grouping and filtering and keeps indexes of the most used ones
+        on the temporary sql table (DataTable.ttab_name).
+
+        Indexes are built only on original and materialized function
+        columns. Keys are stored as
+        tuples of column ids so they survive column renames and
+        temporary table rebuilds: actual sql indexes are reconciled with
+        the plan on each sync() call.
+    """
+    # minimum number of table rows for which indexes are built
+    min_rows = 5000
+    # minimum number of queries which should use a key to index it
+    min_uses = 2
+    # maximum number of indexes per table
+    max_indexes = 4
+    # prefix of sql index names created by advisor
+    prefix = '_idx'
+
+    def __init__(self, tab):
+        self.tab = tab
+        # (column ids) -> number of queries which used this key
+        self.usage = collections.Counter()
+        # (column ids) -> reason
+        self.reasons = {}
+        # (ttab_name, data_generation, plan) of the last sync
+        self._synced = None
+
+    # ---------------------- usage registration
+    @staticmethod
+    def _indexable(c):
+        return c is not None and (c.is_original() or c.is_materialized())
+
+    def _register(self, cols, reason):
+        if not all(map(self._indexable, cols)):
+            return
+        # id is already indexed
+        if [c.name for c in cols[:1]] in ([], ['id']):
+            return
+        key = tuple(c.id for c in cols)
+        self.usage[key] += 1
+        self.reasons.setdefault(key, reason)
+
+    def register_ordering(self, col):
+        """ ORDER BY col, id """
+        self._register([col, self.tab.get_column('id')], 'ORDER BY')
+
+    def register_grouping(self, cols):
+        self._register(cols, 'GROUP BY')
+
+    def register_filters(self, filters):
+        for f in filters:
+            for e in f.entries:
+                self._register([self.tab.get_column(name=e.column.name)],
+                               'WHERE')
+                if hasattr(e.value, 'name'):
+                    self._register([self.tab.get_column(name=e.value.name)],
+                                   'WHERE')
+
+    def register_distinct(self, col):
+        self._register([col], 'DISTINCT')
+
+    # ---------------------- plan
+    def plan(self):
+        """ -> [(column ids)] keys which should be indexed """
+        if self.tab.n_total_rows() < self.min_rows:
+            return []
+        ret = []
+        for key, cnt in self.usage.most_common():
+            if cnt < self.min_uses or len(ret) >= self.max_indexes:
+                break
+            cols = [self.tab.get_column(iden=i) for i in key]
+            if all(map(self._indexable, cols)):
+                ret.append(key)
+        return ret
+
+    def description(self):
+        """ -> human readable list of planned indexes """
+        ret = []
+        for key in self.plan():
+            names = [self.tab.get_column(iden=i).name for i in key]
+            ret.append('{} ({}, used {} times)'.format(
+                ', '.join(names), self.reasons[key], self.usage[key]))
+        return ret
+
+    # ---------------------- sql
+    def _existing(self):
+        """ -> {index name: (column names)} for advisor indexes """
+        qr = """SELECT name FROM sqlite_master
+                WHERE type='index' AND tbl_name='{}'""".format(
+            self.tab.ttab_name.replace("'", "''"))
+        self.tab.query(qr)
+        names = [x[0] for x in self.tab.qresults()
+                 if x[0].startswith(self.prefix)]
+        ret = {}
+        for nm in names:
+            self.tab.query('PRAGMA index_info("{}")'.format(nm))
+            ret[nm] = tuple(x[2] for x in self.tab.qresults())
+        return ret
+
+    def drop_indexes(self, colname):
+        """ drops advisor indexes which use sql column colname """
+        for nm, cols in self._existing().items():
+            if colname in cols:
+                self.tab.query('DROP INDEX "{}"'.format(nm))
+                self._synced = None
+
+    def sync(self):
+        """ creates and drops sql indexes according to current plan """
+        if self.tab.is_lazy():
+            # lazy table is a view on A database table
+            return
+        plan = self.plan()
+        state = (self.tab.ttab_name, self.tab._data_generation, plan)
+        if state == self._synced:
+            return
+        self._synced = state
+        if not plan and self.tab.n_total_rows() < self.min_rows:
+            # nothing could have been built for the small table
+            return
+        need = set()
+        for key in plan:
+            # sql table column names
+            need.add(tuple(self.tab.get_column(iden=i).sql_line()[1:-1]
+                           for i in key))
+        existing = self._existing()
+        for nm, cols in existing.items():
+            if cols not in need:
+                self.tab.query('DROP INDEX "{}"'.format(nm))
+                basic.log_message('Index on {} of "{}" was dropped'.format(
+                    cols, self.tab.name))
+        for cols in need.difference(existing.values()):
+            nm = '{}{} {}'.format(self.prefix, basic.uniint(),
+                                  self.tab.ttab_name)
+            self.tab.query('CREATE INDEX "{}" ON "{}" ({})'.format(
+                nm, self.tab.ttab_name,
+                ', '.join('"{}"'.format(c) for c in cols)))
+            basic.log_message('Index on {} of "{}" was created'.format(
+                cols, self.tab.name))
+        if need:
+            basic.log_message('Index plan of "{}": {}'.format(
+                self.tab.name, '; '.join(self.description())))
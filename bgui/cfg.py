@@ -30,7 +30,7 @@ class ViewConfig(object):
         # add some extra white space to make final icons smaller
         def add_w_space(pm, coef):
             height = pm.size().height()
-            delta = coef * height
+            delta = int(coef * height)
             pm2 = QtGui.QImage(height + 2*delta, height + 2*delta,
                                QtGui.QImage.Format_ARGB32_Premultiplied)
             pm2.fill(QtCore.Qt.transparent)
@@ -394,6 +394,7 @@ class ColumnOverview(QtWidgets.QGroupBox):
         self.layout().addWidget(self.e_distinct_list, i, 1)
 
     def calc(self, dt, column):
+        dt.sync_materialized()
         # n1: n total
         dt.query('SELECT COUNT(id) from "{}"'.format(dt.ttab_name))
         n1 = dt.qresult()[0]
@@ -18,10 +18,15 @@ def get_foreground(background):
     r = background.red()
     g = background.green()
     b = background.blue()
-    if luminocity((r, g, b)) < 140:
-        return QtGui.QColor(255, 255, 255)
+    return QtGui.QColor(*get_rgb_foreground((r, g, b)))
+
+
+def get_rgb_foreground(rgb):
+    """ get_foreground for (r, g, b) tuple """
+    if luminocity(rgb) < 140:
+        return (255, 255, 255)
     else:
-        return QtGui.QColor(0, 0, 0)
+        return (0, 0, 0)
 
 
 def get_group_color_light(igr):
@@ -64,6 +69,20 @@ class Coloring:
                 self._row_colors[irow] = self._calculate_color(irow)
             return self._row_colors[irow]
 
+    def rgb_colors(self):
+        """ -> [(r, g, b)] colors of all rows or None if coloring is off """
+        if not self.use:
+            return None
+        cache = {}
+        ret = []
+        for v in self._row_values:
+            try:
+                ret.append(cache[v])
+            except KeyError:
+                cache[v] = self.color_scheme.get_rgb_color(v)
+                ret.append(cache[v])
+        return ret
+
     def set_column(self, datatab, col):
         self.color_by = col.id
         self.dt_type = col.dt_type
@@ -97,8 +116,8 @@ class Coloring:
         if self.dt_type in ["REAL", "INT"]:
             # limits
             if not self.absolute_limits:
-                dd = [x for x in self._row_values if x is not None]
-                if not dd:
+                dd = self._row_values.compressed()
+                if dd.size == 0:
                     dd = [0]
                 self.limits[0] = min(dd)
                 self.limits[1] = max(dd)
@@ -107,16 +126,14 @@ class Coloring:
 
             # normalize self._row_values
             fl = self.limits[1] - self.limits[0]
-
-            def nrm(a):
-                if a is None:
-                    return None
-                elif fl == 0:
-                    return 0
-                else:
-                    return (a - self.limits[0])/fl
-            self._row_values = list(map(nrm, self._row_values))
+            if fl == 0:
+                nrm = self._row_values * 0
+            else:
+                nrm = (self._row_values - self.limits[0])/fl
+            # masked entries are converted to None
+            self._row_values = nrm.tolist()
         elif self.dt_type in ["BOOL", "ENUM", "TEXT"]:
+            self._row_values = self._row_values.tolist()
             dd = set([x for x in self._row_values if x is not None])
             if not dd:
                 anyval = next(iter(self._global_values_dictionary.keys()),
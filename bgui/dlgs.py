@@ -56,12 +56,15 @@ class ProgressProcedureDlg(QtWidgets.QDialog):
 
     emitter = QtCore.pyqtSignal('QString', 'QString', 'double', 'double')
 
-    def __init__(self, func, args, parent=None):
+    def __init__(self, func, args, parent=None, terminate=True):
         """ func(*args, callback_fun) - target procedure,
             callback_fun should be declared as
                 int callback_fun(QString BaseName, QString SubName,
                     double proc1, double proc2)
             it should return 1 for cancellation requiry and 0 otherwise
+            terminate - if False cancellation only makes callback_fun
+                return 1 and waits for the procedure to finish
+                its own cleanup. Otherwise the thread is terminated.
         """
         flags = QtCore.Qt.Dialog \
             | QtCore.Qt.CustomizeWindowHint \
@@ -90,6 +93,7 @@ class ProgressProcedureDlg(QtWidgets.QDialog):
         # worker
         self.emitter.connect(self._fill)
 
+        self._terminate = terminate
         self._worker = _BackGroundWorkerCB(self.emitter, func, args)
         self._worker.finished.connect(self._fin)
 
@@ -102,12 +106,15 @@ class ProgressProcedureDlg(QtWidgets.QDialog):
         self.setWindowTitle(n1)
         self._label1.setText(n1)
         self._label2.setText(n2)
-        self._progbar1.setValue(100 * p1)
-        self._progbar2.setValue(100 * p2)
+        self._progbar1.setValue(int(100 * p1))
+        self._progbar2.setValue(int(100 * p2))
 
     def _cancel_pressed(self):
         self._worker.proceed = False
-        self._worker.terminate()
+        if self._terminate:
+            self._worker.terminate()
+        else:
+            self._buttonbox.setEnabled(False)
 
     def _fin(self):
         self._result = self._worker._result
@@ -253,12 +260,14 @@ class ExportTablesDlg(SimpleAbstractDialog):
         obj.with_formatting = True
 
     def olist(self):
-        flt = [('Excel files', ('xlsx',))]
+        flt = [('Excel files', ('xlsx',)), ('CSV files', ('csv',)),
+               ('NumPy archives', ('npz',))]
         return optview.OptionsList([
             ("Export to", "Filename", optwdg.SaveFileOptionEntry(
                 self, "filename", flt)),
             ("Export to", "Format", optwdg.SingleChoiceOptionEntry(
-                self, "format", ["xlsx", "plain text"])),
+                self, "format", ["xlsx", "plain text", "csv", "npz",
+                                 "npy directory"])),
             ("Additional", "Include caption", optwdg.BoolOptionEntry(
                 self, "with_caption")),
             ("Additional", "Include id column", optwdg.BoolOptionEntry(
@@ -278,11 +287,18 @@ class ExportTablesDlg(SimpleAbstractDialog):
                 self.set_odata_entry('format', 'xlsx')
             elif self.odata().filename[-4:] == '.txt':
                 self.set_odata_entry('format', 'plain text')
+            elif self.odata().filename[-4:] == '.csv':
+                self.set_odata_entry('format', 'csv')
+            elif self.odata().filename[-4:] == '.npz':
+                self.set_odata_entry('format', 'npz')
 
     def _active_entries(self, entry):
-        if self.odata().format == "plain text":
+        if self.odata().format in ["plain text", "csv"]:
             if entry.member_name == "with_formatting":
                 return False
+        elif self.odata().format in ["npz", "npy directory"]:
+            # binary formats keep raw typed values
+            return entry.member_name in ["filename", "format", "with_id"]
         return True
 
     def accept(self):
@@ -489,6 +505,11 @@ class OptionsDlg(SimpleAbstractDialog):
         obj.basic_font_size = 10
         obj.show_bool_as = 'icons'
         obj.real_numbers_prec = 6
+        obj.view_cache_size = 64
+        obj.work_db = 'auto'
+        obj.work_db_limit = 1024
+        obj.max_undo_size = 1024
+        obj.undo_spill_size = 64
         obj.external_xlsx_editor = ''
         obj.external_txt_editor = ''
         obj.open_recent_db_on_start = True
@@ -498,6 +519,11 @@ class OptionsDlg(SimpleAbstractDialog):
         self.set_odata_entry('basic_font_size', o.basic_font_size)
         self.set_odata_entry('show_bool_as', o.show_bool_as)
         self.set_odata_entry('real_numbers_prec', o.real_numbers_prec)
+        self.set_odata_entry('view_cache_size', o.view_cache_size)
+        self.set_odata_entry('work_db', o.work_db)
+        self.set_odata_entry('work_db_limit', o.work_db_limit)
+        self.set_odata_entry('max_undo_size', o.max_undo_size)
+        self.set_odata_entry('undo_spill_size', o.undo_spill_size)
         self.set_odata_entry('external_xlsx_editor', o.external_xlsx_editor)
         self.set_odata_entry('external_txt_editor', o.external_txt_editor)
         self.set_odata_entry('open_recent_db_on_start',
@@ -511,6 +537,17 @@ class OptionsDlg(SimpleAbstractDialog):
                 self, "show_bool_as", ['icons', 'codes', 'Yes/No'])),
             ("Main table", "Real number digits", optwdg.BoundedIntOptionEntry(
                 self, "real_numbers_prec", minv=0)),
+            ("Data", "View cache size (Mb)", optwdg.BoundedIntOptionEntry(
+                self, "view_cache_size", minv=0)),
+            ("Data", "Working database", optwdg.SingleChoiceOptionEntry(
+                self, "work_db", ['memory', 'file', 'auto'])),
+            ("Data", "Move to file above (Mb)",
+                optwdg.BoundedIntOptionEntry(self, "work_db_limit", minv=0)),
+            ("Data", "Undo data size (Mb)",
+                optwdg.BoundedIntOptionEntry(self, "max_undo_size", minv=0)),
+            ("Data", "Move undo copies to file above (Mb)",
+                optwdg.BoundedIntOptionEntry(self, "undo_spill_size",
+                                             minv=0)),
             ("External programs", "Xlsx editor", optwdg.OpenFileOptionEntry(
                 self, "external_xlsx_editor", [])),
             ("External programs", "Text editor", optwdg.OpenFileOptionEntry(
@@ -609,6 +646,7 @@ class CovarMatDlg(_ColListChoiceDlg):
         "-> options struct with default values"
         obj.bias = 'population'
         obj.matsym = 'lower'
+        obj.missing = 'listwise'
         super()._default_odata(obj)
 
     def olist(self):
@@ -617,12 +655,15 @@ class CovarMatDlg(_ColListChoiceDlg):
                 self, "bias", ['population', 'sample'])),
             ("Options", "matrix type", optwdg.SingleChoiceOptionEntry(
                 self, "matsym", ['lower', 'upper', 'symmetrical'])),
+            ("Options", "missing values", optwdg.SingleChoiceOptionEntry(
+                self, "missing", ['listwise', 'pairwise'])),
             self.cat_olist()
             ])
 
     def ret_value(self):
-        "-> colnames, bias type, matrix type"
-        return (self._get_cat(), self.odata().bias, self.odata().matsym)
+        "-> colnames, bias type, matrix type, missing values"
+        return (self._get_cat(), self.odata().bias, self.odata().matsym,
+                self.odata().missing)
 
 
 @qtcommon.hold_position
@@ -634,18 +675,21 @@ class CorrMatDlg(_ColListChoiceDlg):
     def _default_odata(self, obj):
         "-> options struct with default values"
         obj.matsym = 'lower'
+        obj.missing = 'listwise'
         super()._default_odata(obj)
 
     def olist(self):
         return optview.OptionsList([
             ("Options", "matrix type", optwdg.SingleChoiceOptionEntry(
                 self, "matsym", ['lower', 'upper', 'symmetrical'])),
+            ("Options", "missing values", optwdg.SingleChoiceOptionEntry(
+                self, "missing", ['listwise', 'pairwise'])),
             self.cat_olist(),
             ])
 
     def ret_value(self):
-        "-> colnames, matrix type"
-        return (self._get_cat(), self.odata().matsym)
+        "-> colnames, matrix type, missing values"
+        return (self._get_cat(), self.odata().matsym, self.odata().missing)
 
 
 @qtcommon.hold_position
@@ -659,6 +703,7 @@ class NumFunctionDlg(_ColListChoiceDlg):
         "-> options struct with default values"
         obj.func = 'average'
         obj.before_grouping = True
+        obj.materialize = False
         obj.colname = '_auto_'
         super()._default_odata(obj)
 
@@ -675,6 +720,8 @@ class NumFunctionDlg(_ColListChoiceDlg):
                 self, "func", funlist)),
             ("Function", "use before grouping", optwdg.BoolOptionEntry(
                 self, "before_grouping")),
+            ("Function", "store values in table", optwdg.BoolOptionEntry(
+                self, "materialize")),
             self.cat_olist(),
             ])
 
@@ -688,7 +735,7 @@ class NumFunctionDlg(_ColListChoiceDlg):
 
     def ret_value(self):
         return (self._get_cat(), self.odata().colname, self.odata().func,
-                self.odata().before_grouping)
+                self.odata().before_grouping, self.odata().materialize)
 
 
 @qtcommon.hold_position
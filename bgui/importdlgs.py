@@ -50,9 +50,11 @@ class _ImportDialog(dlgs.OkCancelDialog):
         bbox.addButton(self.load_button, QtWidgets.QDialogButtonBox.NoRole)
         self.upper_frame.layout().addWidget(bbox)
 
-        # lower frame = table widget
+        # lower frame = source info + table widget
+        self.info_label = QtWidgets.QLabel(self)
         self.table = PreloadTable(self.proj, self.new_dictionaries, self)
         self.lower_frame.setLayout(QtWidgets.QVBoxLayout())
+        self.lower_frame.layout().addWidget(self.info_label)
         self.lower_frame.layout().addWidget(self.table)
 
     def get_init_tabname(self):
@@ -90,7 +92,11 @@ class _ImportDialog(dlgs.OkCancelDialog):
         raise NotImplementedError
 
     def draw_table(self, caps, tab):
-        self.table.load(caps, tab)
+        self.table.load(caps, tab, self.com.unique_values,
+                        self.com.type_info)
+        self.info_label.setText(
+            '{} rows (preview of {}), parsed at {:.0f} rows/s'.format(
+                self.com.n_rows, len(tab), self.com.rows_per_second))
 
     def get_table_name(self):
         return self.spec.odata().tabname
@@ -108,7 +114,7 @@ class _ImportDialog(dlgs.OkCancelDialog):
                 raise Exception("Column names should be unique.")
 
             self.com.opt.tabname = name
-            self.com.tab = self.table.model().get_tab()
+            self.com.columns = self.table.model().get_enabled_columns()
             self.com.caps = [c[0] for c in columns]
             self.com.tps = [c[1] for c in columns]
             self.com.dnames = [c[2] for c in columns]
@@ -135,6 +141,10 @@ class PreloadModel(QtCore.QAbstractTableModel):
         self.columns_dicts = []
         self.data_rows = 0
         self.data_columns = 0
+        # def(icol) -> unique values of the whole source column
+        self.unique_values = None
+        # [import_tab.ColumnTypeInfo] of the whole source columns
+        self.type_info = None
 
     def get_dictionary(self, dname):
         ret = self.proj.get_dictionary(dname)
@@ -144,10 +154,17 @@ class PreloadModel(QtCore.QAbstractTableModel):
                     return d
         assert False
 
-    def load(self, caps, tab):
+    def load(self, caps, tab, unique_values=None, type_info=None):
+        """ tab -- first rows of source data
+            unique_values -- def(icol) -> unique values of all rows
+            type_info -- [import_tab.ColumnTypeInfo] detected by all
+                source rows. If None types are detected by tab rows only.
+        """
         if len(tab) == 0 or len(tab[0]) == 0:
             raise Exception("No data were loaded.")
         self.beginResetModel()
+        self.unique_values = unique_values
+        self.type_info = type_info
         self.caps = caps if caps is not None else []
         self.tab = tab
         self.data_rows = len(self.tab)
@@ -162,7 +179,10 @@ class PreloadModel(QtCore.QAbstractTableModel):
         for i, c in enumerate(self.caps):
             if not c:
                 self.caps[i] = "Column {}".format(i + 1)
-        self.columns_format = import_tab.autodetect_types(self.tab)
+        if self.type_info is not None:
+            self.columns_format = [x.tp for x in self.type_info]
+        else:
+            self.columns_format = import_tab.autodetect_types(self.tab)
         self.endResetModel()
 
     def columnCount(self, index=None):   # noqa
@@ -197,6 +217,12 @@ class PreloadModel(QtCore.QAbstractTableModel):
                 except Exception:
                     return None
 
+        if role == QtCore.Qt.ToolTipRole:
+            if r == 1 and self.type_info is not None:
+                ti = self.type_info[c]
+                return "Detected {}: {} empty, {} non-numeric entries".format(
+                    ti.tp, ti.n_null, ti.n_invalid)
+
         if role == QtCore.Qt.CheckStateRole:
             if r == 0:
                 return QtCore.Qt.Checked if self.columns_enabled[c] else\
@@ -262,6 +288,8 @@ class PreloadModel(QtCore.QAbstractTableModel):
         return ret
 
     def get_unique_data_values(self, icol):
+        if self.unique_values is not None:
+            return self.unique_values(icol)
         s = set([x[icol] for x in self.tab if x[icol] is not None])
         return sorted(s)
 
@@ -274,17 +302,10 @@ class PreloadModel(QtCore.QAbstractTableModel):
                             self.columns_dicts[c]))
         return ret
 
-    def get_tab(self):
-        jreal = list(filter(lambda x: self.columns_enabled[x],
-                            range(self.columnCount())))
-
-        ret = [[None] * len(jreal) for _ in range(len(self.tab))]
-
-        for j, jr in enumerate(jreal):
-            for i in range(len(self.tab)):
-                ret[i][j] = self.data(self.index(i + 3, jr),
-                                      QtCore.Qt.DisplayRole)
-        return ret
+    def get_enabled_columns(self):
+        '-> [indices of enabled columns]'
+        return list(filter(lambda x: self.columns_enabled[x],
+                           range(self.columnCount())))
 
 
 class ComboboxDelegate(QtWidgets.QStyledItemDelegate):
@@ -385,8 +406,8 @@ class PreloadTable(QtWidgets.QTableView):
                 self.model().createIndex(0, column),
                 self.model().createIndex(self.model().rowCount(), column))
 
-    def load(self, caps, tab):
-        self.model().load(caps, tab)
+    def load(self, caps, tab, unique_values=None, type_info=None):
+        self.model().load(caps, tab, unique_values, type_info)
         self.resizeColumnsToContents()
 
 
@@ -426,7 +447,7 @@ class PlainTextOptions(optview.OptionsHolderInterface, QtWidgets.QFrame):
                 self, "read_cap")),
             ("Format", "Columns separator", optwdg.SingleChoiceEditOptionEntry(
                 self, "col_sep", ["whitespaces", "tabular", ",",
-                                  "in double quotes"])),
+                                  "in double quotes", "csv", "tsv"])),
             ("Format", "Max columns count", optwdg.BoundedIntOptionEntry(
                 self, "colcount", -1)),
             ("Format", "Row separator", optwdg.SingleChoiceEditOptionEntry(
@@ -511,3 +532,69 @@ class ImportXlsx(_ImportDialog):
     def load_table(self, opt):
         self.com = import_tab.ImportTabFromXlsx(self.proj, self.fn, opt)
         self.com._prebuild()
+
+
+@qtcommon.hold_position
+class BatchImportDlg(dlgs.SimpleAbstractDialog):
+    def __init__(self, proj, parent=None):
+        self.proj = proj
+        super().__init__("Batch import", parent)
+        self.resize(400, 400)
+
+    def _default_odata(self, obj):
+        "-> options struct with default values"
+        obj.source = ''
+        obj.format = "plain text files"
+        obj.merge = False
+        obj.tabname = 'merged'
+        obj.read_cap = True
+        obj.col_sep = "whitespaces"
+        obj.ignore_blank = True
+        obj.comment_sign = '#'
+
+    def olist(self):
+        return optview.OptionsList([
+            ("Import from", "Files pattern or xlsx file",
+                optwdg.SimpleOptionEntry(self, "source", dostrip=True)),
+            ("Import from", "Format", optwdg.SingleChoiceOptionEntry(
+                self, "format", ["plain text files", "xlsx sheets"])),
+            ("Import to", "Merge into single table", optwdg.BoolOptionEntry(
+                self, "merge")),
+            ("Import to", "Merged table name", optwdg.SimpleOptionEntry(
+                self, "tabname", dostrip=True)),
+            ("Format", "Caption from first row", optwdg.BoolOptionEntry(
+                self, "read_cap")),
+            ("Format", "Columns separator", optwdg.SingleChoiceEditOptionEntry(
+                self, "col_sep", ["whitespaces", "tabular", ",",
+                                  "in double quotes", "csv", "tsv"])),
+            ("Format", "Ignore empty lines", optwdg.BoolOptionEntry(
+                self, "ignore_blank")),
+            ("Format", "Comment sign", optwdg.SingleChoiceEditOptionEntry(
+                self, "comment_sign", ["", "#", "//", "*"])),
+            ])
+
+    def on_value_change(self, code):
+        if code == 'source':
+            if self.odata().source[-5:] == '.xlsx':
+                self.set_odata_entry('format', 'xlsx sheets')
+
+    def check_input(self):
+        self.ret_value()
+
+    def ret_value(self):
+        "-> import_tab.ImportTabsBatch"
+        od = self.odata()
+        opt = copy.deepcopy(od)
+        opt.tabname = ''
+        merge_name = od.tabname if od.merge else None
+        if od.format == "xlsx sheets":
+            opt.range = ''
+            return import_tab.ImportTabsBatch.from_sheets(
+                self.proj, od.source, opt, merge_name)
+        else:
+            opt.firstline = 0
+            opt.lastline = -1
+            opt.colcount = -1
+            opt.row_sep = "newline"
+            return import_tab.ImportTabsBatch.from_glob(
+                self.proj, od.source, opt, merge_name)
@@ -6,7 +6,6 @@ from bgui import tview
 from bgui import maincoms
 from bgui import matrixview
 from bmat import stats
-from bmat import npinterface
 from bdata import derived_tabs
 from fileproc import export
 
@@ -160,6 +159,30 @@ class ActImport(MainAct):
                 self.flow.exec_command(com)
 
 
+class ActBatchImport(MainAct):
+    def __init__(self, mainwin):
+        super().__init__(mainwin, 'Batch import...')
+
+    def do(self):
+        from bgui import importdlgs
+        dialog = importdlgs.BatchImportDlg(self.proj, self.mainwin)
+        if dialog.exec_():
+            try:
+                comimp = dialog.ret_value()
+                # sources are parsed in background with progress dialog,
+                # cancellation lets parse() stop its worker processes
+                pdlg = dlgs.ProgressProcedureDlg(comimp.parse, (),
+                                                 self.mainwin, False)
+                pdlg.exec_()
+                if not pdlg.get_result():
+                    return
+            except Exception as e:
+                qtcommon.message_exc(self.mainwin, "Import error", e=e)
+                return
+            com = maincoms.ComImportBatch(self.mainwin, comimp)
+            self.flow.exec_command(com)
+
+
 class ActExport(MainAct):
     def __init__(self, mainwin):
         super().__init__(mainwin, 'Export tables...',
@@ -631,6 +654,16 @@ class ActRedo(MainAct):
         self.flow.exec_next()
 
 
+def _check_pairs_data(acc, colnames):
+    """ raises if any pair of columns has less than two common values """
+    if len(colnames) < 2:
+        raise Exception("No enough data")
+    pairs = acc.missing_pairs()
+    if pairs:
+        raise Exception("No enough data for: {}".format(', '.join(
+            '{}/{}'.format(colnames[i], colnames[j]) for i, j in pairs)))
+
+
 class ActCovarianceMatrix(MainAct):
     def __init__(self, mainwin):
         super().__init__(mainwin, "Covariance matrix")
@@ -653,16 +686,13 @@ class ActCovarianceMatrix(MainAct):
         dialog = dlgs.CovarMatDlg(self.mainwin, used_cols, all_cols, tp)
         if dialog.exec_():
             try:
-                colnames, bias, mtype = dialog.ret_value()
+                colnames, bias, mtype, missing = dialog.ret_value()
                 if mtype.startswith('sym'):
                     mtype = 'both'
-                mat = npinterface.mat_raw_values(self.amodel().dt, colnames)
-                if len(mat) < 2 or len(mat[0]) < 2:
-                    raise Exception("No enough data")
-                if bias == 'population':
-                    cm = stats.population_covariance_matrix(mat)
-                else:
-                    cm = stats.sample_covariance_matrix(mat)
+                acc = stats.stream_covariance(self.amodel().dt, colnames,
+                                              missing == 'pairwise')
+                _check_pairs_data(acc, colnames)
+                cm = acc.covariance(bias == 'population')
                 w = matrixview.MatrixView("Covariance matrix", self.mainwin,
                                           cm, colnames, colnames, sym=mtype)
                 self.mainwin.add_subwindow(w)
@@ -709,15 +739,20 @@ class ActCorrelationMatrix(MainAct):
         tp = [self.amodel().dt.get_column(x).col_type() for x in all_cols]
         dialog = dlgs.CorrMatDlg(self.mainwin, used_cols, all_cols, tp)
         if dialog.exec_():
-            colnames, mtype = dialog.ret_value()
-            if mtype.startswith('sym'):
-                mtype = 'both'
-            mat = npinterface.mat_raw_values(self.amodel().dt, colnames)
-            cm = stats.correlation_matrix(mat)
-            w = matrixview.MatrixView("Correlation matrix", self.mainwin,
-                                      cm, colnames, colnames, sym=mtype)
-            self.mainwin.add_subwindow(w)
-            w.show()
+            try:
+                colnames, mtype, missing = dialog.ret_value()
+                if mtype.startswith('sym'):
+                    mtype = 'both'
+                acc = stats.stream_covariance(self.amodel().dt, colnames,
+                                              missing == 'pairwise')
+                _check_pairs_data(acc, colnames)
+                cm = acc.correlation()
+                w = matrixview.MatrixView("Correlation matrix", self.mainwin,
+                                          cm, colnames, colnames, sym=mtype)
+                self.mainwin.add_subwindow(w)
+                w.show()
+            except Exception as e:
+                qtcommon.message_exc(self.mainwin, 'Error', e=e)
 
 
 class HierClustering(MainAct):
@@ -756,9 +791,9 @@ class ActNumFunction(MainAct):
         dialog = dlgs.NumFunctionDlg(
                 self.mainwin, used_cols, all_cols, tps, self.amodel().dt)
         if dialog.exec_():
-            colnames, newname, func, bg = dialog.ret_value()
+            colnames, newname, func, bg, mat = dialog.ret_value()
             com = maincoms.ComNumFunctionColumn(
-                    self.amodel(), newname, colnames, func, bg)
+                    self.amodel(), newname, colnames, func, bg, mat)
             self.flow.exec_command(com)
 
 
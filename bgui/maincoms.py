@@ -124,6 +124,32 @@ class ComImport(command.Command):
         self.acts.clear()
 
 
+class ComImportBatch(command.Command):
+    def __init__(self, mainwin, comimp):
+        """ comimp -- import_tab.ImportTabsBatch """
+        super().__init__(mw=mainwin, com=comimp)
+        self.acts = []
+
+    def _exec(self):
+        self.acts.append(command.ActFromCommand(self.com))
+        self.acts[-1].redo()
+        for dt in self.com.tables():
+            self.acts.append(ActAddModel(self.mw, dt, True))
+            self.acts[-1].redo()
+        return True
+
+    def _undo(self):
+        for a in reversed(self.acts):
+            a.undo()
+
+    def _redo(self):
+        for a in self.acts:
+            a.redo()
+
+    def _clear(self):
+        self.acts.clear()
+
+
 class ComSaveDB(command.Command):
     def __init__(self, mainwin, fname):
         super().__init__(mw=mainwin, fname=fname)
@@ -596,10 +622,10 @@ class ComSetFilters(command.Command):
 
 
 class ComNumFunctionColumn(command.Command):
-    def __init__(self, model, name, colnames, func, bg):
+    def __init__(self, model, name, colnames, func, bg, materialize=False):
         super().__init__()
         self.act = command.ActFromCommand(funccol.NumFunctionColumn(
-            model.dt, name, colnames, func, bg))
+            model.dt, name, colnames, func, bg, materialize))
         self.act_update = ActModelUpdate(model)
 
     def _exec(self):
@@ -111,6 +111,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.filemenu.addAction(self.acts['Save as...'])
         self.filemenu.addSeparator()
         self.filemenu.addAction(self.acts['Import tables...'])
+        self.filemenu.addAction(self.acts['Batch import...'])
         self.filemenu.addAction(self.acts['Export tables...'])
         self.filemenu.addAction(self.acts['Open table in external viewer'])
         self.filemenu.addSeparator()
@@ -414,6 +415,12 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def reload_options(self):
         from bgui import cfg
+        from bdata import dtab
+
+        dtab.DataTable.view_cache_budget = self.opts.view_cache_size * 2**20
+        self.proj.sql.set_work_db(self.opts.work_db, self.opts.work_db_limit)
+        self.proj.sql.undo_spill_size = self.opts.undo_spill_size * 2**20
+        self.flow.set_max_undo_bytes(self.opts.max_undo_size * 2**20)
 
         cfg.ViewConfig.set_real_precision(self.opts.real_numbers_prec)
         cfg.ViewConfig.get()._basic_font_size = self.opts.basic_font_size
@@ -218,7 +218,7 @@ class TabModel(QtCore.QAbstractTableModel):
             return 'D'
 
     def row_min_id(self, irow):
-        return self.dt.tab.rows[irow-2].id
+        return self.dt.tab.get_id(irow-2)
 
     def column_role(self, index):
         """ I-id, C-category, D-data """
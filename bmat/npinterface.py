@@ -27,6 +27,65 @@ def mat_raw_values(dt, colnames, cols_to_rows=True, rowind=False):
             return ret[notnone]
 
 
+def iter_float_chunks(dt, colnames, chunk_size):
+    ''' yields (rows, len(colnames)) float64 arrays of view data
+        read from the cursor by chunk_size rows. NULL values are NaN.
+    '''
+    colslist = [dt.get_column(x) for x in colnames]
+    qr = dt._compile_query(colslist, status_adds=False, group_adds=False)
+    for rows in dt.proj.sql.fetch_chunks(qr, chunk_size):
+        ret = np.empty((len(rows), len(colslist)), dtype=np.float64,
+                       order='F')
+        for j in range(len(colslist)):
+            ret[:, j] = np.fromiter(
+                (np.nan if r[j] is None else r[j] for r in rows),
+                dtype=np.float64, count=len(rows))
+        yield ret
+
+
+def mat_float_values(dt, colnames, cols_to_rows=True, rowind=False,
+                     drop_missing=True, order='C', chunk_size=None):
+    ''' float64 analog of mat_raw_values.
+        Values of each column are written directly into a preallocated
+        buffer, NULL values become NaN.
+        drop_missing -- whether to remove rows which contain NaN values,
+        order -- 'C' or 'F' memory layout of the result,
+        chunk_size -- if not None rows are read from the cursor
+                      by chunks of this size.
+    '''
+    dt.query(dt._compile_count_query())
+    n = dt.qresult()[0]
+    if cols_to_rows:
+        ret = np.empty((len(colnames), n), dtype=np.float64, order=order)
+        dst = ret
+    else:
+        ret = np.empty((n, len(colnames)), dtype=np.float64, order=order)
+        dst = ret.T
+
+    i0 = i1 = 0
+    for chunk in iter_float_chunks(dt, colnames, chunk_size or max(n, 1)):
+        i1 = i0 + len(chunk)
+        if i1 > n:
+            break
+        dst[:, i0:i1] = chunk.T
+        i0 = i1
+    if i1 != n:
+        raise Exception("Rows of {} view do not match its count {}".format(
+            dt.table_name(), n))
+
+    if drop_missing:
+        valid = ~np.isnan(dst).any(axis=0)
+        if not valid.all():
+            ret = ret[:, valid] if cols_to_rows else ret[valid]
+            ret = np.require(ret, requirements=order)
+    else:
+        valid = np.ones(n, dtype=bool)
+    if rowind:
+        return ret, np.where(valid)[0] + 1
+    else:
+        return ret
+
+
 def serialize_array(a):
     assert isinstance(a, np.ndarray)
     assert a.dtype.name in ['int64', 'float64']
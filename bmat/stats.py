@@ -1,6 +1,4 @@
 import numpy as np
-import scipy
-import scipy.stats
 from bmat import npinterface
 
 
@@ -16,47 +14,87 @@ def correlation_matrix(mat):
     return np.corrcoef(mat)
 
 
-def linear_regression(x, y):
-    """ f = a*x + b,
-        returns a, b, stderr, slopeerr, corr. coeff
+class CovarianceAccumulator:
+    """ Streaming covariance of k variables.
+        Chunks of (rows, k) observations with NaN for missing values are
+        added one by one; partial accumulators (f.e. computed in other
+        processes) are combined by merge(). Only O(k^2) memory is used.
+
+        pairwise=True: statistics of each pair of variables use all rows
+        where both values are present; otherwise rows with any missing
+        value are ignored.
     """
-    if np.size(x) < 2:
-        return (None,)*5
-    r = scipy.stats.linregress(x, y)
-    xr = scipy.polyval([r.slope, r.intercept], x)
-    err = np.sqrt(np.sum((xr - y)**2)/np.size(x))
-    return r.slope, r.intercept, err, r.stderr, r.rvalue
+    def __init__(self, k, pairwise=True):
+        self.pairwise = pairwise
+        # [i, j] -> number of rows where i and j are present
+        self.n = np.zeros((k, k))
+        # [i, j] -> mean of i over rows where i and j are present
+        self.mean = np.zeros((k, k))
+        # [i, j] -> sum of (x_i - mean[i, j]) * (x_j - mean[j, i])
+        self.comoment = np.zeros((k, k))
+        # [i, j] -> sum of (x_i - mean[i, j])**2
+        self.sqdev = np.zeros((k, k))
+
+    def add(self, chunk):
+        """ chunk -- (rows, k) float array """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        valid = ~np.isnan(chunk)
+        if not self.pairwise:
+            rows = valid.all(axis=1)
+            chunk, valid = chunk[rows], valid[rows]
+        if len(chunk) == 0:
+            return
+        # shift by column means for numerical stability
+        cnt = valid.sum(axis=0)
+        shift = np.where(valid, chunk, 0).sum(axis=0) / np.maximum(cnt, 1)
+        v = valid.astype(np.float64)
+        x = np.where(valid, chunk - shift, 0)
+        n = v.T @ v
+        with np.errstate(invalid='ignore', divide='ignore'):
+            m = np.where(n > 0, (x.T @ v) / n, 0)
+        c = x.T @ x - n * m * m.T
+        sq = (x * x).T @ v - n * m * m
+        self._merge(n, m + shift[:, None], c, sq)
+
+    def merge(self, other):
+        """ adds statistics of other accumulator """
+        self._merge(other.n, other.mean, other.comoment, other.sqdev)
+
+    def _merge(self, n, mean, comoment, sqdev):
+        tot = self.n + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            w = np.where(tot > 0, self.n * n / tot, 0)
+            d = mean - self.mean
+            self.mean = np.where(tot > 0, self.mean + d * n / tot, 0)
+        self.comoment = self.comoment + comoment + d * d.T * w
+        self.sqdev = self.sqdev + sqdev + d * d * w
+        self.n = tot
+
+    def missing_pairs(self, min_count=2):
+        """ -> [(i, j)], i <= j: pairs of variables
+               which have less than min_count common values
+        """
+        i, j = np.nonzero(np.triu(self.n < min_count))
+        return list(zip(i.tolist(), j.tolist()))
 
+    def covariance(self, bias=True):
+        """ -> (k, k) covariance matrix. NaN for not enough data """
+        dof = self.n if bias else self.n - 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(dof > 0, self.comoment / dof, np.nan)
 
-def log_regression(xin, yin):
-    """ f = a*ln(x) + b,
-        returns a, b, stderr, slopeerr, corr. coeff
-    """
-    x, y = xin[xin > 0], yin[xin > 0]
-    if np.size(x) < 2:
-        return (None,)*5
-    logx = np.log(x)
-    r = scipy.stats.linregress(logx, y)
-    xr = scipy.polyval([r.slope, r.intercept], logx)
-    err = np.sqrt(np.sum((xr - y)**2)/np.size(x))
-    return r.slope, r.intercept, err, r.stderr, r.rvalue
-
-
-def power_regression(xin, yin):
-    """ f = b*(x^a)
-        returns a, b, stderr, slopeerr, corr. coeff
-    """
-    minxy = np.array([xin, yin]).min(axis=0)
-    x, y = xin[minxy > 0], yin[minxy > 0]
-    if np.size(x) < 2:
-        return (None,)*5
-    logx, logy = np.log(x), np.log(y)
-    r = scipy.stats.linregress(logx, logy)
-    a = r.slope
-    b = np.exp(r.intercept)
-    xr = b*(x**a)
-    err = np.sqrt(sum((xr - y)**2)/np.size(x))
-    return a, b, err, r.stderr, r.rvalue
+    def correlation(self):
+        """ -> (k, k) correlation matrix. NaN for not enough data """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.comoment / np.sqrt(self.sqdev * self.sqdev.T)
+
+
+def stream_covariance(dt, colnames, pairwise=True, chunk_size=100000):
+    """ -> CovarianceAccumulator filled by view data of dt columns """
+    ret = CovarianceAccumulator(len(colnames), pairwise)
+    for chunk in npinterface.iter_float_chunks(dt, colnames, chunk_size):
+        ret.add(chunk)
+    return ret
 
 
 def hierarchical_linkage(mat, method):
@@ -84,7 +122,7 @@ class HierarchicalLinkage:
         if self._used_method == method:
             return
         self._used_method = method
-        self.mat, self.rowid = npinterface.mat_raw_values(
+        self.mat, self.rowid = npinterface.mat_float_values(
                 self.dt, self.colnames, cols_to_rows=False, rowind=True)
         self.linkage = hierarchical_linkage(self.mat, method)
 
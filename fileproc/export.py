@@ -1,5 +1,16 @@
+import os
+import csv
+import json
+import numpy as np
 from prog import bsqlproc
+from bdata import dtab
 import openpyxl as pxl
+from openpyxl.cell import WriteOnlyCell
+
+# number of rows read from the sql cursor at once
+export_chunk_size = 10000
+# size of the output file buffer in bytes
+export_buffer_size = 2**20
 
 
 def model_export(datatab, opt, model=None, view=None):
@@ -8,105 +19,237 @@ def model_export(datatab, opt, model=None, view=None):
     """
     if opt.format == 'plain text':
         return plain_text_export(datatab, opt)
+    elif opt.format == 'csv':
+        return csv_export(datatab, opt)
     elif opt.format == 'xlsx':
         return xlsx_export(datatab, opt, model, view)
+    elif opt.format == 'npz':
+        return npz_export(datatab, opt)
+    elif opt.format == 'npy directory':
+        return npy_dir_export(datatab, opt)
     else:
         raise NotImplementedError
 
 
-def _get_data_lines(datatab, opt):
-    lines = []
+def _iter_data_chunks(datatab, opt):
+    """ yields lists of exported rows. Rows are read from the sql cursor
+        by export_chunk_size; caption is the first row of the first chunk.
+    """
+    vc = datatab.n_cols()
+    j0 = 0 if opt.with_id else 1
     if opt.with_caption:
-        lines.append([datatab.column_caption(i)
-                      for i in range(datatab.n_cols())])
-
-    for i in range(datatab.n_rows()):
-        rvals = [None]*datatab.n_cols()
-        for j, col in enumerate(datatab.visible_columns):
-            rvals[j] = datatab.tab.get_value(i, j)
+        yield [[datatab.column_caption(i) for i in range(j0, vc)]]
 
-            if rvals[j] is not None and not opt.numeric_enums:
-                rvals[j] = col.repr(rvals[j])
+    qr = datatab.compile_export_query(
+        not opt.numeric_enums,
+        opt.grouped_categories == 'Comma separated')
+    # visible categories could have no common value within a group
+    cats = [j for j, c in enumerate(datatab.visible_columns)
+            if c.is_category()] if datatab.group_by else []
+    nc = len(cats)
+    for rows in datatab.proj.sql.fetch_chunks(qr, export_chunk_size):
+        if cats:
+            rows = [_group_row(r, vc, cats, opt.grouped_categories)
+                    if r[vc + nc] > 1 else r for r in rows]
+        yield [r[j0:vc] for r in rows]
 
-            if rvals[j] is None and col.is_category() and\
-                    datatab.n_subrows(i) > 1:
-                if opt.grouped_categories == 'Comma separated':
-                    vals = datatab.get_raw_subvalues(i, j)
-                    if not opt.numeric_enums:
-                        vals = map(col.repr, vals)
-                    rvals[j] = ','.join(map(str, vals))
-                elif opt.grouped_categories == 'Unique count':
-                    n_uni = datatab.n_subdata_unique(i, j)
-                    rvals[j] = bsqlproc.group_repr(n_uni)
-                elif opt.grouped_categories == 'None':
-                    rvals[j] = ''
 
-        lines.append(rvals)
+def _group_row(r, vc, cats, mode):
+    r, nc = list(r), len(cats)
+    for k, j in enumerate(cats):
+        if r[j] is not None:
+            continue
+        if mode == 'Comma separated':
+            r[j] = r[vc + nc + 1 + k]
+        elif mode == 'Unique count':
+            r[j] = bsqlproc.group_repr(r[vc + k])
+        elif mode == 'None':
+            r[j] = ''
+    return r
 
-    if not opt.with_id:
-        lines = [x[1:] for x in lines]
 
-    return lines
+def _str_rows(chunk):
+    """ -> rows of strings. Formatting is done column by column. """
+    cols = [['' if x is None else str(x) for x in c] for c in zip(*chunk)]
+    return zip(*cols)
 
 
 def plain_text_export(datatab, opt):
-    lines = _get_data_lines(datatab, opt)
+    with open(opt.filename, 'w', buffering=export_buffer_size) as fid:
+        for chunk in _iter_data_chunks(datatab, opt):
+            fid.writelines('\t'.join(x) + '\n' for x in _str_rows(chunk))
 
-    if not opt.with_id:
-        lines = [x[1:] for x in lines]
-    lines = ['\t'.join(map(str, x)) + '\n' for x in lines]
 
-    with open(opt.filename, 'w') as fid:
-        fid.writelines(lines)
-    fid.close()
+def csv_export(datatab, opt):
+    with open(opt.filename, 'w', newline='',
+              buffering=export_buffer_size) as fid:
+        writer = csv.writer(fid)
+        for chunk in _iter_data_chunks(datatab, opt):
+            writer.writerows(chunk)
 
 
-def xlsx_export(datatab, opt, model, view):
-    lines = _get_data_lines(datatab, opt)
+def _column_arrays(datatab, opt):
+    """ -> (header, {array name: array}) of binary export.
+        Each exported column i gives arrays
+            'c{i}' -- values: float64 with NaN for REAL,
+                      int64 for INT, ENUM (keys), BOOL (keys),
+                      unicode for TEXT,
+            'c{i}_null', 'c{i}_status' -- packed bitmaps of NULL values
+                      and red status (np.unpackbits(a)[:n_rows]).
+        Header describes columns and dictionaries of ENUM, BOOL keys.
+    """
+    cols = datatab.visible_columns[0 if opt.with_id else 1:]
+    j0 = datatab.n_cols() - len(cols)
+    vc = datatab.n_cols()
+    qr = datatab._compile_query(status_adds=True, group_adds=False)
+    # [(data, null mask, status)] chunks for each column
+    chunks = [[] for _ in cols]
+    for rows in datatab.proj.sql.fetch_chunks(qr, export_chunk_size):
+        for j, (c, lst) in enumerate(zip(cols, chunks)):
+            d, m = dtab.ViewedData._column_buffer(
+                [r[j0 + j] for r in rows], c.dt_type)
+            st = np.fromiter((bool(r[vc + j0 + j]) for r in rows),
+                             dtype=bool, count=len(rows))
+            lst.append((d, m, st))
 
-    wb = pxl.Workbook()
-    ws1 = wb.active
-    ws1.title = datatab.table_name()
-    for line in lines:
-        ws1.append(list(line))
+    header = {'n_rows': 0, 'columns': []}
+    arrays = {}
+    for i, (c, lst) in enumerate(zip(cols, chunks)):
+        if lst:
+            d, m, st = [np.concatenate(x) for x in zip(*lst)]
+        else:
+            d, m, st = np.array([]), np.zeros(0, bool), np.zeros(0, bool)
+        if c.dt_type == 'REAL':
+            d = d.astype(np.float64)
+            d[m] = np.nan
+        elif c.dt_type == 'TEXT':
+            d = np.array(['' if x is None else str(x) for x in d], dtype=str)
+        else:
+            d = d.astype(np.int64)
+        header['n_rows'] = len(d)
+        key = 'c{}'.format(i)
+        arrays[key] = d
+        arrays[key + '_null'] = np.packbits(m)
+        arrays[key + '_status'] = np.packbits(st)
+        cinfo = {'name': c.name, 'type': c.dt_type, 'array': key}
+        if c.dt_type in ['ENUM', 'BOOL']:
+            cinfo['dictionary'] = [
+                [k, v] for k, v in c.repr_delegate.dict.kvalues.items()]
+        header['columns'].append(cinfo)
+    return header, arrays
+
+
+def npz_export(datatab, opt):
+    """ uncompressed npz with header json in 'header' entry """
+    header, arrays = _column_arrays(datatab, opt)
+    arrays['header'] = np.array(json.dumps(header))
+    with open(opt.filename, 'wb') as fid:
+        np.savez(fid, **arrays)
+
+
+def npy_dir_export(datatab, opt):
+    """ directory with header.json and npy file for each array.
+        Arrays could be opened by np.load(fn, mmap_mode='r')
+    """
+    header, arrays = _column_arrays(datatab, opt)
+    os.makedirs(opt.filename, exist_ok=True)
+    for k, v in arrays.items():
+        np.save(os.path.join(opt.filename, k + '.npy'), v)
+    with open(os.path.join(opt.filename, 'header.json'), 'w') as fid:
+        json.dump(header, fid, indent=1)
+
+
+class _XlsxStyles:
+    """ Cell styles of formatted xlsx export cached by
+        (foreground, background, font) key. Colors are 'RRGGBB' strings.
+    """
+    def __init__(self, ws, model):
+        from PyQt5 import QtGui
+        from bgui import coloring
+        self.ws = ws
+        self._foreground = coloring.get_rgb_foreground
+        self.caption_fg = QtGui.QPalette().color(
+            QtGui.QPalette.WindowText).name()[1:].upper()
+        self.caption_bg = model.conf.caption_color.name()[1:].upper()
+        self.fonts = {'caption': model.conf.subcaption_font(),
+                      'data': model.conf.data_font()}
+        # key -> (font, fill)
+        self._cache = {}
+
+    def _style(self, key):
+        """ -> (font, fill or None) """
+        fg, bg, font = key
+        ft = self.fonts[font]
+        if bg is None:
+            return pxl.styles.Font(sz=ft.pointSize()), None
+        clr = pxl.styles.colors.Color(rgb=bg)
+        fill = pxl.styles.fills.PatternFill(patternType='solid', fgColor=clr)
+        font = pxl.styles.Font(sz=ft.pointSize(), color=fg,
+                               italic=ft.italic(), bold=ft.bold())
+        return font, fill
+
+    def cell(self, value, fg, bg, font):
+        key = (fg, bg, font)
+        try:
+            style = self._cache[key]
+        except KeyError:
+            style = self._cache[key] = self._style(key)
+        ret = WriteOnlyCell(self.ws, value)
+        ret.font = style[0]
+        if style[1] is not None:
+            ret.fill = style[1]
+        return ret
 
+    def caption_row(self, line):
+        return [self.cell(v, self.caption_fg, self.caption_bg, 'caption')
+                for v in line]
+
+    def data_row(self, line, rgb, with_id):
+        """ rgb -- row color or None """
+        if rgb is None:
+            fg = bg = None
+        else:
+            bg = '{:02X}{:02X}{:02X}'.format(*rgb)
+            fg = '{:02X}{:02X}{:02X}'.format(*self._foreground(rgb))
+        ret = [self.cell(v, fg, bg, 'data') for v in line]
+        if with_id:
+            ret[0] = self.cell(line[0], self.caption_fg, self.caption_bg,
+                               'data')
+        return ret
+
+
+def xlsx_export(datatab, opt, model, view):
+    wb = pxl.Workbook(write_only=True)
+    ws1 = wb.create_sheet(datatab.table_name())
+    styles = None
     if opt.with_formatting and model is not None:
-        from bgui import tmodel
-        from PyQt5 import QtCore
-        for i, row in enumerate(ws1.rows):
-            for j, cell in enumerate(row):
-                ir, jr = i + 2, j + 1
-                if opt.with_caption:
-                    ir -= 1
-                if opt.with_id:
-                    jr -= 1
-                index = model.createIndex(ir, jr)
-                ft = model.data(index, QtCore.Qt.FontRole)
-                if model.use_coloring() or ir < 2 or jr < 1:
-                    # 1) colors
-                    fg, bg = model.data(index, tmodel.TabModel.ColorsRole)
-                    clr = pxl.styles.colors.Color(rgb=bg.name()[1:])
-                    my_fill = pxl.styles.fills.PatternFill(
-                            patternType='solid', fgColor=clr)
-                    cell.fill = my_fill
-                    # 2) fonts
-                    pft = pxl.styles.Font(
-                            sz=ft.pointSize(), color=fg.name()[1:],
-                            italic=ft.italic(), bold=ft.bold())
-                    cell.font = pft
-                else:
-                    pft = pxl.styles.Font(sz=ft.pointSize())
-                    cell.font = pft
-
-        # 3) cell sizes
+        styles = _XlsxStyles(ws1, model)
+        # row colors of all viewed rows
+        colors = model.coloring.rgb_colors()
+        # cell sizes should be set before any row is written
         if view is not None:
-            for i, col in enumerate(ws1.iter_cols(max_row=1)):
-                n = col[0].column
+            j0 = 0 if opt.with_id else 1
+            for i in range(j0, datatab.n_cols()):
                 w = view.horizontalHeader().sectionSize(i)
+                n = pxl.utils.get_column_letter(i - j0 + 1)
                 ws1.column_dimensions[n].width = w / 5.54
-            h = view.verticalHeader().sectionSize(1)
-            for i, row in enumerate(ws1.iter_rows(max_col=1)):
-                ws1.row_dimensions[i+1].height = h
+            ws1.sheet_format.defaultRowHeight = \
+                view.verticalHeader().sectionSize(1)
+            ws1.sheet_format.customHeight = True
+
+    irow = -1 if opt.with_caption else 0
+    for chunk in _iter_data_chunks(datatab, opt):
+        if styles is None:
+            for line in chunk:
+                ws1.append(list(line))
+            continue
+        for line in chunk:
+            if irow < 0:
+                ws1.append(styles.caption_row(line))
+            else:
+                rgb = colors[irow] if colors is not None else None
+                ws1.append(styles.data_row(line, rgb, opt.with_id))
+            irow += 1
 
     wb.save(opt.filename)
 
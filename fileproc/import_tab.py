@@ -1,157 +1,311 @@
+import os
+import copy
+import glob
+import codecs
+import collections
+import concurrent.futures
+import csv
+import functools
+import itertools
+import locale
+import multiprocessing
+import pickle
+import tempfile
+import time
+import numpy as np
 import openpyxl as pxl
 from prog import basic
+from prog import command
 from prog import comproj
 from bdata import bcol
 from bdata import dtab
 
 
-def split_plain_text(fname, options):
-    """ used options attributes:
-            firstline, lastline, comment_sign, ignore_blank, row_sep, col_sep
-            colcount.
-        returns equal column size 2d array of stripped text entries
+# encodings which are tried for text files in order of preference
+text_encodings = ['utf8', 'windows-1250', 'windows-1252']
+
+
+def detect_encoding(fname, blocksize=2**20):
+    """ -> first encoding from text_encodings which decodes the whole file
+        or None if there is no such encoding.
+        File is read by blocks, so memory usage is bounded by blocksize.
     """
-    lines = None
-    for e in ['utf8', 'unicode', 'windows-1250', 'windows-1252']:
+    for e in text_encodings:
+        dec = codecs.getincrementaldecoder(e)()
         try:
-            with open(fname, 'r', encoding=e) as f:
-                lines = f.readlines()
-        except Exception as e:
-            basic.ignore_exception(e=e)
+            with open(fname, 'rb') as f:
+                for b in iter(lambda: f.read(blocksize), b''):
+                    dec.decode(b)
+                dec.decode(b'', final=True)
+        except UnicodeDecodeError as ex:
+            basic.ignore_exception(e=ex)
         else:
-            break
-    if lines is None:
-        # try without encoding to raise Exception
-        with open(fname, 'r') as f:
-            lines = f.readlines()
+            return e
+    return None
 
-    # firstline-lastline
-    firstline = max(0, options.firstline - 1)
-    lastline = options.lastline if options.lastline > 0 else len(lines)-1
-    lines = lines[firstline:lastline+1]
-    # remove text after comments
-    if options.comment_sign:
-        for i, line in enumerate(lines):
-            pos = line.find(options.comment_sign)
-            if pos >= 0:
-                lines[i] = line[:pos]
-    # remove blank lines
-    if options.ignore_blank:
-        lines = list(filter(lambda x: len(x.strip()) > 0, lines))
 
-    # reassemble lines if row separator is not a new line
-    if options.row_sep != "newline":
-        lines = " ".join(lines)
-        if options.row_sep != "no (use column count)":
-            lines = lines.split(options.row_sep)
-        else:
-            lines = [lines]
+def text_encoding(fname):
+    """ -> encoding of plain text file. Falls back to the default
+           encoding of open() if none of text_encodings fits.
+    """
+    return detect_encoding(fname) or locale.getpreferredencoding(False)
+
 
-    # assemble columns
+def _split_stream(pieces, sep):
+    """ splits concatenation of space joined text pieces by sep """
+    buf = None
+    for p in pieces:
+        buf = p if buf is None else buf + " " + p
+        parts = buf.split(sep)
+        yield from parts[:-1]
+        buf = parts[-1]
+    if buf is not None:
+        yield buf
+
+
+def _split_columns(line, options):
     if options.col_sep == 'whitespaces':
-        for i, line in enumerate(lines):
-            lines[i] = line.split()
+        return line.split()
     elif options.col_sep == 'tabular':
-        for i, line in enumerate(lines):
-            lines[i] = line.split('\t')
+        return line.split('\t')
     elif options.col_sep == 'in double quotes':
-        for i, line in enumerate(lines):
-            lines[i] = line.split('"')[1::2]
+        return line.split('"')[1::2]
     else:
-        for i, line in enumerate(lines):
-            lines[i] = line.split(options.col_sep)
+        return line.split(options.col_sep)
 
-    if len(lines) == 0:
-        raise Exception("No data were loaded")
 
-    # row split by column count
-    if options.row_sep == "no (use column count)":
-        lines2 = [lines[0][x:x+options.colcount]
-                  for x in range(0, len(lines[0]), options.colcount)]
-        lines = lines2
+# column separators which use csv parsing with quoted values
+csv_separators = {'csv': ',', 'tsv': '\t'}
 
-    # equal column count
-    if options.colcount <= 0:
-        cc = max([len(x) for x in lines])
-    else:
-        cc = options.colcount
-    for i, line in enumerate(lines):
-        if len(line) > cc:
-            lines[i] = line[:cc]
-        elif len(line) < cc:
-            lines[i] = line + [""] * (cc - len(line))
 
-    # final strip
-    for line in lines:
-        for j, x in enumerate(line):
-            line[j] = x.strip()
-    return lines
+def _csv_rows(lines, options):
+    """ rows of csv records. Only records whose first value starts with
+        a comment sign are treated as comments, so multiline values
+        are never broken by comment filtering.
+    """
+    rows = csv.reader(lines, delimiter=csv_separators[options.col_sep],
+                      quotechar='"', doublequote=True,
+                      skipinitialspace=True, strict=False)
+    if options.comment_sign:
+        sign = options.comment_sign
+        rows = (x for x in rows
+                if not (x and x[0].lstrip().startswith(sign)))
+    if options.ignore_blank:
+        rows = (x for x in rows if any(y.strip() for y in x))
+    return rows
+
+
+def _plain_text_rows(fname, options, encoding):
+    """ yields lists of text entries for each row of the file """
+    firstline = max(0, options.firstline - 1)
+    lastline = options.lastline + 1 if options.lastline > 0 else None
+    if options.col_sep in csv_separators:
+        # csv records define rows, values may contain newlines
+        with open(fname, 'r', encoding=encoding, newline='') as f:
+            yield from _csv_rows(
+                itertools.islice(f, firstline, lastline), options)
+        return
+    with open(fname, 'r', encoding=encoding) as f:
+        lines = itertools.islice(f, firstline, lastline)
+        # remove text after comments
+        if options.comment_sign:
+            lines = (x.split(options.comment_sign, 1)[0] for x in lines)
+        # remove blank lines
+        if options.ignore_blank:
+            lines = (x for x in lines if len(x.strip()) > 0)
+
+        if options.row_sep == "newline":
+            for line in lines:
+                yield _split_columns(line, options)
+        elif options.row_sep != "no (use column count)":
+            for line in _split_stream(lines, options.row_sep):
+                yield _split_columns(line, options)
+        else:
+            # whole text is a single row which is split by column count
+            if options.colcount <= 0:
+                raise Exception("Column count should be defined "
+                                "if there is no row separator")
+            if options.col_sep == 'whitespaces':
+                tokens = itertools.chain.from_iterable(
+                    x.split() for x in lines)
+            elif options.col_sep == 'in double quotes':
+                tokens = itertools.islice(_split_stream(lines, '"'),
+                                          1, None, 2)
+            else:
+                sep = '\t' if options.col_sep == 'tabular' else\
+                    options.col_sep
+                tokens = _split_stream(lines, sep)
+            while True:
+                row = list(itertools.islice(tokens, options.colcount))
+                if not row:
+                    break
+                yield row
+
+
+def iter_plain_text(fname, options, chunk_size=10000, encoding=None):
+    """ used options attributes:
+            firstline, lastline, comment_sign, ignore_blank, row_sep, col_sep
+            colcount.
+            If col_sep is 'csv' or 'tsv' file is parsed by csv module
+            and row_sep is not used.
+        yields lists of at most chunk_size rows of stripped text entries.
+        If colcount > 0 rows are cut or padded to it, otherwise
+        they keep their own length.
+        Only a single chunk of file data is kept in memory.
+        encoding -- file encoding. If None it is detected by
+            detect_encoding, which reads the whole file.
+    """
+    if encoding is None:
+        encoding = text_encoding(fname)
+    cc = options.colcount if options.colcount > 0 else None
+    rows = _plain_text_rows(fname, options, encoding)
+    chunk = list(itertools.islice(rows, chunk_size))
+    if len(chunk) == 0:
+        raise Exception("No data were loaded")
+    while chunk:
+        for i, line in enumerate(chunk):
+            if cc is not None:
+                line = line[:cc] + [""] * (cc - len(line))
+            chunk[i] = [x.strip() for x in line]
+        yield chunk
+        chunk = list(itertools.islice(rows, chunk_size))
+
+
+def split_plain_text(fname, options):
+    """ used options attributes:
+            firstline, lastline, comment_sign, ignore_blank, row_sep, col_sep
+            colcount.
+        returns equal column size 2d array of stripped text entries
+    """
+    ret = list(itertools.chain.from_iterable(
+        iter_plain_text(fname, options)))
+    cc = max(map(len, ret), default=0)
+    return [x + [""] * (cc - len(x)) for x in ret]
 
 
 def read_xlsx_sheets(fname):
     return pxl.load_workbook(fname, read_only=True, data_only=True).sheetnames
 
 
-def parse_xlsx_file(fname, options):
+def iter_xlsx_file(fname, options, chunk_size=10000):
+    """ yields lists of at most chunk_size rows of sheet text entries """
     doc = pxl.load_workbook(fname, read_only=True, data_only=True)
-    sh = doc[options.sheetname]
-    if options.range != '':
-        min_col, min_row, max_col, max_row = pxl.utils.range_boundaries(
-                options.range.upper())
-    else:
-        min_col, min_row = sh.min_column, sh.min_row
-        max_col, max_row = sh.max_column, sh.max_row
-    ret = []
+    try:
+        sh = doc[options.sheetname]
+        if options.range != '':
+            min_col, min_row, max_col, max_row =\
+                pxl.utils.range_boundaries(options.range.upper())
+        else:
+            min_col, min_row = sh.min_column, sh.min_row
+            max_col, max_row = sh.max_column, sh.max_row
+
+        rows = sh.iter_rows(min_row=min_row, max_row=max_row,
+                            min_col=min_col, max_col=max_col)
+        while True:
+            chunk = [[str(x.value) if x.value is not None else ''
+                      for x in row]
+                     for row in itertools.islice(rows, chunk_size)]
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        doc.close()
 
-    for row in sh.iter_rows(None, min_row, max_row, min_col, max_col):
-        ret.append(list(map(lambda x: str(x.value)
-                            if x.value is not None else '', row)))
 
-    return ret
+def parse_xlsx_file(fname, options):
+    return list(itertools.chain.from_iterable(
+        iter_xlsx_file(fname, options)))
 
 
-def autodetect_types(tab, maxsize=10):
-    from ast import literal_eval
-    if len(tab) == 0:
-        return []
+class ColumnTypeInfo(collections.namedtuple(
+        'ColumnTypeInfo', ['tp', 'n_null', 'n_invalid'])):
+    """ tp -- detected type: INT, REAL or TEXT,
+        n_null -- number of empty entries,
+        n_invalid -- number of non-empty entries which are not numbers.
+            They give NULL if the column is imported as INT or REAL.
+    """
+    __slots__ = ()
+
+
+# first characters of numbers. 'nan' and 'inf' are not treated as numbers
+_number_starts = list('0123456789+-.')
+
+
+def _is_number(x):
+    try:
+        float(x)
+        return True
+    except ValueError:
+        return False
 
-    nrows = len(tab)
-    ncols = max([len(x) for x in tab])
 
+def _parses_as(vals, tp):
+    try:
+        vals.astype(tp)
+        return True
+    except (ValueError, OverflowError):
+        return False
+
+
+def infer_types(chunks):
+    """ chunks -- iterable of 2d lists of text entries
+        -> [ColumnTypeInfo] for each column.
+        Every entry is checked: each chunk column is parsed
+        by vectorized numpy conversions and only columns
+        which fail them are checked entry by entry.
+    """
+    n_null, n_invalid, has_real = None, None, None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        tab = np.array(chunk, dtype=str)
+        if n_null is None:
+            nc = tab.shape[1]
+            n_null, n_invalid = [0] * nc, [0] * nc
+            has_real = [False] * nc
+        for j in range(tab.shape[1]):
+            col = tab[:, j]
+            vals = col[col != '']
+            n_null[j] += len(col) - len(vals)
+            if _parses_as(vals, np.int64):
+                continue
+            # numpy parses nan, inf and infinity which are kept as text
+            words = np.char.find(np.char.lower(vals), 'n') >= 0
+            if words.any() or not _parses_as(vals, np.float64):
+                # only entries which start like a number are checked
+                isnum = np.isin(vals.astype('U1'), _number_starts) & ~words
+                isnum[isnum] = list(map(_is_number, vals[isnum]))
+                n_invalid[j] += len(vals) - np.count_nonzero(isnum)
+                vals = vals[isnum]
+            if not has_real[j] and not _parses_as(vals, np.int64):
+                has_real[j] = True
+    if n_null is None:
+        return []
     ret = []
-    for icol in range(ncols):
-        r = "INT"  # 3-INT, 2-REAL, 1-TEXT
-        s = 0
-        for irow in range(nrows):
-            v = tab[irow][icol]
-            if v is not "" and v is not None:
-                try:
-                    x = literal_eval(v)
-                    if type(x) is float:
-                        r = "REAL"
-                    elif type(x) is not int:
-                        raise
-                    s += 1
-                    if s >= maxsize:
-                        break
-                except:
-                    r = "TEXT"
-                    break
-        ret.append(r)
+    for nn, ni, hr in zip(n_null, n_invalid, has_real):
+        tp = 'TEXT' if ni > 0 else 'REAL' if hr else 'INT'
+        ret.append(ColumnTypeInfo(tp, nn, ni))
     return ret
 
 
-def explicit_table(tab_name, colformats, tab, proj):
-    """ Assembles a table from given python data.
-        colformats = [(name, dt_type, dict_name), ...]
-        tab[][] - table in python types format. None for NULL.
+# detected types from the narrowest to the widest
+_type_order = ['INT', 'REAL', 'TEXT']
 
-        !!! This procedure modifies tab (converts string values to format
-        values). Use deepcopy in order to keep tab unchanged.
-    """
-    for i, t in enumerate(tab):
-        t.insert(0, i+1)
 
+def autodetect_types(tab):
+    """ -> [INT/REAL/TEXT] types of equal size rows table columns """
+    tab = [['' if x is None else x for x in row] for row in tab]
+    return [x.tp for x in infer_types([tab])]
+
+
+def explicit_table(tab_name, colformats, chunks, proj):
+    """ Assembles a table from given text data.
+        colformats = [(name, dt_type, dict_name), ...]
+        chunks -- iterable of 2d lists of text entries.
+            Each chunk is converted by columns from_repr
+            and inserted with a single query, so
+            only one chunk is kept in memory at a time.
+    """
     def init_columns(self):
         self.all_columns = []
         self.all_columns.append(bcol.build_id())
@@ -165,55 +319,166 @@ def explicit_table(tab_name, colformats, tab, proj):
             cols.append(c)
             sqlcols.append(c.sql_line())
 
-        for i in range(len(tab)):
-            for j in range(len(tab[i])):
-                tab[i][j] = cols[j].from_repr(tab[i][j])
-
         pholders = ','.join(['?'] * (len(self.all_columns)))
         qr = 'INSERT INTO "{tabname}" ({collist}) VALUES ({ph})'.format(
                 tabname=self.ttab_name,
                 collist=", ".join(sqlcols),
                 ph=pholders)
-        self.query(qr, tab)
+        # sqlite module opens a transaction before the first insert
+        # and keeps it till the commit, so all chunks are
+        # written within a single transaction.
+        n = 0
+        for chunk in chunks:
+            tab = []
+            for row in chunk:
+                n += 1
+                tab.append([n] + [c.from_repr(v)
+                                  for c, v in zip(cols[1:], row)])
+            self.query(qr, tab)
 
     return dtab.DataTable(tab_name, proj, init_columns, fill_ttab, True)
 
 
 class _ImportTab(comproj.NewTabCommand):
+    # number of rows inserted by a single query
+    chunk_size = 10000
+    # number of first data rows loaded for preview and column count
+    preview_size = 1000
+
     def __init__(self, proj, fname, opt, delegate):
+        """ delegate(fname, opt, chunk_size) -- generator of
+                lists of equal size rows of text entries
+        """
         super().__init__(proj)
         self.fname = fname
         self.opt = opt
 
         self.delegate = delegate
+        # first rows of data
         self.tab = None
         self.tps = None
         self.dnames = None
         self.caps = None
+        # [ColumnTypeInfo] for all source columns detected by all rows
+        self.type_info = None
+        # indices of imported source columns
+        self.columns = None
+        # number of source columns defined by preview rows
+        self.n_columns = None
+        # number of data rows and maximum row length found by the last
+        # full source pass or None
+        self.n_rows = None
+        self.max_row_size = None
+        # parsing speed of the last source pass
+        self.rows_per_second = None
+        # file with pickled chunks of source rows
+        # if the source was parsed beforehand
+        self.parsed = None
+
+    def source_name(self):
+        return os.path.basename(self.fname)
+
+    def source_reader(self):
+        """ -> delegate(fname, opt, chunk_size) which parses the source """
+        return self.delegate
+
+    def _source_chunks(self):
+        if self.parsed is None:
+            yield from self.source_reader()(
+                self.fname, self.opt, self.chunk_size)
+        else:
+            with open(self.parsed, 'rb') as f:
+                while True:
+                    try:
+                        yield pickle.load(f)
+                    except EOFError:
+                        return
+
+    def drop_parsed(self):
+        """ removes the file of parsed source rows """
+        if self.parsed is not None:
+            _remove_file(self.parsed)
+            self.parsed = None
+
+    def _data_chunks(self, columns=None):
+        """ yields chunks of data rows with given columns.
+            Rows are cut or padded to n_columns if it is known.
+            Sets n_rows, max_row_size and rows_per_second after
+            the last chunk.
+        """
+        start = time.perf_counter()
+        n, maxsize = 0, 0
+        nc = self.n_columns
+        skip = 1 if self.opt.read_cap else 0
+        for chunk in self._source_chunks():
+            if skip:
+                chunk, skip = chunk[skip:], 0
+            maxsize = max(maxsize, max(map(len, chunk), default=0))
+            if nc is not None:
+                chunk = [r[:nc] + [''] * (nc - len(r)) for r in chunk]
+            if columns is not None:
+                chunk = [[r[j] for j in columns] for r in chunk]
+            n += len(chunk)
+            yield chunk
+        elapsed = time.perf_counter() - start
+        self.n_rows, self.max_row_size = n, maxsize
+        self.rows_per_second = n / elapsed if elapsed > 0 else float('inf')
+        basic.log_message('{} rows of "{}" were processed: {:.0f} rows/s'
+                          .format(n, self.fname, self.rows_per_second))
+        if nc is not None and maxsize > nc:
+            basic.log_message('Entries of "{}" after column {} were '
+                              'ignored'.format(self.fname, nc))
 
     def _prebuild(self):
-        self.tab = self.delegate(self.fname, self.opt)
+        """ reads the first rows of the source which define
+            captions and column count. Column types are detected
+            by an additional pass over all source rows.
+        """
+        rows = self._source_chunks()
+        try:
+            n = self.preview_size + (1 if self.opt.read_cap else 0)
+            self.tab = list(itertools.islice(
+                itertools.chain.from_iterable(rows), n))
+        finally:
+            rows.close()
+        nc = self.n_columns = max(map(len, self.tab), default=0)
+        self.tab = [r + [''] * (nc - len(r)) for r in self.tab]
         if self.opt.read_cap:
             self.caps = self.tab[0][:]
             self.tab = self.tab[1:]
         else:
-            self.caps = ["Column {}".format(i+1)
-                         for i in range(len(self.tab[0]))]
-        self.tps = autodetect_types(self.tab)
+            self.caps = ["Column {}".format(i+1) for i in range(nc)]
+        # a wider type found after preview rows would corrupt
+        # inserted values, so all rows are checked.
+        # The pass also sets n_rows and rows_per_second.
+        self.type_info = infer_types(self._data_chunks())
+        self.tps = [x.tp for x in self.type_info]
         self.dnames = [None] * len(self.tps)
+        self.columns = list(range(len(self.tps)))
+
+    def unique_values(self, icol):
+        """ -> sorted unique entries of the source column icol """
+        ret = set()
+        for chunk in self._data_chunks([icol]):
+            ret.update(x[0] for x in chunk)
+        return sorted(ret)
 
     def _clear(self):
         self.tab = None
         self.caps = None
         self.tps = None
         self.dnames = None
+        self.type_info = None
+        self.columns = None
+        self.n_columns = None
         super()._clear()
 
     def _get_table(self):
         if self.tab is None:
             self._prebuild()
         a = [(c, tp, d) for c, tp, d in zip(self.caps, self.tps, self.dnames)]
-        return explicit_table(self.opt.tabname, a, self.tab, self.proj)
+        return explicit_table(self.opt.tabname, a,
+                              self._data_chunks(self.columns), self.proj)
 
 
 class ImportTabFromTxt(_ImportTab):
@@ -228,7 +493,21 @@ class ImportTabFromTxt(_ImportTab):
             opt.colcount = -1
             opt.tabname = 't1'
         """
-        super().__init__(proj, fname, opt, split_plain_text)
+        super().__init__(proj, fname, opt, iter_plain_text)
+        # file encoding which is detected once by the first source pass
+        self.encoding = None
+
+    def source_reader(self):
+        """ parses the file with the encoding detected beforehand.
+            Without it the file is parsed by a single pass
+            (f.e. by a batch import worker) which detects encoding itself.
+        """
+        return functools.partial(iter_plain_text, encoding=self.encoding)
+
+    def _source_chunks(self):
+        if self.parsed is None and self.encoding is None:
+            self.encoding = text_encoding(self.fname)
+        return super()._source_chunks()
 
 
 class ImportTabFromXlsx(_ImportTab):
@@ -238,4 +517,204 @@ class ImportTabFromXlsx(_ImportTab):
             opt.read_cap = True
             opt.tabname = 't1'
         """
-        super().__init__(proj, fname, opt, parse_xlsx_file)
+        super().__init__(proj, fname, opt, iter_xlsx_file)
+
+    def source_name(self):
+        return '{}:{}'.format(super().source_name(), self.opt.sheetname)
+
+
+# ============================== batch import
+# set in process pool workers to stop parsing
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _remove_file(fname):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+
+def _parse_source(delegate, fname, opt, chunk_size):
+    """ process pool worker: writes pickled chunks of source rows
+        to a temporary file.
+        -> file name or None if parsing was stopped
+    """
+    fd, ret = tempfile.mkstemp(prefix='biostata', suffix='.parsed')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in delegate(fname, opt, chunk_size):
+                if _stop_event is not None and _stop_event.is_set():
+                    _remove_file(ret)
+                    return None
+                pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+    except:
+        _remove_file(ret)
+        raise
+    return ret
+
+
+def parse_sources(coms, callback=None, max_workers=None, poll=0.2):
+    """ Parses sources of _ImportTab commands in a process pool.
+        Workers write source rows to temporary files by chunks
+        and their names are stored to commands 'parsed' attribute,
+        so that rows are read back chunk by chunk during insertion.
+        callback(title, source name, done fraction, 0) is called after
+        each parsed source and every poll seconds while waiting.
+        It should return 1 to cancel parsing
+        (see bgui.dlgs.ProgressProcedureDlg). On cancellation or error
+        pending jobs are dropped, running workers are stopped and
+        all temporary files are removed.
+        -> False if parsing was cancelled, True otherwise
+    """
+    stop = multiprocessing.Event()
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers, initializer=_init_worker, initargs=(stop,))
+    done = False
+    try:
+        futures = {pool.submit(_parse_source, c.source_reader(), c.fname,
+                               c.opt, c.chunk_size): c
+                   for c in coms}
+        pending, name, n = set(futures), '', 0
+        while pending:
+            finished, pending = concurrent.futures.wait(
+                pending, poll, concurrent.futures.FIRST_COMPLETED)
+            for f in finished:
+                com = futures[f]
+                com.parsed = f.result()
+                name, n = com.source_name(), n + 1
+            if callback is not None and callback(
+                    'Parsing sources', name, n / len(coms), 0) == 1:
+                return False
+        done = True
+    finally:
+        if not done:
+            stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        if not done:
+            for c in coms:
+                c.drop_parsed()
+    return True
+
+
+class _MergedImport(comproj.NewTabCommand):
+    """ Single table from several parsed sources with
+        the source name column at the end
+    """
+    source_column = 'source'
+
+    def __init__(self, proj, tabname, coms):
+        super().__init__(proj)
+        self.tabname = tabname
+        self.coms = coms
+
+    def _chunks(self, nc):
+        for c in self.coms:
+            name = c.source_name()
+            for chunk in c._data_chunks():
+                yield [(r + [''] * nc)[:nc] + [name] for r in chunk]
+
+    def _get_table(self):
+        # types are detected by all rows of all sources.
+        # Columns which a source lacks are empty and do not affect them.
+        for c in self.coms:
+            c._prebuild()
+        first = self.coms[0]
+        nc = len(first.caps)
+        caps = first.caps + [self.source_column]
+        tps = ['INT'] * nc
+        for c in self.coms:
+            for j, ti in enumerate(c.type_info[:nc]):
+                tps[j] = max(tps[j], ti.tp, key=_type_order.index)
+        tps.append('TEXT')
+        a = [(c, tp, None) for c, tp in zip(caps, tps)]
+        return explicit_table(self.tabname, a, self._chunks(nc), self.proj)
+
+
+class ImportTabsBatch(command.Command):
+    def __init__(self, proj, coms, merge_name=None):
+        """ coms -- [_ImportTab] commands for each source file or sheet.
+            merge_name -- if not None all sources are merged into
+                a single table with this name and an additional column
+                of source names. Otherwise each source gives its own table.
+            Call parse() before execution to parse sources with progress
+            callback, otherwise they will be parsed in _exec.
+        """
+        super().__init__(proj=proj, coms=coms, merge_name=merge_name)
+        self.acts = []
+
+    @classmethod
+    def from_glob(cls, proj, pattern, opt, merge_name=None):
+        """ plain text files matching pattern. opt -- ImportTabFromTxt
+            options, table names are taken from file names.
+        """
+        files = sorted(glob.glob(pattern))
+        if not files:
+            raise Exception('No files match "{}"'.format(pattern))
+        coms = []
+        for f in files:
+            o = copy.deepcopy(opt)
+            o.tabname = os.path.splitext(os.path.basename(f))[0]
+            coms.append(ImportTabFromTxt(proj, f, o))
+        return cls(proj, coms, merge_name)
+
+    @classmethod
+    def from_sheets(cls, proj, fname, opt, merge_name=None):
+        """ all sheets of xlsx file. opt -- ImportTabFromXlsx options,
+            table names are taken from sheet names.
+        """
+        coms = []
+        for s in read_xlsx_sheets(fname):
+            o = copy.deepcopy(opt)
+            o.sheetname = o.tabname = s
+            coms.append(ImportTabFromXlsx(proj, fname, o))
+        return cls(proj, coms, merge_name)
+
+    def parse(self, callback=None):
+        """ -> False if parsing was cancelled """
+        return parse_sources(self.coms, callback)
+
+    def _exec(self):
+        if any(c.parsed is None for c in self.coms) and not self.parse():
+            return False
+        if self.merge_name is None:
+            coms = self.coms
+        else:
+            coms = [_MergedImport(self.proj, self.merge_name, self.coms)]
+        # all tables are inserted within a single sqlite transaction
+        # which is opened by the first insert. Moving the working
+        # database would commit it, so it is postponed till the end.
+        done = False
+        self.proj.sql.hold_work_db()
+        try:
+            for c in coms:
+                self.acts.append(command.ActFromCommand(c))
+                self.acts[-1].redo()
+            done = True
+        finally:
+            for c in self.coms:
+                c.drop_parsed()
+            self.proj.sql.release_work_db(done)
+        return True
+
+    def tables(self):
+        """ -> [DataTable] created by the command """
+        return [a.com.atab for a in self.acts]
+
+    def _clear(self):
+        for a in self.acts:
+            a.com.reset()
+        self.acts = []
+
+    def _undo(self):
+        for a in reversed(self.acts):
+            a.undo()
+
+    def _redo(self):
+        for a in self.acts:
+            a.redo()
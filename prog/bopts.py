@@ -39,6 +39,18 @@ class BiostataOptions:
         self.show_bool_as = 'icons'   # [icons, codes, 0/1, Yes/No]
         self.real_numbers_prec = 6
 
+        # data processing
+        # memory for cached table views (Mb per table)
+        self.view_cache_size = 64
+        # working database location [memory, file, auto]
+        self.work_db = 'auto'
+        # working database size (Mb) above which it is moved to file
+        self.work_db_limit = 1024
+        # maximum size of undo data (Mb) kept in working database
+        self.max_undo_size = 1024
+        # undo copies (Mb) which are moved from memory to temporary file
+        self.undo_spill_size = 64
+
         # external programs
         self.external_xlsx_editor = ''
         self.external_txt_editor = ''
@@ -86,6 +98,18 @@ class BiostataOptions:
             ET.SubElement(orepr, 'REAL_PREC').text = str(
                     self.real_numbers_prec)
 
+            # data processing
+            drepr = ET.SubElement(root, "DATA")
+            ET.SubElement(drepr, 'VIEW_CACHE').text = str(
+                    self.view_cache_size)
+            ET.SubElement(drepr, 'WORK_DB').text = self.work_db
+            ET.SubElement(drepr, 'WORK_DB_LIMIT').text = str(
+                    self.work_db_limit)
+            ET.SubElement(drepr, 'MAX_UNDO_SIZE').text = str(
+                    self.max_undo_size)
+            ET.SubElement(drepr, 'UNDO_SPILL_SIZE').text = str(
+                    self.undo_spill_size)
+
             # external programs
             exrepr = ET.SubElement(root, "EXTERNAL")
             ET.SubElement(exrepr, "XLSX").text = self.external_xlsx_editor
@@ -141,6 +165,11 @@ class BiostataOptions:
         _read_field('TABLE/FONT/SIZE', int, 'basic_font_size')
         _read_field('TABLE/BOOL_AS', str, 'show_bool_as')
         _read_field('TABLE/REAL_PREC', int, 'real_numbers_prec')
+        _read_field('DATA/VIEW_CACHE', int, 'view_cache_size')
+        _read_field('DATA/WORK_DB', str, 'work_db')
+        _read_field('DATA/WORK_DB_LIMIT', int, 'work_db_limit')
+        _read_field('DATA/MAX_UNDO_SIZE', int, 'max_undo_size')
+        _read_field('DATA/UNDO_SPILL_SIZE', int, 'undo_spill_size')
         _read_field('EXTERNAL/XLSX', str, 'external_xlsx_editor')
         _read_field('EXTERNAL/TXT', str, 'external_txt_editor')
         _read_field('BEHAVIOUR/OPEN_RECENT', int, 'open_recent_db_on_start')
@@ -1,8 +1,13 @@
+import os
 import sqlite3
+import tempfile
+import re
+import collections
+import warnings
+import weakref
 import numpy as np
 import numbers
 from prog import basic
-from bmat import stats
 
 
 def group_repr(c):
@@ -18,6 +23,13 @@ class _Grouping1:
         self.vals.append(v)
 
 
+class _NotNullGrouping(_Grouping1):
+    """ NULL values are skipped as in native sql aggregates """
+    def step(self, v):
+        if v is not None:
+            self.vals.append(v)
+
+
 class _GroupingA:
     def __init__(self):
         self.vals = []
@@ -41,7 +53,7 @@ class CategoryGrouping(_Grouping1):
             return None
 
 
-class MedianDataGrouping(_Grouping1):
+class MedianDataGrouping(_NotNullGrouping):
     def __init__(self):
         super().__init__()
 
@@ -56,7 +68,7 @@ class MedianDataGrouping(_Grouping1):
             return s[indp]
 
 
-class MedianPDataGrouping(_Grouping1):
+class MedianPDataGrouping(_NotNullGrouping):
     def __init__(self):
         super().__init__()
 
@@ -68,7 +80,7 @@ class MedianPDataGrouping(_Grouping1):
         return s[indp]
 
 
-class MedianMDataGrouping(_Grouping1):
+class MedianMDataGrouping(_NotNullGrouping):
     def __init__(self):
         super().__init__()
 
@@ -80,6 +92,93 @@ class MedianMDataGrouping(_Grouping1):
         return s[indp-1]
 
 
+# window functions are supported since sqlite 3.25
+native_medians = sqlite3.sqlite_version_info >= (3, 25, 0)
+# ALTER TABLE RENAME/DROP COLUMN are supported since sqlite 3.35
+native_alter_column = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# queries which modify table data or structure: target table name
+# is the first group, the new name of renamed table is the second one
+_write_query = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|'
+    r'UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|ALTER\s+TABLE|'
+    r'CREATE\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?)\s+'
+    r'(?:"?\w+"?\.)?"([^"]+)"(?:\s+RENAME\s+TO\s+"([^"]+)")?',
+    re.IGNORECASE)
+
+
+class GroupingPlan:
+    """ Builds native sql equivalents of category_group and median
+        aggregates so that grouped values are not passed to python.
+
+        Native medians use window columns of the source table. So they
+        are used only if the plan of the compiled query is passed to
+        group_line. It then provides the FROM clause by from_line().
+        Without a plan python aggregates are used. Both skip NULL values.
+    """
+    _colref = re.compile(r'^"(?:[^"]|"")*"$')
+
+    def __init__(self, partition):
+        # sql lines of grouping columns
+        self.partition = partition
+        # argument sql line -> window columns index
+        self.windows = collections.OrderedDict()
+
+    @classmethod
+    def group_line(cls, fun, arg, plan=None):
+        """ sql line of a fun aggregate of arg.
+            plan -- GroupingPlan of the query or None
+        """
+        if fun == 'category_group' and cls._colref.match(arg):
+            # arg should be a column reference because it is used thrice
+            return ("CASE WHEN MIN({0}) IS MAX({0}) AND "
+                    "COUNT({0}) = COUNT(*) THEN MIN({0}) END").format(arg)
+        if fun in ('median', 'medianp', 'medianm') and native_medians and\
+                plan is not None:
+            return plan._median_line(fun, arg)
+        return '{}({})'.format(fun, arg)
+
+    def _median_line(self, fun, arg):
+        k = self.windows.setdefault(arg, len(self.windows) + 1)
+        val, rn, cnt = ['"_{} {}"'.format(x, k) for x in ('mv', 'rn', 'cnt')]
+        # ranks of non null values are 1..cnt
+        if fun == 'median':
+            return ('AVG(CASE WHEN {1} IN (({2}+1)/2, ({2}+2)/2) '
+                    'THEN {0} END)').format(val, rn, cnt)
+        elif fun == 'medianp':
+            return 'MAX(CASE WHEN {1} = {2}/2+1 THEN {0} END)'.format(
+                val, rn, cnt)
+        else:
+            return 'MAX(CASE WHEN {1} = MAX({2}/2, 1) THEN {0} END)'.format(
+                val, rn, cnt)
+
+    def from_line(self, tabname, fltline, id_ordered=False):
+        """ FROM clause argument (with filtration) for the planned query.
+            id_ordered -- feed rows to aggregates in id order. sqlite keeps
+            the order of a subquery within a group since its group sorter
+            is stable.
+        """
+        order = 'ORDER BY id' if id_ordered else ''
+        if not self.windows:
+            if not order:
+                return '"{}" {}'.format(tabname, fltline)
+            return '(SELECT * FROM "{0}" {1} {2}) AS "{0}"'.format(
+                tabname, fltline, order)
+        if self.partition:
+            part = 'PARTITION BY {}'.format(', '.join(self.partition))
+        else:
+            part = ''
+        wcols = []
+        for arg, k in self.windows.items():
+            wcols.append('{} AS "_mv {}"'.format(arg, k))
+            wcols.append('ROW_NUMBER() OVER ({0} ORDER BY {1} IS NULL, {1}) '
+                         'AS "_rn {2}"'.format(part, arg, k))
+            wcols.append('COUNT({}) OVER ({}) AS "_cnt {}"'.format(
+                arg, part, k))
+        return '(SELECT *, {1} FROM "{0}" {2} {3}) AS "{0}"'.format(
+            tabname, ', '.join(wcols), fltline, order)
+
+
 class _XYFunGrouping:
     _pool_size = 10
 
@@ -135,107 +234,120 @@ class IntegralDataGrouping(_XYFunGrouping):
         return np.trapz(b, a)
 
 
-_build_regression_grouping_ret = {}
-
-
-def build_regression_grouping(tp, ngroup):
-    'tp = linear, log, power'
-    global _build_regression_grouping_ret
-
-    if ngroup in _build_regression_grouping_ret:
-        return _build_regression_grouping_ret[ngroup]
-
-    if tp == 'linear':
-        rfunc = stats.linear_regression
-    elif tp == 'log':
-        rfunc = stats.log_regression
-    elif tp == 'power':
-        rfunc = stats.power_regression
-    else:
-        assert False
-
-    class _Runner(_XYFunGrouping):
-        def __init__(self):
-            super().__init__()
-            self.wrk = None
-
-        def start(self, obj):
-            if self.wrk is None:
-                self.sz = 0
-                self.wrk = obj
-                self.ret = [None] * 5
+def pack_outputs(values):
+    """ packs aggregate output values to a blob. None -> NaN """
+    return np.array([np.nan if x is None else x for x in values],
+                    dtype=np.float64).tobytes()
 
-        def end(self, obj):
-            self.wrk = None
 
-        def finalize(self):
-            r = super().finalize()
-            self.wrk = None
-            return r
-
-        def worker(self, a, b):
-            self.ret = rfunc(a, b)
-
-    r = _Runner()
-
-    class _Basic:
-        runner = r
+def multi_output(packed, index):
+    """ unpacks value #index of an aggregate result built by pack_outputs.
+        Since sqlite computes identical aggregate calls of a query only once
+        all output columns of a group share a single accumulator.
+    """
+    if packed is None:
+        return None
+    ret = float(np.frombuffer(packed, dtype=np.float64)[index])
+    return None if np.isnan(ret) else ret
 
-        def __init__(self):
-            self.runner.start(self)
 
-        def step(self, x, y):
-            if self.runner.wrk == self:
-                self.runner.step(x, y)
+class _RegressionGrouping:
+    """ Single pass x-y regression aggregate: regression_tp(x, y).
+        Accumulates sufficient statistics (count, means and co-moments
+        of possibly log-transformed values) and returns
+        (a, b, stderr, slopeerr, corrcoef) packed by pack_outputs.
+    """
+    def __init__(self):
+        self.n = 0
+        self.mx, self.my = 0., 0.
+        self.cxx, self.cyy, self.cxy = 0., 0., 0.
 
-        def finalize(self):
-            if self.runner.wrk is not None:
-                self.runner.finalize()
+    def transform(self, x, y):
+        """ -> (x, y) for linear regression or None to skip values """
+        return x, y
 
-    class Slope(_Basic):
-        def __init__(self):
-            super().__init__()
+    def step(self, x, y):
+        # pass non number values
+        if not (isinstance(x, numbers.Number) and
+                isinstance(y, numbers.Number)):
+            return
+        xy = self.transform(x, y)
+        if xy is None:
+            return
+        self.n += 1
+        dx = xy[0] - self.mx
+        self.mx += dx / self.n
+        dy = xy[1] - self.my
+        self.my += dy / self.n
+        self.cxx += dx * (xy[0] - self.mx)
+        self.cyy += dy * (xy[1] - self.my)
+        self.cxy += dx * (xy[1] - self.my)
+
+    def linear(self):
+        """ -> slope, intercept, slope error, corr. coeff of
+               transformed values
+        """
+        slope = self.cxy / self.cxx
+        intercept = self.my - slope * self.mx
+        if self.cyy == 0:
+            r = 0.
+        else:
+            r = max(-1., min(1., self.cxy / np.sqrt(self.cxx * self.cyy)))
+        if self.n > 2:
+            slopeerr = np.sqrt((1. - r*r) * self.cyy / self.cxx /
+                               (self.n - 2))
+        else:
+            slopeerr = 0.
+        return slope, intercept, slopeerr, r
 
-        def finalize(self):
-            super().finalize()
-            return self.runner.ret[0]
+    def stderr(self, slope, intercept):
+        # residual sum of squares
+        return np.sqrt(max(0., self.cyy - slope * self.cxy) / self.n)
 
-    class Intercept(_Basic):
-        def __init__(self):
-            super().__init__()
+    def finalize(self):
+        if self.n < 2 or self.cxx <= 0:
+            ret = [None] * 5
+        else:
+            a, b, slopeerr, r = self.linear()
+            ret = [a, b, self.stderr(a, b), slopeerr, r]
+            ret = [float(x) for x in ret]
+        return pack_outputs(ret)
 
-        def finalize(self):
-            super().finalize()
-            return self.runner.ret[1]
 
-    class StdErr(_Basic):
-        def __init__(self):
-            super().__init__()
+class LinearRegressionGrouping(_RegressionGrouping):
+    """ f = a*x + b """
 
-        def finalize(self):
-            super().finalize()
-            return self.runner.ret[2]
 
-    class SlopeErr(_Basic):
-        def __init__(self):
-            super().__init__()
+class LogRegressionGrouping(_RegressionGrouping):
+    """ f = a*ln(x) + b """
+    def transform(self, x, y):
+        if x > 0:
+            return np.log(x), y
 
-        def finalize(self):
-            super().finalize()
-            return self.runner.ret[3]
 
-    class CorrCoef(_Basic):
-        def __init__(self):
-            super().__init__()
+class PowerRegressionGrouping(_RegressionGrouping):
+    """ f = b*(x^a). Linear regression of logarithms """
+    def __init__(self):
+        super().__init__()
+        # original values are needed for stderr computation
+        self.x, self.y = [], []
 
-        def finalize(self):
-            super().finalize()
-            return self.runner.ret[4]
+    def transform(self, x, y):
+        if x > 0 and y > 0:
+            self.x.append(x)
+            self.y.append(y)
+            return np.log(x), np.log(y)
 
-    ret = {'a': Slope, 'b': Intercept, 'stderr': StdErr,
-           'slopeerr': SlopeErr, 'corrcoef': CorrCoef}
-    _build_regression_grouping_ret[ngroup] = ret
-    return ret
+    def finalize(self):
+        if self.n >= 2 and self.cxx > 0:
+            a, b, slopeerr, r = self.linear()
+            b = np.exp(b)
+            x, y = np.array(self.x), np.array(self.y)
+            err = np.sqrt(np.sum((b*(x**a) - y)**2)/np.size(x))
+            ret = [float(v) for v in [a, b, err, slopeerr, r]]
+        else:
+            ret = [None] * 5
+        return pack_outputs(ret)
 
 
 def max_per_list(*args):
@@ -314,6 +426,57 @@ def cast_real_to_int(a):
     else:
         return round(a)
 
+
+# ---- vectorized versions of row functions.
+# Take 2d float array (row, argument) with NaN for NULL values,
+# return 1d float array with NaN for NULL results.
+def _np_n_valid(a):
+    return np.count_nonzero(~np.isnan(a), axis=1)
+
+
+def np_row_max(a):
+    return np.fmax.reduce(a, axis=1)
+
+
+def np_row_min(a):
+    return np.fmin.reduce(a, axis=1)
+
+
+def np_row_sum(a):
+    # sum of no values is 0 as in row_sum
+    return np.nansum(a, axis=1)
+
+
+def np_row_average(a):
+    n = _np_n_valid(a)
+    ret = np.full(len(a), np.nan)
+    np.divide(np.nansum(a, axis=1), n, out=ret, where=n > 0)
+    return ret
+
+
+def np_row_median(a):
+    with warnings.catch_warnings():
+        # all-NaN rows give NaN with a warning
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(a, axis=1)
+
+
+def np_row_product(a):
+    ret = np.nanprod(a, axis=1)
+    ret[_np_n_valid(a) == 0] = np.nan
+    return ret
+
+
+# sql row function name -> vectorized implementation
+vectorized_row_functions = {
+        "row_min": np_row_min,
+        "row_max": np_row_max,
+        "row_sum": np_row_sum,
+        "row_average": np_row_average,
+        "row_product": np_row_product,
+        "row_median": np_row_median,
+}
+
 # those functions will be added to each connection passed to TabModel
 registered_aggregate_functions = [
         ("category_group", 1, CategoryGrouping),
@@ -321,6 +484,9 @@ registered_aggregate_functions = [
         ("medianp", 1, MedianPDataGrouping),
         ("medianm", 1, MedianMDataGrouping),
         ("xy_integral", 2, IntegralDataGrouping),
+        ("regression_linear", 2, LinearRegressionGrouping),
+        ("regression_log", 2, LogRegressionGrouping),
+        ("regression_power", 2, PowerRegressionGrouping),
 ]
 registered_sql_functions = [
         ("max_per_list", -1, max_per_list),
@@ -333,27 +499,253 @@ registered_sql_functions = [
         ("row_average", -1, row_average),
         ("row_product", -1, row_product),
         ("row_median", -1, row_median),
+        ("multi_output", 2, multi_output),
 ]
 
 
 class SqlConnection:
+    # pragmas of file based working database. Its data are not needed
+    # after crash so journal and disk synchronization are switched off.
+    file_pragmas = [
+        ('journal_mode', 'OFF'),
+        ('synchronous', 'OFF'),
+        ('temp_store', 'FILE'),
+        ('cache_size', -256 * 1024),    # in Kb
+        ('mmap_size', 2**30),
+    ]
+
     def __init__(self):
+        # [(name, narg, func, is_aggregate)] of custom sql functions
+        self._custom_functions = []
         self.connection = sqlite3.connect(':memory:')
         self.init_connection()
         self.cursor = self.connection.cursor()
         self._i_sql_functions = 1
         self.has_A = False
+        self._A_file = None
+        # working database location: 'memory', 'file' or 'auto'
+        self.work_db = 'memory'
+        # size of working database (Mb) above which it is moved
+        # to file in 'auto' mode
+        self.work_db_limit = 1024
+        # current working database file or None for :memory:
+        self.work_db_file = None
+        # number of hold_work_db calls which postpone adjust_work_db
+        # and whether it was requested meanwhile
+        self._work_db_holds = 0
+        self._work_db_pending = False
+        # undo copies of :memory: tables larger than this (bytes)
+        # are moved to spill database
+        self.undo_spill_size = 64 * 2**20
+        # file of attached spill database 'U' or None
+        self._spill_file = None
+        # {id(dictionary): (weakref(dictionary), items, table name)}
+        self._dict_tables = {}
+        # table name -> number of queries which have modified it
+        self._write_counts = collections.Counter()
 
     def close_connection(self):
         self.connection.close()
+        if self.work_db_file is not None:
+            os.remove(self.work_db_file)
+            self.work_db_file = None
+        if self._spill_file is not None:
+            os.remove(self._spill_file)
+            self._spill_file = None
+
+    # ---------------------- working database location
+    def set_work_db(self, mode, limit):
+        """ mode -- 'memory', 'file' or 'auto',
+            limit -- working database size in Mb above which it is moved
+                     to file in 'auto' mode
+        """
+        self.work_db, self.work_db_limit = mode, limit
+        self.adjust_work_db()
+
+    def work_db_size(self):
+        """ -> size of used pages of working database in bytes """
+        ret = []
+        for p in ['page_count', 'freelist_count', 'page_size']:
+            c = self.connection.execute('PRAGMA main.{}'.format(p))
+            ret.append(c.fetchone()[0])
+        return (ret[0] - ret[1]) * ret[2]
+
+    def need_spill(self, size):
+        """ -> True if undo copy of given size should be moved
+               from :memory: to spill database
+        """
+        return self.work_db_file is None and size > self.undo_spill_size
+
+    def spill_db(self):
+        """ -> alias of attached temporary file database for
+               large undo copies
+        """
+        if self._spill_file is None:
+            fd, fn = tempfile.mkstemp(prefix='biostata', suffix='.db')
+            os.close(fd)
+            self._spill_file = fn
+            self._attach_spill_db()
+        return 'U'
+
+    def _attach_spill_db(self):
+        # attach is not allowed inside a transaction
+        self.connection.commit()
+        self.query('ATTACH DATABASE "{}" AS "U"'.format(self._spill_file))
+        self.query('PRAGMA U.journal_mode = OFF')
+        self.query('PRAGMA U.synchronous = OFF')
+
+    def move_table(self, name, src, dst):
+        """ moves table with its definition between attached databases
+            src and dst ('main', 'A', ...)
+        """
+        self.query("""SELECT sql FROM "{}".sqlite_master
+                      WHERE type='table' AND name='{}'""".format(
+            src, name.replace("'", "''")))
+        qr = re.sub(r'^CREATE\s+TABLE\s+("[^"]*"|\S+)',
+                    'CREATE TABLE "{}"."{}"'.format(dst, name),
+                    self.qresult()[0])
+        self.query(qr)
+        self.query('INSERT INTO "{0}"."{2}" SELECT * FROM "{1}"."{2}"'.format(
+            dst, src, name))
+        self.query('DROP TABLE "{}"."{}"'.format(src, name))
+
+    # ---------------------- dictionary lookup tables
+    def dictionary_table(self, dct):
+        """ -> name of indexed sql table ("_key" INTEGER PRIMARY KEY,
+               "_value" TEXT UNIQUE) which mirrors valuedict.Dictionary dct.
+               Table is rebuilt if dictionary entries were changed.
+        """
+        self._drop_dead_dictionary_tables()
+        items = list(dct.kvalues.items())
+        try:
+            _, its, nm = self._dict_tables[id(dct)]
+            if its == items:
+                return nm
+            self.connection.execute('DROP TABLE "{}"'.format(nm))
+        except KeyError:
+            nm = '_dict {}'.format(basic.uniint())
+        # separate cursor keeps pending results of self.cursor
+        self.connection.execute(
+            'CREATE TABLE "{}" ("_key" INTEGER PRIMARY KEY, '
+            '"_value" TEXT UNIQUE)'.format(nm))
+        self.connection.executemany(
+            'INSERT INTO "{}" VALUES (?, ?)'.format(nm), items)
+        self._dict_tables[id(dct)] = (weakref.ref(dct), items, nm)
+        basic.log_message('Lookup table "{}" was built'.format(nm))
+        return nm
+
+    def _drop_dead_dictionary_tables(self):
+        for k, (r, _, nm) in list(self._dict_tables.items()):
+            if r() is None:
+                self._dict_tables.pop(k)
+                try:
+                    self.connection.execute('DROP TABLE "{}"'.format(nm))
+                except Exception as e:
+                    basic.ignore_exception(e)
+
+    def hold_work_db(self):
+        """ postpones adjust_work_db calls till release_work_db.
+            Moving the database commits the current transaction,
+            so it is held while a transaction should stay open.
+        """
+        self._work_db_holds += 1
+
+    def release_work_db(self, adjust=True):
+        """ ends hold_work_db. If adjust and there are no other holds
+            performs the postponed adjust_work_db.
+        """
+        self._work_db_holds -= 1
+        if self._work_db_holds == 0 and self._work_db_pending:
+            self._work_db_pending = False
+            if adjust:
+                self.adjust_work_db()
+
+    def adjust_work_db(self):
+        """ moves working database between :memory: and temporary file
+            according to current settings. Should be called when no
+            query results are pending.
+        """
+        if self._work_db_holds > 0:
+            self._work_db_pending = True
+            return
+        if self.work_db == 'file':
+            to_file = True
+        elif self.work_db == 'memory':
+            to_file = False
+        elif self.work_db_file is not None:
+            # auto mode never moves data back to memory
+            return
+        else:
+            to_file = self.work_db_size() > self.work_db_limit * 2**20
+        if to_file and self.work_db_file is None:
+            fd, fn = tempfile.mkstemp(prefix='biostata', suffix='.db')
+            os.close(fd)
+            self._move_work_db(fn)
+        elif not to_file and self.work_db_file is not None:
+            self._move_work_db(None)
+
+    def _move_work_db(self, fn):
+        """ copies main database to fn file (or :memory: if fn is None)
+            and restores connection state: functions, A database and
+            temporary views.
+        """
+        self.connection.commit()
+        c = self.connection.execute(
+            "SELECT sql FROM sqlite_temp_master WHERE type='view'")
+        views = [x[0] for x in c.fetchall()]
+        newcon = sqlite3.connect(fn if fn is not None else ':memory:')
+        self.connection.backup(newcon)
+        self.connection.close()
+        if self.work_db_file is not None:
+            os.remove(self.work_db_file)
+        self.connection, self.work_db_file = newcon, fn
+        if fn is not None:
+            for k, v in self.file_pragmas:
+                self.connection.execute('PRAGMA {} = {}'.format(k, v))
+        self.init_connection()
+        self.cursor = self.connection.cursor()
+        if self.has_A:
+            self.attach_database('A', self._A_file)
+        if self._spill_file is not None:
+            self._attach_spill_db()
+        for v in views:
+            # sqlite_temp_master keeps sql without TEMP keyword
+            self.query(re.sub(r'^CREATE\s+VIEW', 'CREATE TEMP VIEW', v))
+        basic.log_message('Working database was moved to {}'.format(
+            fn if fn is not None else 'memory'))
 
     def query(self, qr, dt=None):
         basic.log_message(" ".join(qr.split()))
+        m = _write_query.match(qr)
+        if m is not None:
+            self._write_counts.update(filter(None, m.groups()))
         if dt is None:
             self.cursor.execute(qr)
         else:
             self.cursor.executemany(qr, dt)
 
+    def write_count(self, tabname):
+        """ -> number of queries which have modified table tabname.
+               Used to invalidate data cached from the table.
+        """
+        return self._write_counts[tabname]
+
+    def fetch_chunks(self, qr, size, params=()):
+        """ yields lists of at most size rows returned by qr
+            with bound params. A separate cursor is used so other
+            queries could be made while iterating.
+        """
+        basic.log_message(" ".join(qr.split()))
+        cur = self.connection.execute(qr, params)
+        try:
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
     def qresult(self):
         return self.cursor.fetchone()
 
@@ -371,6 +763,7 @@ class SqlConnection:
         self.query('ATTACH DATABASE "{}" AS "{}"'.format(fn, alias))
         if alias == 'A':
             self.has_A = True
+            self._A_file = fn
 
     def detach_database(self, alias):
         try:
@@ -387,6 +780,11 @@ class SqlConnection:
             self.connection.create_aggregate(*r)
         for r in registered_sql_functions:
             self.connection.create_function(*r)
+        for nm, narg, func, is_aggr in self._custom_functions:
+            if is_aggr:
+                self.connection.create_aggregate(nm, narg, func)
+            else:
+                self.connection.create_function(nm, narg, func)
 
     def build_lambda_func(self, lambda_func):
         def sql_func(*args):
@@ -394,12 +792,14 @@ class SqlConnection:
 
         nm = "sql_custom_func_{}".format(self._i_sql_functions)
         self.connection.create_function(nm, -1, sql_func)
+        self._custom_functions.append((nm, -1, sql_func, False))
         self._i_sql_functions += 1
         return nm
 
     def build_aggr_func(self, aggr_class):
         nm = "sql_custom_aggr_func_{}".format(self._i_sql_functions)
         self.connection.create_aggregate(nm, -1, aggr_class)
+        self._custom_functions.append((nm, -1, aggr_class, True))
         self._i_sql_functions += 1
         return nm
 
@@ -55,6 +55,19 @@ class Command(object):
     def set_subcommand(self):
         self.__subcommand = True
 
+    def retained_bytes(self):
+        """ -> approximate size of undo data which command keeps
+               in the working database.
+            Counts self.act and self.acts entries which define
+            retained_bytes(). Commands which keep undo data elsewhere
+            should override it.
+        """
+        acts = list(getattr(self, 'acts', []))
+        if hasattr(self, 'act'):
+            acts.append(self.act)
+        return sum(a.retained_bytes() for a in acts
+                   if hasattr(a, 'retained_bytes'))
+
     # ------------ methods to override
     def _exec(self):
         """ command execution returns True
@@ -75,6 +88,8 @@ class Command(object):
 class CommandFlow(object):
     def __init__(self):
         self.maxundo = 20
+        # maximum size of undo data kept by commands
+        self.max_undo_bytes = 2**30
         # command list
         self._commands = []
         # commands[i > curposition] can be redone
@@ -137,8 +152,16 @@ class CommandFlow(object):
                     self._curpos = -1
                 self.command_done.emit()
 
+    def retained_bytes(self):
+        return sum(c.retained_bytes() for c in self._commands)
+
     def adjust_commands_count(self):
-        while self._curpos > self.maxundo:
+        """ removes oldest commands if their number or undo data size
+            exceed limits. Last executed command is always kept.
+        """
+        while self._curpos > self.maxundo or (
+                self._curpos > 0 and
+                self.retained_bytes() > self.max_undo_bytes):
             self._commands[0].reset()
             self._commands.pop(0)
             self._curpos -= 1
@@ -147,6 +170,10 @@ class CommandFlow(object):
         self.maxundo = val
         self.adjust_commands_count()
 
+    def set_max_undo_bytes(self, val):
+        self.max_undo_bytes = val
+        self.adjust_commands_count()
+
     def exec_all(self):
         while (self.can_redo()):
             a = self._curpos
@@ -284,3 +311,6 @@ class ActFromCommand:
 
     def undo(self):
         self.com.undo()
+
+    def retained_bytes(self):
+        return self.com.retained_bytes()
@@ -18,6 +18,7 @@ class NewDB(command.Command):
     def _exec(self):
         # detach
         if self.proj.sql.has_A:
+            self.proj.discard_lazy_tables()
             self.proj.sql.detach_database('A')
         # initialize proj
         self.proj.initialize()
@@ -32,6 +33,7 @@ class LoadDB(command.Command):
     def _exec(self):
         if not pathlib.Path(self.fname).exists():
             raise Exception('File not found {}'.format(self.fname))
+        self.proj.discard_lazy_tables()
         self.proj.sql.attach_database('A', self.fname)
 
         # database information
@@ -42,6 +44,8 @@ class LoadDB(command.Command):
         # names
         self.proj._curname = info.find('PROJ').text
         self.proj._curdir = pathlib.Path(info.find('CWD').text)
+        # tables are stored in self.fname
+        self.proj.set_current_filename(self.fname)
 
         # dictionaries
         self.proj.dictionaries.clear()
@@ -67,7 +71,6 @@ class LoadDB(command.Command):
             t = dtab.DataTable.from_xml(tab, self.proj)
             self.proj.add_table(t)
 
-        self.proj.set_current_filename(self.fname)
         self.proj.xml_loaded.emit(info)
         return True
 
@@ -81,6 +84,7 @@ class SaveDBAs(command.Command):
         #    if it is used by this application
         if self.proj.sql.has_A:
             self._bu_current_a = self.proj._curname
+            self.proj.load_lazy_tables()
             self.proj.sql.detach_database('A')
         else:
             self._bu_current_a = None
@@ -99,7 +103,7 @@ class SaveDBAs(command.Command):
                             [('',)])
 
         # 4) commit
-        self.proj.commit_all_changes()
+        self.proj.commit_all_changes(True)
 
         return True
 
@@ -20,6 +20,8 @@ class ProjectDB:
         self.dictionaries = []
         self.named_filters = []
         self.data_tables = []
+        # tables which read data directly from A database
+        self.lazy_tables = []
         self.xml_saved = basic.BSignal()
         self.xml_loaded = basic.BSignal()
 
@@ -81,13 +83,33 @@ class ProjectDB:
         if filedb != 'New database':
             self._curdir = pathlib.Path(filedb).parent
 
+    def load_lazy_tables(self, source=None):
+        """ copies to :memory: data of lazy tables which read
+            A.source table (all lazy tables if source is None).
+            Should be called before A tables are changed or detached.
+        """
+        for t in self.lazy_tables[:]:
+            if source is None or t._lazy_source == source:
+                t.load_ttab()
+
+    def discard_lazy_tables(self):
+        """ removes views of lazy tables before A is detached
+            without saving their data
+        """
+        for t in self.lazy_tables[:]:
+            t.destruct()
+
     def close_main_database(self):
         for t in self.data_tables:
             t.destruct()
+        self.discard_lazy_tables()
         self.sql.detach_database('A')
         self.initialize()
 
-    def commit_all_changes(self):
+    def commit_all_changes(self, full=False):
+        """ writes project state and tables which were changed since
+            the last commit. full -- rewrite all tables
+        """
         basic.log_message("Commit into {}".format(self._curname))
         if not self.sql.has_A:
             raise Exception("No file based database found")
@@ -105,11 +127,17 @@ class ProjectDB:
         tabs.remove('_INFO_')
         extabs = [x.name for x in self.data_tables]
         for t in filter(lambda x: x not in extabs, tabs):
+            self.load_lazy_tables(t)
             self.sql.query('DROP TABLE A."{}"'.format(t))
 
-        # write tables information
+        # write changed tables
         for table in self.data_tables:
-            table.write_to_db()
+            table.drop_unused_columns()
+            if full or table.name not in tabs or table.need_rewrite():
+                table.write_to_db()
+            else:
+                basic.log_message('Table "{}" is not changed'.format(
+                    table.name))
 
     def finish(self):
         basic.log_message("Close connection")
@@ -4,12 +4,21 @@
     2) to run specific tests invoke
        > python3 -m unittest utest.algotest.Test1.<spec test>
 """
+import os
+import csv
+import json
+import tempfile
 import copy
 import unittest
 import math
+import numpy as np
+import scipy.stats
+import openpyxl
 from prog import basic, projroot, command, comproj, bopts, valuedict, filt
-from fileproc import import_tab
-from bdata import convert, funccol
+from prog import bsqlproc
+from fileproc import import_tab, export
+from bdata import convert, funccol, dtab
+from bmat import npinterface, stats
 from utest import testutils as tu
 
 basic.set_log_message('file: ' + bopts.BiostataOptions.logfile())
@@ -124,6 +133,206 @@ class Test1(unittest.TestCase):
                              [0, None, 2, None, None,
                               1, 2, None, None, 2, None])
 
+    def test_load_chunked(self):
+        basic.log_message('================= TEST LOAD CHUNKED ===========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        flow.exec_command(com)
+        full = tu.get_dtab_raw(proj.get_table('t1'))
+
+        chunks = list(import_tab.iter_plain_text('test_db/t2.dat', opt, 4))
+        self.assertListEqual([len(x) for x in chunks], [4, 4, 4])
+
+        opt2 = copy.deepcopy(opt)
+        opt2.tabname = 't2'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt2)
+        com.chunk_size = 3
+        com.preview_size = 5
+        # encoding is detected once for all source passes
+        detect = import_tab.detect_encoding
+        detected = []
+        import_tab.detect_encoding = lambda f: detected.append(f) or detect(f)
+        try:
+            com._prebuild()
+            self.assertEqual(len(com.tab), 5)
+            self.assertListEqual(com.unique_values(3), ['', 'F', 'noF'])
+            # skip second column
+            com.columns = [0, 2, 3, 4, 5, 6]
+            com.caps.pop(1)
+            com.tps.pop(1)
+            com.dnames.pop(1)
+            flow.exec_command(com)
+        finally:
+            import_tab.detect_encoding = detect
+        self.assertListEqual(detected, ['test_db/t2.dat'])
+        self.assertEqual(com.encoding, 'utf8')
+        dt = proj.get_table('t2')
+        self.assertEqual(dt.n_total_rows(), 11)
+        self.assertListEqual(tu.get_dtab_raw(dt), full[:2] + full[3:])
+
+    def test_load_csv(self):
+        basic.log_message('================= TEST LOAD CSV ===============')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'csv'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t4.csv', opt)
+        com._prebuild()
+        self.assertListEqual(com.caps, ['name', 'comment', 'val'])
+        self.assertListEqual(com.tps, ['TEXT', 'TEXT', 'REAL'])
+        self.assertGreater(com.rows_per_second, 0)
+        flow.exec_command(com)
+        self.assertEqual(com.n_rows, 4)
+        self.assertEqual(com.max_row_size, 3)
+        dt = proj.get_table('t1')
+        # continuation line of a quoted value is not a comment
+        self.assertListEqual(tu.get_dtab_raw(dt)[1:],
+                             [['a, b', 'c', 'd', 'f'],
+                              ['line1\nline2', 'say "hi"', 'e', 'note\n#2'],
+                              [1.0, 2.5, 3.0, 4.0]])
+
+    def test_batch_import(self):
+        basic.log_message('================= TEST BATCH IMPORT ===========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'csv'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = ''
+        # one table per file
+        com = import_tab.ImportTabsBatch.from_glob(
+            proj, 'test_db/batch*.csv', opt)
+        progress = []
+        self.assertTrue(com.parse(lambda *a: progress.append(a[2])))
+        self.assertEqual(progress[-1], 1)
+        flow.exec_command(com)
+        self.assertListEqual([x.table_name() for x in com.tables()],
+                             ['batch1', 'batch2'])
+        self.assertTrue(all(c.parsed is None for c in com.coms))
+        dt = proj.get_table('batch1')
+        self.assertListEqual(tu.get_dtab_raw(dt)[1:],
+                             [[1, 2], ['a', 'b']])
+        dt = proj.get_table('batch2')
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'x'), [3.5])
+        flow.undo_prev()
+        self.assertNotIn('batch1',
+                         [x.table_name() for x in proj.data_tables])
+        # merged table with source column
+        com = import_tab.ImportTabsBatch.from_glob(
+            proj, 'test_db/batch*.csv', opt, 'batch')
+        flow.exec_command(com)
+        dt = proj.get_table('batch')
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'x'),
+                             [1.0, 2.0, 3.5])
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'source'),
+                             ['batch1.csv', 'batch1.csv', 'batch2.csv'])
+        # working database is moved after the import transaction
+        sql = proj.sql
+        com = import_tab.ImportTabsBatch.from_glob(
+            proj, 'test_db/batch*.csv', opt)
+        # number of inserted sources at each move
+        moves = []
+        move = sql._move_work_db
+        sql._move_work_db = lambda fn: moves.append(len(com.acts)) or move(fn)
+        try:
+            sql.set_work_db('auto', (sql.work_db_size() + 1) / 2**20)
+            self.assertListEqual(moves, [])
+            flow.exec_command(com)
+            self.assertIsNotNone(sql.work_db_file)
+            self.assertListEqual(moves, [2])
+            dt = proj.get_table('batch2')
+            self.assertListEqual(tu.get_dtab_raw_column(dt, 'x'), [3.5])
+        finally:
+            del sql._move_work_db
+            sql.set_work_db('memory', 0)
+        # cancelled parsing leaves no parsed files
+        com = import_tab.ImportTabsBatch.from_glob(
+            proj, 'test_db/batch*.csv', opt)
+        self.assertFalse(com.parse(lambda *a: 1))
+        self.assertTrue(all(c.parsed is None for c in com.coms))
+
+    def test_infer_types(self):
+        chunks = [[['1', '1.5', 'a', '', '1']] * 1000,
+                  [['2', '2', '3', '', '2.5'],
+                   ['', 'x', '4e2', '', '-1']]]
+        ret = import_tab.infer_types(chunks)
+        self.assertListEqual([x.tp for x in ret],
+                             ['INT', 'TEXT', 'TEXT', 'INT', 'REAL'])
+        self.assertListEqual([x.n_null for x in ret], [1, 0, 0, 1002, 0])
+        self.assertListEqual([x.n_invalid for x in ret], [0, 1, 1000, 0, 0])
+        self.assertListEqual(import_tab.infer_types([]), [])
+        # nan and inf are not numbers
+        ret = import_tab.infer_types([[['nan', '1.5'], ['1', 'inf']]])
+        self.assertListEqual([x.tp for x in ret], ['TEXT', 'TEXT'])
+        self.assertListEqual([x.n_invalid for x in ret], [1, 1])
+        self.assertListEqual(import_tab.autodetect_types(
+            [['1', None, '2.'], ['', 'a', '3']]), ['INT', 'TEXT', 'REAL'])
+
+    def test_import_late_types(self):
+        basic.log_message('================= TEST IMPORT LATE TYPES =====')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        # wider values appear long after the preview rows
+        tmpdir = tempfile.mkdtemp()
+        fn1 = os.path.join(tmpdir, 'late1.txt')
+        fn2 = os.path.join(tmpdir, 'late2.txt')
+        with open(fn1, 'w') as fid:
+            fid.write('x y\n')
+            fid.writelines('{0} {0}\n'.format(i) for i in range(5000))
+            fid.write('1.5 a\n')
+        with open(fn2, 'w') as fid:
+            fid.write('x y\n')
+            fid.writelines('{0} {0}\n'.format(i) for i in range(3000))
+
+        com = import_tab.ImportTabFromTxt(proj, fn1, opt)
+        com._prebuild()
+        self.assertEqual(len(com.tab), com.preview_size)
+        self.assertEqual(com.n_rows, 5001)
+        self.assertListEqual(com.tps, ['REAL', 'TEXT'])
+        self.assertListEqual([x.n_invalid for x in com.type_info], [0, 1])
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        self.assertEqual(tu.get_dtab_raw_column(dt, 'x')[-1], 1.5)
+        self.assertEqual(tu.get_dtab_raw_column(dt, 'y')[-1], 'a')
+
+        # merged sources get the widest type of all their rows
+        com = import_tab.ImportTabsBatch.from_glob(
+            proj, os.path.join(tmpdir, 'late*.txt'), opt, 'late')
+        flow.exec_command(com)
+        dt = proj.get_table('late')
+        self.assertEqual(dt.get_column('x').dt_type, 'REAL')
+        self.assertEqual(dt.get_column('y').dt_type, 'TEXT')
+        x = tu.get_dtab_raw_column(dt, 'x')
+        self.assertEqual(len(x), 8001)
+        self.assertEqual(x[5000], 1.5)
+
     def test_load_from_xlsx(self):
         basic.log_message('================= TEST LOAD FROM XLSX ========')
         opt1 = basic.CustomObject()
@@ -598,6 +807,391 @@ class Test1(unittest.TestCase):
         flow.exec_command(c)
         self.assertEqual(proj.data_tables[0].name, 't1')
 
+    def test_incremental_save(self):
+        basic.log_message('================= TEST INCREMENTAL SAVE =======')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        for nm in ['t1', 't2']:
+            opt.tabname = nm
+            flow.exec_command(import_tab.ImportTabFromTxt(
+                proj, 'test_db/t1.dat', copy.deepcopy(opt)))
+        t1, t2 = proj.data_tables
+        self.assertTrue(t1.need_rewrite())
+        flow.exec_command(comproj.SaveDBAs(proj, "dbg.db"))
+        self.assertFalse(t1.need_rewrite())
+        self.assertFalse(t2.need_rewrite())
+
+        def stored_rows(nm):
+            proj.sql.query('SELECT COUNT(*) FROM A."{}"'.format(nm))
+            return proj.sql.qresult()[0]
+
+        # stored copies of clean tables are not rewritten
+        n = stored_rows('t1')
+        proj.sql.query('DELETE FROM A."t1"')
+        proj.sql.query('DELETE FROM A."t2"')
+        t2.reset_id()
+        self.assertFalse(t1.need_rewrite())
+        self.assertTrue(t2.need_rewrite())
+        proj.commit_all_changes()
+        self.assertEqual(stored_rows('t1'), 0)
+        self.assertEqual(stored_rows('t2'), n)
+
+        # renamed table is written with the new name
+        a = command.ActChangeAttr(t1, 'name', 't3')
+        a.redo()
+        self.assertTrue(t1.need_rewrite())
+        proj.commit_all_changes()
+        self.assertEqual(stored_rows('t3'), n)
+
+        flow.exec_command(comproj.LoadDB(proj, "dbg.db"))
+        self.assertListEqual([t.need_rewrite() for t in proj.data_tables],
+                             [False, False])
+
+    def test_lazy_load(self):
+        basic.log_message('================= TEST LAZY LOAD ==============')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        for nm in ['t1', 't2']:
+            opt.tabname = nm
+            flow.exec_command(import_tab.ImportTabFromTxt(
+                proj, 'test_db/t1.dat', copy.deepcopy(opt)))
+        proj.data_tables[0].update()
+        data = tu.get_dtab_raw(proj.data_tables[0])
+        flow.exec_command(comproj.SaveDBAs(proj, "dbg.db"))
+        flow.exec_command(comproj.LoadDB(proj, "dbg.db"))
+        t1, t2 = proj.data_tables
+        self.assertTrue(t1.is_lazy() and t2.is_lazy())
+        self.assertEqual(len(proj.lazy_tables), 2)
+
+        # read only queries are served from the file table
+        t1.update()
+        self.assertListEqual(tu.get_dtab_raw(t1), data)
+        self.assertTrue(t1.is_lazy())
+        self.assertFalse(t1.need_rewrite())
+
+        # the first modification loads data into memory
+        t1.reset_id()
+        t1.update()
+        self.assertFalse(t1.is_lazy())
+        self.assertListEqual(tu.get_dtab_raw(t1), data)
+
+        # renamed lazy table is rewritten, its source is loaded before drop
+        a = command.ActChangeAttr(t2, 'name', 't3')
+        a.redo()
+        proj.commit_all_changes()
+        self.assertFalse(t2.is_lazy())
+        t2.update()
+        self.assertListEqual(tu.get_dtab_raw(t2), data)
+
+        flow.exec_command(comproj.LoadDB(proj, "dbg.db"))
+        self.assertListEqual([t.name for t in proj.data_tables],
+                             ['t1', 't3'])
+        # file is rewritten from memory
+        flow.exec_command(comproj.SaveDBAs(proj, "dbg.db"))
+        self.assertListEqual(proj.lazy_tables, [])
+        flow.exec_command(comproj.LoadDB(proj, "dbg.db"))
+        proj.data_tables[1].update()
+        self.assertListEqual(tu.get_dtab_raw(proj.data_tables[1]), data)
+        flow.exec_command(comproj.NewDB(proj))
+        self.assertListEqual(proj.lazy_tables, [])
+
+    def test_work_db(self):
+        basic.log_message('================= TEST WORKING DATABASE =======')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        flow.exec_command(import_tab.ImportTabFromTxt(
+            proj, 'test_db/t1.dat', opt))
+        flow.exec_command(comproj.SaveDBAs(proj, "dbg.db"))
+        flow.exec_command(comproj.LoadDB(proj, "dbg.db"))
+        dt = proj.data_tables[0]
+        dt.update()
+        data = tu.get_dtab_raw(dt)
+        try:
+            # lazy view and attached database survive the move
+            proj.sql.set_work_db('file', 0)
+            fn = proj.sql.work_db_file
+            self.assertTrue(os.path.exists(fn))
+            self.assertTrue(dt.is_lazy())
+            dt.update()
+            self.assertListEqual(tu.get_dtab_raw(dt), data)
+            dt.reset_id()
+            dt.update()
+            self.assertListEqual(tu.get_dtab_raw(dt), data)
+
+            proj.sql.set_work_db('memory', 0)
+            self.assertIsNone(proj.sql.work_db_file)
+            self.assertFalse(os.path.exists(fn))
+            dt.update()
+            self.assertListEqual(tu.get_dtab_raw(dt), data)
+
+            # auto mode moves data above the limit
+            proj.sql.set_work_db('auto', 1000)
+            self.assertIsNone(proj.sql.work_db_file)
+            proj.sql.set_work_db('auto', 0)
+            self.assertIsNotNone(proj.sql.work_db_file)
+        finally:
+            proj.sql.set_work_db('memory', 0)
+
+    def test_undo_budget(self):
+        basic.log_message('================= TEST UNDO BUDGET ============')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        flow.exec_command(import_tab.ImportTabFromTxt(
+            proj, 'test_db/t1.dat', opt))
+        dt = proj.data_tables[0]
+        dt.update()
+        data = tu.get_dtab_raw(dt)
+        cname = dt.all_columns[1].name
+
+        def rename(old, new):
+            conv = convert.TableConverter(dt)
+            conv.colitem(old).new_name = new
+            flow.exec_command(convert.ConvertTable(conv))
+
+        spill_size = proj.sql.undo_spill_size
+        native_alter = bsqlproc.native_alter_column
+        try:
+            # whole table backup copy is kept in memory
+            bsqlproc.native_alter_column = False
+            rename(cname, 'r1')
+            self.assertGreater(flow.retained_bytes(), 0)
+            # undo data of a single act is counted too
+            act = basic.CustomObject()
+            act.retained_bytes = lambda: 10
+            self.assertEqual(command.Command(act=act).retained_bytes(), 10)
+            # ... or in spill database
+            proj.sql.undo_spill_size = 0
+            rename('r1', 'r2')
+            self.assertEqual(flow.last_command().retained_bytes(), 0)
+            flow.undo_prev()
+            dt.update()
+            self.assertEqual(dt.all_columns[1].name, 'r1')
+            self.assertListEqual(tu.get_dtab_raw(dt), data)
+            flow.exec_next()
+            dt.update()
+            self.assertEqual(dt.all_columns[1].name, 'r2')
+            self.assertListEqual(tu.get_dtab_raw(dt), data)
+
+            # old commands are removed when budget is exceeded
+            proj.sql.undo_spill_size = spill_size
+            flow.set_max_undo_bytes(0)
+            self.assertEqual(flow.com_count(), 1)
+            rename('r2', 'r3')
+            self.assertEqual(flow.com_count(), 1)
+            flow.undo_prev()
+            self.assertFalse(flow.can_undo())
+            dt.update()
+            self.assertListEqual(tu.get_dtab_raw(dt), data)
+        finally:
+            proj.sql.undo_spill_size = spill_size
+            bsqlproc.native_alter_column = native_alter
+            flow.set_max_undo_bytes(2**30)
+
+    @unittest.skipUnless(bsqlproc.native_alter_column,
+                         "sqlite does not support column alter")
+    def test_column_conversion(self):
+        basic.log_message('================= TEST COLUMN CONVERSION ======')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        flow.exec_command(import_tab.ImportTabFromTxt(
+            proj, 'test_db/t1.dat', opt))
+        dt = proj.data_tables[0]
+        dt.update()
+        x = tu.get_dtab_raw_column(dt, 'x_int')
+        y = tu.get_dtab_raw_column(dt, 'y_real')
+        ttab = dt.ttab_name
+
+        def sql_columns():
+            dt.query('PRAGMA table_info("{}")'.format(dt.ttab_name))
+            return [c[1] for c in dt.qresults()]
+
+        # int -> real and real column rename
+        conv = convert.TableConverter(dt)
+        conv.colitem('x_int').set_conversation(['REAL', '', ''])
+        conv.colitem('y_real').new_name = 'y'
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+        self.assertEqual(dt.ttab_name, ttab)
+        self.assertEqual(dt.get_column('x_int').dt_type, 'REAL')
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'x_int'),
+                             [float(v) for v in x])
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'y'), y)
+        # only old x_int data are kept hidden
+        self.assertEqual(len(sql_columns()), 2 * len(dt.all_columns) + 1)
+
+        flow.undo_prev()
+        dt.update()
+        self.assertEqual(dt.get_column('x_int').dt_type, 'INT')
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'x_int'), x)
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'y_real'), y)
+        flow.exec_next()
+
+        # removed columns are hidden until their command is dropped
+        conv = convert.TableConverter(dt)
+        conv.colitem('y').do_remove = True
+        flow.exec_command(convert.ConvertTable(conv))
+        n = len(sql_columns())
+        flow.undo_prev()
+        dt.update()
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'y'), y)
+        flow.exec_next()
+        # first conversion is dropped with its hidden columns
+        flow.set_maxundo(0)
+        flow.set_maxundo(20)
+        self.assertEqual(len(sql_columns()), n - 1)
+        dt.update()
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'x_int'),
+                             [float(v) for v in x])
+
+    @unittest.skipUnless(bsqlproc.native_alter_column,
+                         "sqlite does not support column alter")
+    def test_conversion_eviction(self):
+        basic.log_message('================= TEST CONVERSION EVICTION ===')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        fn = os.path.join(tempfile.mkdtemp(), 'evict.txt')
+        with open(fn, 'w') as fid:
+            fid.write('x y\n')
+            fid.writelines('{0} {0}\n'.format(i) for i in range(20000))
+        flow.exec_command(import_tab.ImportTabFromTxt(proj, fn, opt))
+        dt = proj.get_table('t1')
+        dt.update()
+        x = tu.get_dtab_raw_column(dt, 'x')
+
+        def hidden_columns():
+            dt.query('PRAGMA table_info("{}")'.format(dt.ttab_name))
+            return [c[1] for c in dt.qresults()
+                    if c[1].startswith(('_bu', '_new'))]
+
+        def last_hidden():
+            # hidden columns of executed last step
+            return [c[1:-1] for a in flow.last_command().acts
+                    if isinstance(a, convert._ColumnsAlterAct)
+                    for c in a.hidden_done]
+
+        try:
+            for tp in ['REAL', 'INT'] * 3:
+                conv = convert.TableConverter(dt)
+                conv.colitem('x').set_conversation([tp, '', ''])
+                flow.exec_command(convert.ConvertTable(conv))
+            self.assertGreater(len(hidden_columns()), len(last_hidden()))
+            size = proj.sql.work_db_size()
+
+            # evicted steps take their hidden columns away
+            flow.set_max_undo_bytes(1)
+            self.assertEqual(flow.com_count(), 1)
+            self.assertCountEqual(hidden_columns(), last_hidden())
+            self.assertLess(proj.sql.work_db_size(), size)
+            dt.update()
+            self.assertEqual(dt.get_column('x').dt_type, 'INT')
+            self.assertListEqual(tu.get_dtab_raw_column(dt, 'x'), x)
+
+            # ... and so do steps which are reset from redo stack
+            flow.undo_prev()
+            conv = convert.TableConverter(dt)
+            conv.colitem('y').set_conversation(['REAL', '', ''])
+            flow.exec_command(convert.ConvertTable(conv))
+            self.assertCountEqual(hidden_columns(), last_hidden())
+            dt.update()
+            self.assertEqual(dt.get_column('x').dt_type, 'REAL')
+        finally:
+            flow.set_max_undo_bytes(2**30)
+
+    def test_dictionary_lookup(self):
+        basic.log_message('================= TEST DICTIONARY LOOKUP ======')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'csv'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        flow.exec_command(import_tab.ImportTabFromTxt(
+            proj, 'test_db/t4.csv', opt))
+        dt = proj.get_table('t1')
+        dct = valuedict.Dictionary('qdict', 'ENUM', [1, 2, 5],
+                                   ['a, b', "it's", 'd'])
+        flow.exec_command(comproj.AddDictionary(proj, dct))
+
+        # text to values through lookup table
+        conv = convert.TableConverter(dt)
+        conv.colitem('name').set_conversation(
+            ['ENUM', 'qdict', 'text to values'])
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'name'),
+                             [1, None, 5, None])
+        nm = proj.sql.dictionary_table(dct)
+        self.assertEqual(proj.sql.dictionary_table(dct), nm)
+        dt.query('SELECT "_key", "_value" FROM "{}"'.format(nm))
+        self.assertListEqual(dt.qresults(),
+                             [(1, 'a, b'), (2, "it's"), (5, 'd')])
+
+        # collapsed categories are represented in sql
+        flow.exec_command(funccol.MergeCategories(
+            dt, ['name', 'comment'], '|', False))
+        dt.update()
+        self.assertListEqual(tu.get_dtab_column(dt, 'name|comment'),
+                             ['a, b|line1\nline2', '##|say "hi"', 'd|e',
+                              '##|note\n#2'])
+
+        # values to text
+        conv = convert.TableConverter(dt)
+        conv.colitem('name').set_conversation(['TEXT', '', 'values to text'])
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+        self.assertListEqual(tu.get_dtab_raw_column(dt, 'name'),
+                             ['a, b', None, 'd', None])
+
     def test_functions(self):
         basic.log_message('===================== TEST FUNCTIONS ===========')
         opt = basic.CustomObject()
@@ -693,6 +1287,712 @@ class Test1(unittest.TestCase):
         col = tu.get_dtab_column(dt, 'int_sin')
         self.assertAlmostEqual(sum(col[:3]), sum([0.22997014437065483, 0.8059085741205286, 0.5374542384689438]))  # noqa
 
+    def test_view_data(self):
+        basic.log_message('===================== TEST VIEW DATA ===========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        com._prebuild()
+        com.caps = ["c{}".format(i) for i in range(7)]
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        dt.update()
+        full = tu.get_dtab(dt)
+
+        # paged fetching gives the same data
+        bu = (dtab.ViewedData.page_size, dtab.ViewedData.max_pages,
+              dtab.ViewedData.max_query_parameters)
+        dtab.ViewedData.page_size, dtab.ViewedData.max_pages = 3, 2
+        # sub values keys are queried one by one
+        dtab.ViewedData.max_query_parameters = 1
+        try:
+            dt.update()
+            self.assertEqual(dt.n_rows(), 11)
+            self.assertListEqual(tu.get_dtab(dt), full)
+            self.assertListEqual(dt.get_raw_column_values('c1').tolist(),
+                                 tu.get_dtab_raw_column(dt, 'c1'))
+            self.assertLessEqual(len(dt.tab.pages), 2)
+
+            # grouping: sub values of all groups
+            dt.group_by = [dt.get_column('c0').id]
+            dt.update()
+            self.assertEqual(dt.n_rows(), 6)
+            self.assertListEqual([dt.n_subrows(i) for i in range(6)],
+                                 [1, 4, 3, 1, 1, 1])
+            self.assertListEqual(dt.get_raw_subvalues(1, 2), [2, 3, 4, 2])
+            self.assertListEqual(dt.get_subvalues(2, 0), [3, 7, 10])
+            self.assertEqual(dt.n_subdata_unique(1, 1), 1)
+        finally:
+            (dtab.ViewedData.page_size, dtab.ViewedData.max_pages,
+             dtab.ViewedData.max_query_parameters) = bu
+
+        # cached views
+        pages = dt.tab.pages
+        dt.group_by = []
+        dt.update()
+        dt.group_by = [dt.get_column('c0').id]
+        dt.update()
+        self.assertIs(dt.tab.pages, pages)
+        dt.reset_id()
+        dt.update()
+        self.assertIsNot(dt.tab.pages, pages)
+        # any sql write to the table drops cached views
+        pages = dt.tab.pages
+        proj.sql.query('UPDATE "{}" SET "c1" = "c1"'.format(dt.ttab_name))
+        dt.update()
+        self.assertIsNot(dt.tab.pages, pages)
+        self.assertListEqual([dt.n_subrows(i) for i in range(6)],
+                             [1, 4, 3, 1, 1, 1])
+
+    def test_export(self):
+        basic.log_message('===================== TEST EXPORT ==============')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        com._prebuild()
+        com.caps = ["c{}".format(i) for i in range(7)]
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        conv = convert.TableConverter(dt)
+        conv.colitem('c1').set_conversation(['ENUM', '0-9', 'int to keys'])
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+
+        eopt = basic.CustomObject()
+        eopt.filename = os.path.join(tempfile.mkdtemp(), 'e.csv')
+        eopt.format = 'csv'
+        eopt.with_caption = True
+        eopt.with_id = False
+        eopt.numeric_enums = False
+        eopt.grouped_categories = 'None'
+
+        def exported():
+            export.model_export(dt, eopt)
+            with open(eopt.filename, newline='') as fid:
+                return list(csv.reader(fid))
+
+        def expected(i, j):
+            v = dt.get_value(i, j)
+            return '' if v is None else str(v)
+
+        bu = export.export_chunk_size
+        export.export_chunk_size = 4
+        try:
+            ret = exported()
+            self.assertListEqual(ret[0], [dt.column_caption(j)
+                                          for j in range(1, dt.n_cols())])
+            self.assertListEqual(ret[1:], [
+                [expected(i, j) for j in range(1, dt.n_cols())]
+                for i in range(dt.n_rows())])
+            self.assertIn(dt.get_value(0, 1), ret[1])
+            # write only xlsx
+            eopt.format = 'xlsx'
+            eopt.filename = eopt.filename[:-3] + 'xlsx'
+            eopt.with_formatting = False
+            export.model_export(dt, eopt)
+            ws = openpyxl.load_workbook(eopt.filename).active
+            self.assertListEqual([c.value for c in ws[2]], [
+                dt.get_value(0, j) for j in range(1, dt.n_cols())])
+            self.assertEqual(ws.max_row, dt.n_rows() + 1)
+            eopt.format = 'csv'
+            eopt.filename = eopt.filename[:-4] + 'csv'
+
+            # grouped categories
+            dt.group_by = [dt.get_column('c0').id]
+            dt.update()
+            eopt.with_id = True
+            eopt.grouped_categories = 'Comma separated'
+            ret = exported()
+            self.assertEqual(len(ret), dt.n_rows() + 1)
+            for i in range(dt.n_rows()):
+                for j in range(dt.n_cols()):
+                    if dt.get_value(i, j) is None and dt.n_subrows(i) > 1:
+                        # values are concatenated in id order
+                        ids = dt.get_raw_subvalues(i, 0)
+                        vals = [str(v) for _, v in sorted(
+                            zip(ids, dt.get_subvalues(i, j)))]
+                        self.assertListEqual(ret[i + 1][j].split(','), vals)
+                    else:
+                        self.assertEqual(ret[i + 1][j], expected(i, j))
+            eopt.grouped_categories = 'Unique count'
+            eopt.format = 'plain text'
+            export.model_export(dt, eopt)
+            with open(eopt.filename) as fid:
+                ret = [x.rstrip('\n').split('\t') for x in fid]
+            self.assertEqual(ret[2][0], bsqlproc.group_repr(4))
+        finally:
+            export.export_chunk_size = bu
+            dt.group_by = []
+
+    def test_binary_export(self):
+        basic.log_message('================= TEST BINARY EXPORT ==========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        com._prebuild()
+        com.caps = ["c{}".format(i) for i in range(7)]
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        conv = convert.TableConverter(dt)
+        conv.colitem('c1').set_conversation(['ENUM', '0-9', 'int to keys'])
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+
+        eopt = basic.CustomObject()
+        eopt.with_id = False
+        tmpdir = tempfile.mkdtemp()
+
+        def exported(fmt):
+            """ -> header, {array name: array} read back from file """
+            eopt.format = fmt
+            if fmt == 'npz':
+                eopt.filename = os.path.join(tmpdir, 'e.npz')
+                export.model_export(dt, eopt)
+                arch = np.load(eopt.filename)
+                return json.loads(arch['header'].item()), arch
+            eopt.filename = os.path.join(tmpdir, 'e')
+            export.model_export(dt, eopt)
+            with open(os.path.join(eopt.filename, 'header.json')) as fid:
+                header = json.load(fid)
+            arrays = {}
+            for fn in os.listdir(eopt.filename):
+                if fn.endswith('.npy'):
+                    arrays[fn[:-4]] = np.load(
+                        os.path.join(eopt.filename, fn), mmap_mode='r')
+            return header, arrays
+
+        for fmt in ['npz', 'npy directory']:
+            header, arrays = exported(fmt)
+            self.assertEqual(header['n_rows'], dt.n_rows())
+            self.assertListEqual([c['name'] for c in header['columns']],
+                                 [c.name for c in dt.visible_columns[1:]])
+            cinfo = {c['name']: c for c in header['columns']}
+            self.assertEqual(cinfo['c1']['type'], 'ENUM')
+            self.assertListEqual(cinfo['c1']['dictionary'], [
+                [k, v] for k, v in dt.get_column('c1').repr_delegate.dict.
+                kvalues.items()])
+            self.assertEqual(cinfo['c4']['type'], 'REAL')
+            for c in header['columns']:
+                raw = tu.get_dtab_raw_column(dt, c['name'])
+                a = arrays[c['array']]
+                null = np.unpackbits(arrays[c['array'] + '_null'])
+                null = null[:header['n_rows']].astype(bool)
+                self.assertListEqual(null.tolist(),
+                                     [x is None for x in raw])
+                if c['type'] == 'REAL':
+                    self.assertEqual(a.dtype, np.float64)
+                    self.assertListEqual(np.isnan(a).tolist(),
+                                         null.tolist())
+                self.assertListEqual(a[~null].tolist(),
+                                     [x for x in raw if x is not None])
+            # REAL columns contain NULL values
+            self.assertTrue(np.isnan(arrays[cinfo['c4']['array']]).any())
+
+        # empty filtered table
+        flt = filt.Filter.from_xml_string("""<F><NAME/><DO_REMOVE>1</DO_REMOVE><E>['AND','','',"('c2', 'INT', None)",'&lt;','1000']</E></F>""")    # noqa
+        flow.exec_command(comproj.AddFilter(proj, flt, [dt]))
+        dt.update()
+        self.assertEqual(dt.n_rows(), 0)
+        for fmt in ['npz', 'npy directory']:
+            header, arrays = exported(fmt)
+            self.assertEqual(header['n_rows'], 0)
+            self.assertEqual(header['columns'][1]['name'], 'c1')
+            self.assertIn('dictionary', header['columns'][1])
+            for c in header['columns']:
+                self.assertEqual(len(arrays[c['array']]), 0)
+
+    def test_xlsx_formatting(self):
+        basic.log_message('================= TEST XLSX FORMATTING ========')
+        from PyQt5 import QtWidgets
+        # bgui modules need an application instance (see guitest.qApp),
+        # it is kept by the test class to live until the end of the run
+        if QtWidgets.QApplication.instance() is None:
+            Test1.qApp = QtWidgets.QApplication([])
+        from bgui import tmodel
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        com._prebuild()
+        com.caps = ["c{}".format(i) for i in range(7)]
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        dt.group_by = [dt.get_column('c0').id]
+        dt.update()
+        model = tmodel.TabModel(dt)
+        model.coloring.use = True
+        model.coloring.set_column(dt, dt.get_column('c4'))
+        model.coloring.update(dt)
+        colors = model.coloring.rgb_colors()
+
+        eopt = basic.CustomObject()
+        eopt.filename = os.path.join(tempfile.mkdtemp(), 'e.xlsx')
+        eopt.format = 'xlsx'
+        eopt.with_caption = True
+        eopt.with_id = True
+        eopt.with_formatting = True
+        eopt.numeric_enums = False
+        eopt.grouped_categories = 'None'
+        bu = export.export_chunk_size
+        export.export_chunk_size = 2
+        try:
+            export.model_export(dt, eopt, model)
+        finally:
+            export.export_chunk_size = bu
+            dt.group_by = []
+        ws = openpyxl.load_workbook(eopt.filename).active
+        rows = list(ws.iter_rows())
+        self.assertEqual(len(rows), dt.n_rows() + 1)
+        caption_bg = model.conf.caption_color.name()[1:].upper()
+        self.assertListEqual([c.value for c in rows[0]], [
+            dt.column_caption(j) for j in range(dt.n_cols())])
+        for c in rows[0]:
+            self.assertEqual(c.fill.fgColor.rgb[-6:], caption_bg)
+        for i, r in enumerate(rows[1:]):
+            self.assertEqual(r[0].value, dt.get_value(i, 0))
+            self.assertEqual(r[0].fill.fgColor.rgb[-6:], caption_bg)
+            bg = '{:02X}{:02X}{:02X}'.format(*colors[i])
+            for j, c in enumerate(r[1:], 1):
+                self.assertEqual(c.fill.fgColor.rgb[-6:], bg)
+                # empty strings are read back as None
+                v = dt.get_value(i, j)
+                if isinstance(v, float):
+                    self.assertAlmostEqual(c.value, v)
+                else:
+                    self.assertEqual(c.value, None if v == '' else v)
+
+    def test_matrix_values(self):
+        basic.log_message('================= TEST MATRIX VALUES ==========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        com._prebuild()
+        com.caps = ["c{}".format(i) for i in range(7)]
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        dt.update()
+        cn = ['c1', 'c4', 'c6']
+        raw, rind = npinterface.mat_raw_values(dt, cn, rowind=True)
+        raw = raw.astype(float)
+
+        m, ind = npinterface.mat_float_values(dt, cn, rowind=True)
+        self.assertEqual(m.dtype, np.float64)
+        self.assertTrue(m.flags['C_CONTIGUOUS'])
+        self.assertTrue(np.array_equal(m, raw))
+        self.assertListEqual(ind.tolist(), rind.tolist())
+
+        m = npinterface.mat_float_values(dt, cn, cols_to_rows=False,
+                                         order='F', chunk_size=3)
+        self.assertTrue(m.flags['F_CONTIGUOUS'])
+        self.assertTrue(np.array_equal(m, raw.T))
+
+        m = npinterface.mat_float_values(dt, cn, drop_missing=False,
+                                         chunk_size=4)
+        self.assertEqual(m.shape, (3, dt.n_rows()))
+        nan = [x is None for x in tu.get_dtab_raw_column(dt, 'c6')]
+        self.assertListEqual(np.isnan(m[2]).tolist(), nan)
+        self.assertGreater(sum(nan), 0)
+
+        # streaming covariance
+        acc = stats.stream_covariance(dt, cn, False, chunk_size=4)
+        self.assertTrue(np.allclose(acc.covariance(False), np.cov(raw)))
+        self.assertTrue(np.allclose(acc.correlation(), np.corrcoef(raw)))
+        acc = stats.stream_covariance(dt, cn, True, chunk_size=5)
+        part = stats.CovarianceAccumulator(3)
+        part.add(m.T[:6])
+        part2 = stats.CovarianceAccumulator(3)
+        part2.add(m.T[6:])
+        part.merge(part2)
+        self.assertTrue(np.allclose(part.covariance(), acc.covariance()))
+        full = ~np.isnan(m[0]) & ~np.isnan(m[1])
+        self.assertTrue(np.allclose(acc.covariance()[0, 1], np.cov(
+            m[0, full], m[1, full], bias=True)[0, 1]))
+
+    def test_covariance_accumulator(self):
+        basic.log_message('================= TEST COVARIANCE =============')
+        rs = np.random.RandomState(0)
+        x = rs.normal(size=(60, 4))
+        x[:, 1] += x[:, 0]
+        x[rs.uniform(size=x.shape) < 0.2] = np.nan
+        valid = ~np.isnan(x)
+        complete = valid.all(axis=1)
+
+        # listwise
+        acc = stats.CovarianceAccumulator(4, pairwise=False)
+        for i in range(0, len(x), 7):
+            acc.add(x[i:i + 7])
+        self.assertTrue(np.all(acc.n == complete.sum()))
+        self.assertTrue(np.allclose(acc.covariance(False),
+                                    np.cov(x[complete].T)))
+        self.assertTrue(np.allclose(acc.correlation(),
+                                    np.corrcoef(x[complete].T)))
+
+        # pairwise, merged from partial accumulators
+        parts = [stats.CovarianceAccumulator(4) for _ in range(3)]
+        for i in range(0, len(x), 9):
+            parts[i % 3].add(x[i:i + 9])
+        acc = parts[0]
+        acc.merge(parts[1])
+        acc.merge(parts[2])
+        self.assertTrue(np.array_equal(
+            acc.n, valid.T.astype(int) @ valid.astype(int)))
+        cov, corr = acc.covariance(False), acc.correlation()
+        for i in range(4):
+            for j in range(4):
+                both = valid[:, i] & valid[:, j]
+                a, b = x[both, i], x[both, j]
+                self.assertAlmostEqual(cov[i, j], np.cov(a, b)[0, 1])
+                self.assertAlmostEqual(corr[i, j], np.corrcoef(a, b)[0, 1])
+        self.assertListEqual(acc.missing_pairs(), [])
+
+        # pairs without common data
+        x[:, 3] = np.nan
+        x[0, 3] = 1.
+        x[valid[:, 2], 0] = np.nan
+        acc = stats.CovarianceAccumulator(4)
+        acc.add(x)
+        self.assertListEqual(acc.missing_pairs(),
+                             [(0, 2), (0, 3), (1, 3), (2, 3), (3, 3)])
+        self.assertTrue(np.isnan(acc.covariance(False)[0, 2]))
+
+    def test_indexes(self):
+        basic.log_message('===================== TEST INDEXES =============')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'tabular'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t2.dat', opt)
+        com._prebuild()
+        com.caps = ["c{}".format(i) for i in range(7)]
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        dt.indexer.min_rows = 0
+
+        def index_cols():
+            return sorted(dt.indexer._existing().values())
+
+        dt.update()
+        self.assertListEqual(index_cols(), [])
+        dt.ordering = (dt.get_column('c4').id, 'DESC')
+        dt.update()
+        dt.group_by = [dt.get_column('c0').id]
+        dt.update()
+        self.assertListEqual(index_cols(), [])
+        dt.group_by = []
+        dt.update()
+        self.assertListEqual(index_cols(), [('c4', 'id')])
+        self.assertEqual(len(dt.indexer.description()), 1)
+
+        # index is kept after table rebuild
+        cconv = convert.ColumnConverter(dt, dt.get_column('c4'))
+        cconv.new_name = 'c4a'
+        conv = convert.TableConverter(dt)
+        conv.citems = [cconv]
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+        self.assertListEqual(index_cols(), [('c4a', 'id')])
+        flow.undo_prev()
+        dt.update()
+        self.assertListEqual(index_cols(), [('c4', 'id')])
+
+    def test_materialized(self):
+        basic.log_message('================== TEST MATERIALIZED ===========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t1.dat', opt)
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+
+        flow.exec_command(funccol.NumFunctionColumn(
+            dt, 's1', ['x_int', 'y_real'], 'sum', True, False))
+        flow.exec_command(funccol.NumFunctionColumn(
+            dt, 's2', ['x_int', 'y_real'], 'sum', True, True))
+        flow.exec_command(funccol.MergeCategories(
+            dt, ['tp_01', 'x_int'], '-', False, True))
+        self.assertFalse(dt.get_column('s1').is_materialized())
+        self.assertTrue(dt.get_column('s2').is_materialized())
+        dt.update()
+        self.assertListEqual(tu.get_dtab_column(dt, 's1'),
+                             tu.get_dtab_column(dt, 's2'))
+        self.assertListEqual(tu.get_dtab_column(dt, 'tp_01-x_int'),
+                             ['0-0', '1-1', '1-2', '0-3', '1-4', '0-5'])
+        self.assertEqual(dt.get_column('s2').sql_line(),
+                         '"_mat {}"'.format(dt.get_column('s2').id))
+
+        # grouping
+        flow.exec_command(funccol.GroupCategories(dt, ['tp_01'], 'amean'))
+        dt.update()
+        self.assertListEqual(tu.get_dtab_column(dt, 's1'),
+                             tu.get_dtab_column(dt, 's2'))
+        dt.group_by = []
+
+        # dependency change
+        cconv = convert.ColumnConverter(dt, dt.get_column('x_int'))
+        cconv.new_name = 'x'
+        conv = convert.TableConverter(dt)
+        conv.citems = [cconv]
+        flow.exec_command(convert.ConvertTable(conv))
+        dt.update()
+        self.assertListEqual(tu.get_dtab_column(dt, 's1'),
+                             tu.get_dtab_column(dt, 's2'))
+        self.assertListEqual(tu.get_dtab_column(dt, 'tp_01-x_int'),
+                             ['0-0', '1-1', '1-2', '0-3', '1-4', '0-5'])
+
+        # save/load
+        flow.exec_command(comproj.SaveDBAs(proj, "dbg.db"))
+        flow.exec_command(comproj.LoadDB(proj, "dbg.db"))
+        dt = proj.get_table('t1')
+        dt.update()
+        self.assertTrue(dt.get_column('s2').is_materialized())
+        self.assertListEqual(tu.get_dtab_column(dt, 's1'),
+                             tu.get_dtab_column(dt, 's2'))
+
+        # stored values are dropped on undo and restored on redo
+        flow.exec_command(funccol.NumFunctionColumn(
+            dt, 's3', ['x', 'y_real'], 'max', True, True))
+        dt.update()
+        nm = dt.get_column('s3').sql_delegate.materialized_name()
+        s3 = tu.get_dtab_column(dt, 's3')
+        self.assertIn(nm, dt._ttab_columns())
+        flow.undo_prev()
+        dt.update()
+        self.assertNotIn(nm, dt._ttab_columns())
+        flow.exec_next()
+        dt.update()
+        self.assertIn(nm, dt._ttab_columns())
+        self.assertListEqual(tu.get_dtab_column(dt, 's3'), s3)
+
+        # column names are cached until the table structure changes
+        def sql_columns():
+            dt.query('PRAGMA table_info("{}")'.format(dt.ttab_name))
+            return [x[1] for x in dt.qresults()]
+
+        cols = dt._ttab_columns()
+        dt._compile_query()
+        self.assertIs(dt._ttab_columns(), cols)
+        self.assertListEqual(cols, sql_columns())
+        flow.undo_prev()
+        dt.update()
+        self.assertListEqual(dt._ttab_columns(), sql_columns())
+
+    def test_vectorized_rowfun(self):
+        basic.log_message('================== TEST VECTORIZED =============')
+        rows = [(1, 2, 3), (None, 2.5, -1), (None, None, None),
+                (4, None, 4), (0, 7, 2), (-3.5, None, None)]
+        a = np.array([[np.nan if v is None else v for v in r] for r in rows])
+        for nm, vfun in bsqlproc.vectorized_row_functions.items():
+            fun = getattr(bsqlproc, nm)
+            r1 = [fun(*r) for r in rows]
+            r2 = [None if np.isnan(v) else v for v in vfun(a).tolist()]
+            self.assertListEqual(r1, r2, nm)
+
+        # through the table
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t1.dat', opt)
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        # several chunks per materialization
+        dt.materialize_chunk_size = 2
+        for f in ['average', 'median', 'max', 'min', 'sum', 'product']:
+            flow.exec_command(funccol.NumFunctionColumn(
+                dt, f + '1', ['x_int', 'y_real'], f, True, False))
+            flow.exec_command(funccol.NumFunctionColumn(
+                dt, f + '2', ['x_int', 'y_real'], f, True, True))
+            self.assertTrue(dt.get_column(f + '2').is_materialized())
+            self.assertIsNotNone(
+                dt.get_column(f + '2').sql_delegate.vectorized_function())
+            dt.update()
+            c1 = tu.get_dtab_raw_column(dt, f + '1')
+            c2 = tu.get_dtab_raw_column(dt, f + '2')
+            for v1, v2 in zip(c1, c2):
+                self.assertAlmostEqual(v1, v2)
+
+    def test_native_grouping(self):
+        basic.log_message('================== TEST NATIVE GROUPING ========')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t1.dat', opt)
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+        flow.exec_command(funccol.NumFunctionColumn(
+            dt, 's', ['x_int', 'y_real'], 'sum', True, False))
+
+        native = bsqlproc.native_medians
+        try:
+            for cats in [['tp_01'], 'all']:
+                for m in ['median', 'median+', 'median-']:
+                    flow.exec_command(funccol.GroupCategories(dt, cats, m))
+                    ret = []
+                    for nat in [False, True]:
+                        bsqlproc.native_medians = nat
+                        dt.update()
+                        qr = dt._compile_query()
+                        self.assertEqual('OVER' in qr, nat)
+                        ret.append([tu.get_dtab_column(dt, c)
+                                    for c in ['tp_01', 'x_int', 'y_real',
+                                              's']])
+                    self.assertListEqual(ret[0], ret[1])
+            self.assertListEqual(ret[1][2], [3.33])
+            self.assertListEqual(ret[1][0], [None])
+        finally:
+            bsqlproc.native_medians = native
+        # python medians skip NULL values as native ones do
+        proj.sql.query('SELECT median(column1), medianp(column1), '
+                       'medianm(column1) '
+                       'FROM (VALUES (3), (NULL), (1), (NULL), (2))')
+        self.assertEqual(proj.sql.qresult(), (2, 2, 1))
+
+    def test_regression_columns(self):
+        basic.log_message('================== TEST REGRESSION COLUMNS =====')
+        opt = basic.CustomObject()
+        opt.firstline = 0
+        opt.lastline = -1
+        opt.comment_sign = '#'
+        opt.ignore_blank = True
+        opt.col_sep = 'whitespaces'
+        opt.row_sep = 'newline'
+        opt.colcount = -1
+        opt.read_cap = True
+        opt.tabname = 't1'
+        com = import_tab.ImportTabFromTxt(proj, 'test_db/t1.dat', opt)
+        flow.exec_command(com)
+        dt = proj.get_table('t1')
+
+        def expected(tp, x, y):
+            if tp == 'linear':
+                r = scipy.stats.linregress(x, y)
+                f = r.slope*x + r.intercept
+                return r.slope, r.intercept, f, r.stderr, r.rvalue, y
+            x, y = x[x > 0], y[x > 0]
+            if tp == 'log':
+                r = scipy.stats.linregress(np.log(x), y)
+                f = r.slope*np.log(x) + r.intercept
+                return r.slope, r.intercept, f, r.stderr, r.rvalue, y
+            r = scipy.stats.linregress(np.log(x), np.log(y))
+            f = np.exp(r.intercept)*x**r.slope
+            return r.slope, np.exp(r.intercept), f, r.stderr, r.rvalue, y
+
+        aggregates = {x[0]: x[2]
+                      for x in bsqlproc.registered_aggregate_functions}
+
+        def accumulators_count(tp, qr):
+            """ -> number of regression_tp instances built by qr """
+            nm = 'regression_' + tp
+            created = []
+
+            class Counted(aggregates[nm]):
+                def __init__(self):
+                    super().__init__()
+                    created.append(self)
+
+            proj.sql.connection.create_aggregate(nm, 2, Counted)
+            try:
+                proj.sql.query(qr)
+                proj.sql.qresults()
+            finally:
+                proj.sql.connection.create_aggregate(nm, 2, aggregates[nm])
+            return len(created)
+
+        for tp in ['linear', 'log', 'power']:
+            opts = basic.CustomObject()
+            opts.xcol = 'x_int'
+            opts.ycol = 'y_real'
+            opts.tp = tp
+            opts.out = ['a', 'b', 'stderr', 'slopeerr', 'corrcoef']
+            opts.out_names = [tp + ' ' + x for x in opts.out]
+            c = funccol.NumRegressionColumns(dt, opts)
+            flow.exec_command(c)
+            flow.exec_command(funccol.GroupCategories(dt, ['tp_01'], 'amean'))
+            dt.update()
+            # all five outputs of a group share a single accumulator
+            self.assertEqual(dt.n_rows(), 2)
+            self.assertEqual(accumulators_count(tp, dt._compile_query()), 2)
+
+            x = np.array(tu.get_dtab_raw_column(dt, 'x_int'))
+            ret = [tu.get_dtab_raw_column(dt, x) for x in opts.out_names]
+            flow.exec_command(funccol.GroupCategories(dt, [], 'amean'))
+            dt.update()
+            xall = np.array(tu.get_dtab_raw_column(dt, 'x_int'), dtype=float)
+            yall = np.array(tu.get_dtab_raw_column(dt, 'y_real'))
+            tp01 = np.array(tu.get_dtab_raw_column(dt, 'tp_01'))
+            for i, t in enumerate([0, 1]):
+                a, b, f, slopeerr, r, y = expected(
+                    tp, xall[tp01 == t], yall[tp01 == t])
+                err = np.sqrt(np.mean((f - y)**2))
+                for j, v in enumerate([a, b, err, slopeerr, r]):
+                    self.assertAlmostEqual(ret[j][i], v)
+            self.assertEqual(len(x), 2)
+
 
 if __name__ == '__main__':
     unittest.main()